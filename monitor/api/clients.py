@@ -0,0 +1,158 @@
+import atexit
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import redis
+import requests
+from django.conf import settings
+from psycopg2.pool import ThreadedConnectionPool
+from pymongo import MongoClient
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class ClientRegistry:
+    """Общие на процесс клиенты внешних хранилищ для CheckIdent.
+
+    Каждый клиент создаётся при первом обращении и держит пул соединений,
+    так что запросы не платят за установку соединения. После fork
+    (воркеры gunicorn) клиенты родителя не используются - создаются заново.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._mongo = None
+        self._postgres = None
+        self._redis = None
+        self._http = None
+        self._cache = None
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    def mongo(self):
+        self._check_pid()
+        if self._mongo is None:
+            with self._lock:
+                if self._mongo is None:
+                    timeout_ms = int(settings.IDENT_CHECK_TIMEOUTS['mongo'] * 1000)
+                    self._mongo = MongoClient(
+                        os.getenv('MONGO_URI'),
+                        maxPoolSize=settings.IDENT_CHECK_WORKERS,
+                        serverSelectionTimeoutMS=timeout_ms,
+                        connectTimeoutMS=timeout_ms,
+                        socketTimeoutMS=timeout_ms
+                    )
+        return self._mongo
+
+    def postgres_pool(self):
+        self._check_pid()
+        if self._postgres is None:
+            with self._lock:
+                if self._postgres is None:
+                    self._postgres = ThreadedConnectionPool(
+                        1,
+                        settings.IDENT_CHECK_WORKERS,
+                        os.getenv('POSTGRES_URI'),
+                        connect_timeout=max(int(settings.IDENT_CHECK_TIMEOUTS['postgres']), 1)
+                    )
+        return self._postgres
+
+    @contextmanager
+    def postgres(self):
+        """Соединение из пула; сломанное после ошибки закрывается, а не возвращается"""
+        pool = self.postgres_pool()
+        conn = pool.getconn()
+        if conn.closed:
+            pool.putconn(conn, close=True)
+            conn = pool.getconn()
+        broken = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            broken = True
+            raise
+        finally:
+            if not broken and not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            pool.putconn(conn, close=broken or bool(conn.closed))
+
+    def redis(self):
+        self._check_pid()
+        if self._redis is None:
+            with self._lock:
+                if self._redis is None:
+                    timeout = settings.IDENT_CHECK_TIMEOUTS['redis']
+                    pool = redis.ConnectionPool.from_url(
+                        os.getenv('REDIS_URL'),
+                        decode_responses=True,
+                        socket_timeout=timeout,
+                        socket_connect_timeout=timeout,
+                        health_check_interval=30,
+                        max_connections=settings.IDENT_CHECK_WORKERS
+                    )
+                    self._redis = redis.Redis(connection_pool=pool)
+        return self._redis
+
+    def cache(self):
+        """Локальный Redis приложения - для кэша результатов, не источник данных"""
+        self._check_pid()
+        if self._cache is None:
+            with self._lock:
+                if self._cache is None:
+                    self._cache = redis.Redis.from_url(
+                        settings.LOCAL_REDIS_URL,
+                        socket_timeout=1,
+                        socket_connect_timeout=1
+                    )
+        return self._cache
+
+    def http(self):
+        self._check_pid()
+        if self._http is None:
+            with self._lock:
+                if self._http is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=4,
+                        pool_maxsize=settings.IDENT_CHECK_WORKERS
+                    )
+                    session.mount('http://', adapter)
+                    session.mount('https://', adapter)
+                    self._http = session
+        return self._http
+
+    def close(self):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            for name, closer in (
+                ('mongo', lambda: self._mongo.close()),
+                ('postgres', lambda: self._postgres.closeall()),
+                ('redis', lambda: self._redis.close()),
+                ('http', lambda: self._http.close()),
+                ('cache', lambda: self._cache.close()),
+            ):
+                if getattr(self, f'_{name}') is None:
+                    continue
+                try:
+                    closer()
+                except Exception as e:
+                    logger.warning('clients: failed to close %s: %s', name, e)
+            self._reset()
+
+
+clients = ClientRegistry()
+atexit.register(clients.close)
@@ -0,0 +1,81 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from core.metrics import ident_source_requests, ident_source_seconds
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IDENT_CHECK_WORKERS,
+    thread_name_prefix='ident-check'
+)
+
+SOURCE_OK = 'ok'
+SOURCE_TIMEOUT = 'timeout'
+SOURCE_ERROR = 'error'
+
+
+def run_with_deadlines(calls, default=None):
+    """Запускает источники параллельно, у каждого свой дедлайн.
+
+    calls - словарь {имя: (функция, таймаут в секундах)}. Возвращает
+    (results, sources): результат каждого источника (default, если не
+    успел или упал) и его статус с временем выполнения. Поток, не
+    уложившийся в дедлайн, не ждём - он доработает в пуле сам.
+    """
+    started = time.monotonic()
+    futures = {}
+    deadlines = {}
+    for name, (func, timeout) in calls.items():
+        future = executor.submit(func)
+        futures[future] = name
+        deadlines[future] = started + timeout
+
+    results = {}
+    sources = {}
+    pending = set(futures)
+    while pending:
+        now = time.monotonic()
+        for future in [f for f in pending if deadlines[f] <= now]:
+            pending.discard(future)
+            name = futures[future]
+            logger.warning('ident-check: source %s timed out', name)
+            results[name] = default
+            sources[name] = {
+                'status': SOURCE_TIMEOUT,
+                'elapsed_ms': int((now - started) * 1000),
+            }
+            observe_source(name, SOURCE_TIMEOUT, now - started)
+        if not pending:
+            break
+
+        done, pending = wait(
+            pending,
+            timeout=min(deadlines[f] for f in pending) - now,
+            return_when=FIRST_COMPLETED
+        )
+        elapsed = time.monotonic() - started
+        elapsed_ms = int(elapsed * 1000)
+        for future in done:
+            name = futures[future]
+            try:
+                results[name] = future.result()
+                sources[name] = {'status': SOURCE_OK, 'elapsed_ms': elapsed_ms}
+            except Exception as e:
+                logger.exception('ident-check: source %s failed: %s', name, e)
+                results[name] = default
+                sources[name] = {
+                    'status': SOURCE_ERROR,
+                    'elapsed_ms': elapsed_ms,
+                    'error': str(e),
+                }
+            observe_source(name, sources[name]['status'], elapsed)
+    return results, sources
+
+
+def observe_source(name, source_status, elapsed):
+    ident_source_seconds.observe(elapsed, source=name, status=source_status)
+    ident_source_requests.inc(source=name, status=source_status)
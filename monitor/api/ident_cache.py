@@ -0,0 +1,91 @@
+import hashlib
+import json
+import logging
+import time
+from collections import namedtuple
+from datetime import datetime
+
+import redis
+from django.conf import settings
+
+from api.clients import clients
+
+logger = logging.getLogger(__name__)
+
+CachedResult = namedtuple('CachedResult', ('value', 'cached_at', 'hit'))
+
+LOCK_POLL_INTERVAL = 0.05
+
+
+def cache_key(source, *parts):
+    digest = hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+    return f'identcheck:{source}:{digest}'
+
+
+def align_to_bucket(moment, bucket=None):
+    """Округляет момент вверх до границы бакета, чтобы соседние запросы совпали по ключу"""
+    bucket = bucket or settings.IDENT_CACHE_BUCKET
+    timestamp = moment.timestamp()
+    aligned = -(-timestamp // bucket) * bucket
+    return datetime.fromtimestamp(aligned, tz=moment.tzinfo)
+
+
+def _safe(call, default=None):
+    try:
+        return call()
+    except redis.RedisError as e:
+        logger.warning('ident cache unavailable: %s', e)
+        return default
+
+
+def _load(r, key):
+    raw = _safe(lambda: r.get(key))
+    if not raw:
+        return None
+    payload = json.loads(raw)
+    return CachedResult(payload['value'], payload['cached_at'], True)
+
+
+def cached_call(source, key_parts, func, wait_timeout):
+    """Результат func из кэша, а при промахе - вычисленный одним запросом.
+
+    Пока один поток заполняет ключ, остальные ждут его результата до
+    wait_timeout секунд вместо повторного похода в источник. Исключения
+    func не кэшируются и пробрасываются вызывающему.
+    """
+    ttl = settings.IDENT_CACHE_TTLS.get(source)
+    if not ttl:
+        return CachedResult(func(), None, False)
+
+    r = clients.cache()
+    key = cache_key(source, *key_parts)
+    cached = _load(r, key)
+    if cached is not None:
+        return cached
+
+    lock_key = f'{key}:lock'
+    deadline = time.monotonic() + wait_timeout
+    while True:
+        locked = _safe(
+            lambda: r.set(lock_key, 1, nx=True, px=int(wait_timeout * 1000)),
+            default=True
+        )
+        if locked or time.monotonic() >= deadline:
+            break
+        time.sleep(LOCK_POLL_INTERVAL)
+        cached = _load(r, key)
+        if cached is not None:
+            return cached
+
+    try:
+        value = func()
+        cached_at = datetime.now().isoformat()
+        _safe(lambda: r.set(
+            key,
+            json.dumps({'cached_at': cached_at, 'value': value}, default=str),
+            ex=ttl
+        ))
+        return CachedResult(value, cached_at, False)
+    finally:
+        if locked:
+            _safe(lambda: r.delete(lock_key))
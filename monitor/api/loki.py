@@ -0,0 +1,141 @@
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+from api.clients import clients
+
+logger = logging.getLogger(__name__)
+
+NS_IN_SECOND = 1_000_000_000
+
+
+def to_ns(moment):
+    return int(moment.timestamp() * NS_IN_SECOND)
+
+
+def escape_string(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+def build_query(app_name, ident):
+    return f'{{app="{app_name}"}} |= "{escape_string(ident)}"'
+
+
+def build_regex_query(app_name, idents):
+    """Один фильтр на несколько idents: строки, где встречается любой из них"""
+    pattern = '|'.join(re.escape(str(ident)) for ident in idents)
+    return f'{{app="{app_name}"}} |~ "(?:{escape_string(pattern)})"'
+
+
+def format_entry(stream_labels, value):
+    timestamp_ns = int(value[0])
+    timestamp = datetime.fromtimestamp(timestamp_ns / NS_IN_SECOND)
+    return {
+        'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+        'timestamp_iso': timestamp.isoformat(),
+        'timestamp_ns': str(timestamp_ns),
+        'message': value[1],
+        'pod': stream_labels.get('pod', ''),
+        'app': stream_labels.get('app', ''),
+        'namespace': stream_labels.get('namespace', '')
+    }
+
+
+def entry_key(entry):
+    """Короткий идентификатор записи: по нему отбрасываются уже отданные записи
+    с той же наносекундой на границе страниц"""
+    raw = '\0'.join((
+        entry['timestamp_ns'], entry['app'], entry['namespace'], entry['pod'], entry['message']
+    ))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]
+
+
+def encode_cursor(timestamp_ns, keys):
+    """Курсор продолжения: время последней отданной записи и ключи записей,
+    уже отданных с этим временем"""
+    if not keys:
+        return str(timestamp_ns)
+    return f"{timestamp_ns}:{'.'.join(sorted(keys))}"
+
+
+def decode_cursor(cursor):
+    """(end_ns, seen) для iter_log_pages; курсор без ключей - прежний формат,
+    end невключительный"""
+    timestamp, _, keys = cursor.partition(':')
+    timestamp_ns = int(timestamp)
+    if not keys:
+        return timestamp_ns, set()
+    return timestamp_ns + 1, set(keys.split('.'))
+
+
+def query_range(query, start_ns, end_ns, limit, timeout, direction='backward'):
+    """Одна страница query_range: записи всех потоков, от новых к старым"""
+    response = clients.http().get(
+        f'{os.getenv("LOKI_URL")}/loki/api/v1/query_range',
+        params={
+            'query': query,
+            'limit': limit,
+            'start': start_ns,
+            'end': end_ns,
+            'direction': direction
+        },
+        timeout=timeout
+    )
+    response.raise_for_status()
+    entries = []
+    for result in response.json().get('data', {}).get('result', []):
+        stream_labels = result.get('stream', {})
+        for value in result.get('values', []):
+            entries.append(format_entry(stream_labels, value))
+    # Внутри одной наносекунды порядок не зависит от порядка потоков в ответе
+    entries.sort(key=lambda entry: (
+        -int(entry['timestamp_ns']), entry['app'], entry['namespace'], entry['pod'], entry['message']
+    ))
+    return entries
+
+
+def iter_log_pages(query, start_ns, end_ns, page_size=None, window=None, timeout=None, seen=None):
+    """Листает Loki от end_ns (невключительно) к start_ns и отдаёт страницы записей.
+
+    Диапазон режется на окна по window, внутри окна - страницы по
+    page_size записей. Следующая страница запрашивается с end на
+    наносекунду позже самой старой записи: Loki считает end
+    невключительным, и иначе записи других потоков с тем же временем
+    потерялись бы. Уже отданные записи этой наносекунды отбрасываются по
+    entry_key; seen - такие ключи из курсора предыдущего запроса.
+    В памяти держится только текущая страница.
+    """
+    page_size = page_size or settings.LOKI_PAGE_SIZE
+    window_ns = int((window or timedelta(hours=settings.LOKI_WINDOW_HOURS)).total_seconds() * NS_IN_SECOND)
+    timeout = timeout or settings.IDENT_CHECK_TIMEOUTS['loki']
+    seen = set(seen or ())
+
+    window_end = end_ns
+    while window_end > start_ns:
+        window_start = max(start_ns, window_end - window_ns)
+        cursor = window_end
+        while cursor > window_start:
+            page = query_range(query, window_start, cursor, page_size, timeout)
+            fresh = [entry for entry in page if entry_key(entry) not in seen]
+            if fresh:
+                yield fresh
+            if len(page) < page_size:
+                break
+            oldest = int(page[-1]['timestamp_ns'])
+            at_oldest = {entry_key(entry) for entry in page if int(entry['timestamp_ns']) == oldest}
+            if oldest + 1 == cursor:
+                if not fresh:
+                    # В одной наносекунде записей больше страницы - дальше не продвинуться
+                    logger.warning('Loki: more than %s entries at %s, skipping the rest', page_size, oldest)
+                    cursor, seen = oldest, set()
+                    continue
+                seen |= at_oldest
+            else:
+                seen = at_oldest
+            cursor = oldest + 1
+        window_end = window_start
+        seen = set()
@@ -0,0 +1,105 @@
+import logging
+import threading
+from collections import namedtuple
+
+import pymongo
+from django.conf import settings
+
+from api.clients import clients
+
+logger = logging.getLogger(__name__)
+
+DATABASE = 'db'
+COLLECTION = 'messages'
+# Поля, по которым ищем и сортируем - без них запрос не выполнить
+REQUIRED_FIELDS = ('ident', 'timestamp')
+
+QueryProfile = namedtuple('QueryProfile', ('projection', 'hint', 'batch_size'))
+
+_index_lock = threading.Lock()
+_index_checked = False
+_index_name = None
+
+
+def get_collection():
+    return clients.mongo()[DATABASE][COLLECTION]
+
+
+def find_ident_index(collection=None):
+    """Имя индекса, начинающегося с (ident, timestamp), или None"""
+    collection = collection if collection is not None else get_collection()
+    for name, info in collection.index_information().items():
+        fields = [field for field, _ in info['key']]
+        if fields[:2] == list(REQUIRED_FIELDS):
+            return name
+    return None
+
+
+def check_index():
+    """Проверяет индекс один раз на процесс; без индекса запросы идут без hint"""
+    global _index_checked, _index_name
+    if _index_checked:
+        return _index_name
+    with _index_lock:
+        if not _index_checked:
+            try:
+                _index_name = find_ident_index()
+            except pymongo.errors.PyMongoError as e:
+                # Монго недоступен - проверим при следующем запросе
+                logger.warning('mongo: index check failed: %s', e)
+                return None
+            if _index_name is None:
+                logger.warning(
+                    'mongo: no index on (ident, timestamp) in %s.%s, '
+                    'ident queries will scan the collection', DATABASE, COLLECTION
+                )
+            _index_checked = True
+    return _index_name
+
+
+def get_profile():
+    """Профиль запроса: проекция из настроек и hint, если индекс есть"""
+    projection = None
+    if settings.IDENT_MONGO_PROJECTION:
+        projection = dict.fromkeys(REQUIRED_FIELDS + tuple(settings.IDENT_MONGO_PROJECTION), 1)
+    return QueryProfile(projection, check_index(), settings.IDENT_MONGO_BATCH_SIZE)
+
+
+def ident_filter(idents, start_time, end_time):
+    return {
+        'ident': {'$in': list(idents)} if isinstance(idents, (list, tuple, set)) else idents,
+        'timestamp': {
+            '$gte': int(start_time.timestamp()),
+            '$lte': int(end_time.timestamp())
+        }
+    }
+
+
+def find_history(ident, start_time, end_time, limit=0, profile=None):
+    """Курсор по документам ident от новых к старым, порциями batch_size"""
+    profile = profile or get_profile()
+    cursor = get_collection().find(
+        ident_filter(ident, start_time, end_time), profile.projection
+    ).sort('timestamp', -1).batch_size(profile.batch_size)
+    if profile.hint:
+        cursor = cursor.hint(profile.hint)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+def latest_per_ident(idents, start_time, end_time, profile=None):
+    """Последний документ каждого ident одной агрегацией"""
+    profile = profile or get_profile()
+    pipeline = [
+        {'$match': ident_filter(idents, start_time, end_time)},
+        {'$sort': {'timestamp': -1}},
+    ]
+    if profile.projection:
+        pipeline.append({'$project': profile.projection})
+    pipeline.append({'$group': {'_id': '$ident', 'doc': {'$first': '$$ROOT'}}})
+
+    options = {'batchSize': profile.batch_size}
+    if profile.hint:
+        options['hint'] = profile.hint
+    return get_collection().aggregate(pipeline, **options)
@@ -0,0 +1,19 @@
+from rest_framework.pagination import CursorPagination
+
+
+class BacklogCursorPagination(CursorPagination):
+    """Курсорная пагинация бэклога.
+
+    Включается, только если клиент передал cursor или page_size: без них
+    список отдаётся целиком, как раньше, чтобы не сломать текущий фронтенд.
+    """
+    ordering = 'id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
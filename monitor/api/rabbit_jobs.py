@@ -0,0 +1,92 @@
+"""Фоновые публикации в RabbitMQ через API.
+
+Большая или долгая (из-за rate) публикация не держит запрос: она идёт в
+отдельном пуле потоков, а состояние со счётчиками лежит в локальном
+Redis MESSAGES_CODE_RABBIT_JOB_TTL секунд - его отдаёт
+GET rabbit/publish/<id>/.
+"""
+import json
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils import timezone
+
+from api.clients import clients
+from core.constants import (
+    JOB_STATUS_FAILED,
+    JOB_STATUS_QUEUED,
+    JOB_STATUS_RUNNING,
+    JOB_STATUS_SUCCEEDED,
+)
+from messages_code.artifacts import ArtifactError
+from messages_code.executor import broker_config
+from messages_code.publisher import PublishError, get_publisher
+
+logger = logging.getLogger(__name__)
+
+publish_executor = ThreadPoolExecutor(
+    max_workers=settings.MESSAGES_CODE_RABBIT_MAX_CONNECTIONS,
+    thread_name_prefix='rabbit-publish'
+)
+
+
+def _key(publish_id):
+    return f'rabbit_publish:{publish_id}'
+
+
+def _save(publish_id, state):
+    clients.cache().set(
+        _key(publish_id),
+        json.dumps(state, ensure_ascii=False),
+        ex=settings.MESSAGES_CODE_RABBIT_JOB_TTL
+    )
+
+
+def get_publish(publish_id, user_id):
+    """Состояние фоновой публикации; None, если её нет или она чужая"""
+    raw = clients.cache().get(_key(publish_id))
+    if raw is None:
+        return None
+    state = json.loads(raw)
+    if state['user_id'] != user_id:
+        return None
+    return state
+
+
+def _publish(state, messages, routing_key, exchange, options):
+    state.update(status=JOB_STATUS_RUNNING, started_at=timezone.now().isoformat())
+    _save(state['id'], state)
+    try:
+        stats = get_publisher(broker_config()).publish(
+            state['host'], messages, routing_key, exchange, **options
+        )
+    except (ArtifactError, PublishError) as e:
+        logger.warning("rabbit publish %s to %s failed: %s", state['id'], state['host'], e)
+        state.update(status=JOB_STATUS_FAILED, error=str(e))
+    except Exception as e:
+        logger.exception("rabbit publish %s crashed: %s", state['id'], e)
+        state.update(status=JOB_STATUS_FAILED, error=str(e))
+    else:
+        state.update(status=JOB_STATUS_SUCCEEDED, **stats)
+    state['finished_at'] = timezone.now().isoformat()
+    _save(state['id'], state)
+
+
+def start_publish(user_id, host, messages, total, routing_key, exchange, options):
+    """Ставит публикацию в пул потоков и сразу возвращает её состояние"""
+    state = {
+        'id': uuid.uuid4().hex,
+        'user_id': user_id,
+        'host': host,
+        'routing_key': routing_key,
+        'exchange': exchange,
+        'total': total,
+        'status': JOB_STATUS_QUEUED,
+        'error': None,
+        'created_at': timezone.now().isoformat(),
+    }
+    _save(state['id'], state)
+    publish_executor.submit(_publish, dict(state), messages, routing_key, exchange, options)
+    return state
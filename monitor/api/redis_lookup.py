@@ -0,0 +1,55 @@
+import json
+import logging
+
+from api.clients import clients
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Ключей в одном MGET: длинные команды режем, но отправляем одним пайплайном
+MGET_CHUNK_SIZE = 500
+
+
+def loads(data):
+    """JSON из Redis; orjson, если установлен, иначе стандартный json"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def candidate_keys(ident):
+    """Варианты ключей ident в порядке приоритета"""
+    return (f'last_message_{ident}', ident)
+
+
+def mget(keys, r=None):
+    """Значения ключей за один сетевой круг, независимо от их количества"""
+    r = r or clients.redis()
+    if len(keys) <= MGET_CHUNK_SIZE:
+        return r.mget(keys)
+    with r.pipeline(transaction=False) as pipe:
+        for i in range(0, len(keys), MGET_CHUNK_SIZE):
+            pipe.mget(keys[i:i + MGET_CHUNK_SIZE])
+        return [value for chunk in pipe.execute() for value in chunk]
+
+
+def lookup_last_messages(idents, r=None):
+    """Последние сообщения idents: {ident: (ключ, данные)} для найденных"""
+    keys = [key for ident in idents for key in candidate_keys(ident)]
+    values = dict(zip(keys, mget(keys, r)))
+
+    found = {}
+    for ident in idents:
+        for key in candidate_keys(ident):
+            data = values.get(key)
+            if not data:
+                continue
+            data_dict = loads(data)
+            if data_dict:
+                found[ident] = (key, data_dict)
+                break
+    return found
@@ -0,0 +1,113 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, modify_settings, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.mongo import ident_filter
+from backlog.models import Backlog, Comment, Group, Tag
+from core.constants import HOST_STATE_AVAILABLE
+from core.models import HostJob, HostStatusSample, SSHHost
+from core.query_budget import QueryBudgetExceeded, query_budget
+from messages_code.models import MessagesCode
+
+User = get_user_model()
+
+# Строк каждого вида больше одной, чтобы N+1 превысил бюджет
+ROWS = 3
+
+
+class QueryBudgetTests(TestCase):
+    """Число запросов к БД у эндпоинтов из QUERY_BUDGETS, включая JWT-аутентификацию"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='budget', email='budget@x.io', password='p')
+        group = Group.objects.create(name='g')
+        tags = [Tag.objects.create(name=f't{i}', color='Red') for i in range(ROWS)]
+        for i in range(ROWS):
+            backlog = Backlog.objects.create(
+                theme=f'task {i}', status='Create', text='text', author=cls.user, groups=group
+            )
+            backlog.tags.set(tags)
+            for _ in range(ROWS):
+                Comment.objects.create(author=cls.user, text='comment', backlog=backlog)
+            MessagesCode.objects.create(name=f'code {i}', user=cls.user, code='print(1)')
+        cls.backlog = backlog
+        cls.code = MessagesCode.objects.filter(user=cls.user).first()
+
+        now = timezone.now()
+        for i in range(ROWS):
+            host = SSHHost.objects.create(
+                name=f'h{i}', host=f'10.0.0.{i}', docker_base='base', docker_prod='prod'
+            )
+            HostJob.objects.create(host=host, action='fast_pull', created_by=cls.user)
+            HostStatusSample.objects.create(
+                host=host,
+                state=HOST_STATE_AVAILABLE,
+                started_at=now - timedelta(hours=i + 1),
+                ended_at=now - timedelta(hours=i),
+            )
+        cls.host = host
+
+    def setUp(self):
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+
+    def assert_budget(self, name, *args):
+        key = f'GET api:{name}'
+        with query_budget(settings.QUERY_BUDGETS[key], key):
+            response = self.client.get(reverse(f'api:{name}', args=args))
+        self.assertEqual(response.status_code, 200, response.content)
+
+    def test_backlog_list(self):
+        self.assert_budget('backlog-list')
+
+    def test_backlog_detail(self):
+        self.assert_budget('backlog-detail', self.backlog.pk)
+
+    def test_comments_list(self):
+        self.assert_budget('comments-list', self.backlog.pk)
+
+    def test_messagecode_list(self):
+        self.assert_budget('messagecode-list')
+
+    def test_messagecode_detail(self):
+        self.assert_budget('messagecode-detail', self.code.pk)
+
+    def test_host_list(self):
+        self.assert_budget('host-list-api')
+
+    def test_host_job_list(self):
+        self.assert_budget('host-job-list', self.host.pk)
+
+    def test_host_status_history(self):
+        self.assert_budget('host-status-history', self.host.pk)
+
+    @override_settings(QUERY_BUDGET_STRICT=True, QUERY_BUDGETS={'GET api:backlog-list': 1})
+    @modify_settings(MIDDLEWARE={'append': 'core.query_budget.QueryBudgetMiddleware'})
+    def test_middleware_raises_when_strict(self):
+        with self.assertRaises(QueryBudgetExceeded), self.assertLogs('django.request', 'ERROR'):
+            self.client.get(reverse('api:backlog-list'))
+
+    @override_settings(QUERY_BUDGET_STRICT=False, QUERY_BUDGETS={'GET api:backlog-list': 1})
+    @modify_settings(MIDDLEWARE={'append': 'core.query_budget.QueryBudgetMiddleware'})
+    def test_middleware_logs_when_not_strict(self):
+        with self.assertLogs('core.query_budget', 'WARNING'):
+            response = self.client.get(reverse('api:backlog-list'))
+        self.assertEqual(response.status_code, 200)
+
+
+class IdentCheckValidationTests(SimpleTestCase):
+    def test_non_string_ident_is_rejected(self):
+        response = self.client.post(reverse('api:ident-check'), {'ident': 42}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'ident должен быть строкой'})
+
+    def test_ident_filter(self):
+        now = timezone.now()
+        self.assertEqual(ident_filter('a', now, now)['ident'], 'a')
+        self.assertEqual(ident_filter(42, now, now)['ident'], 42)
+        self.assertEqual(ident_filter(('a', 'b'), now, now)['ident'], {'$in': ['a', 'b']})
@@ -7,10 +7,21 @@ from api.views import (
     CheckIdent,
     CsrfTokenView,
     GitlabWebhookView,
+    HostJobDetailAPIView,
+    HostJobListCreateAPIView,
+    HostStatusHistoryAPIView,
+    LokiLogSearchView,
+    MessagesCodeExecuteView,
+    MessagesCodeRunCancelAPIView,
     RegistrationAPIView,
+    MessagesCodeRunDetailAPIView,
     MessagesCodeViewSet,
+    MongoHistoryView,
+    RabbitPublishDetailView,
+    RabbitPublishView,
     SSHHostListAPIView,
     SSHHostDetailAPIView,
+    SSHHostStatusSweepView,
     GroupViewSet,
     TagViewSet,
     current_user
@@ -33,8 +44,27 @@ app_name = 'api'
 urlpatterns = [
     path('hosts/', SSHHostListAPIView.as_view(), name='host-list-api'),
     path('hosts/<int:pk>/', SSHHostDetailAPIView.as_view(), name='host-detail-api'),
+    path('hosts/status/', SSHHostStatusSweepView.as_view(), name='host-status-sweep'),
+    path('hosts/<int:pk>/jobs/', HostJobListCreateAPIView.as_view(), name='host-job-list'),
+    path('hosts/<int:pk>/history/', HostStatusHistoryAPIView.as_view(), name='host-status-history'),
+    path('jobs/<int:pk>/', HostJobDetailAPIView.as_view(), name='host-job-detail'),
+    path('messagecode/<int:pk>/execute/', MessagesCodeExecuteView.as_view(), name='messagecode-execute'),
+    path('messagecode-runs/<int:pk>/', MessagesCodeRunDetailAPIView.as_view(), name='messagecode-run-detail'),
+    path(
+        'messagecode-runs/<int:pk>/cancel/',
+        MessagesCodeRunCancelAPIView.as_view(),
+        name='messagecode-run-cancel'
+    ),
+    path('rabbit/publish/', RabbitPublishView.as_view(), name='rabbit-publish'),
+    path(
+        'rabbit/publish/<str:publish_id>/',
+        RabbitPublishDetailView.as_view(),
+        name='rabbit-publish-detail'
+    ),
     path('gitlab/hosts/commit/', GitlabWebhookView.as_view(), name='gitlab-commit'),
     path('ident-check/', CheckIdent.as_view(), name='ident-check'),
+    path('ident-check/logs/', LokiLogSearchView.as_view(), name='ident-check-logs'),
+    path('ident-check/mongo/', MongoHistoryView.as_view(), name='ident-check-mongo'),
     path('auth/login/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('auth/csrf/', CsrfTokenView.as_view(), name='csrf-token'),
     path('auth/registration/', RegistrationAPIView.as_view(), name='api-registration'),
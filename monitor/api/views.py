@@ -1,32 +1,64 @@
-import builtins
 import json
 import logging
 import os
-import psycopg2
+import pymongo
 import redis
-import requests
-import time
 from datetime import datetime, timedelta
+from functools import partial
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Prefetch
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_datetime
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.utils.decorators import method_decorator
+from django.views import View
 from psycopg2.extras import RealDictCursor
-from pymongo import MongoClient
 from rest_framework import generics, mixins, serializers, status, viewsets
 from rest_framework.decorators import action, api_view, permission_classes
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import APIException, NotAuthenticated, ParseError, ValidationError
 from rest_framework.parsers import MultiPartParser, JSONParser
-from rest_framework.permissions import AllowAny, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import AllowAny, IsAuthenticated, IsAuthenticatedOrReadOnly
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
 
+from api import loki, mongo, rabbit_jobs, redis_lookup
+from api.clients import clients
+from api.fanout import run_with_deadlines
+from api.ident_cache import align_to_bucket, cached_call
+from api.pagination import BacklogCursorPagination
 from backlog.models import Backlog, BacklogAttachment, Comment, CommentAttachment, Group, Tag
-from backlog.serializers import BacklogSerializer, CommentSerializer, GroupSerializer, TagSerializer
-from core.models import SSHHost
-from core.serializers import SSHHostSerializer
-from messages_code.models import MessagesCode
-from messages_code.serializers import MessagesCodeSerializer, MessagesCodeListSerializer
+from backlog.serializers import (
+    BacklogListSerializer,
+    BacklogSerializer,
+    CommentSerializer,
+    GroupSerializer,
+    TagSerializer,
+)
+from core.constants import JOB_STATUS_SUCCEEDED
+from core.host_cache import invalidate_host
+from core import metrics as core_metrics
+from core.jobs import enqueue_job
+from core.models import HostJob, HostStatusSample, SSHHost
+from core.serializers import HostJobSerializer, HostStatusSampleSerializer, SSHHostSerializer
+from core.sweep import sweep_hosts
+from messages_code.artifacts import ArtifactError, ArtifactStore
+from messages_code.executor import SandboxBusy, broker_config
+from messages_code.models import MessagesCode, MessagesCodeRun
+from messages_code.publisher import PublishError, get_publisher
+from messages_code.runs import aexecute_run, cancel_run, start_run
+from messages_code.sandbox import KIND_INPUT, KIND_OUTPUT
+from messages_code.serializers import (
+    MessagesCodeListSerializer,
+    MessagesCodeRunSerializer,
+    MessagesCodeSerializer,
+    RabbitPublishSerializer,
+)
 from users.serializers import UserRegistrationSerializer, UserSerializer
 
 logger = logging.getLogger(__name__)
@@ -39,10 +71,62 @@ def current_user(request):
     return Response(serializer.data)
 
 
+def metrics(request):
+    """Метрики процесса в текстовом формате Prometheus.
+
+    Если задан METRICS_TOKEN, запрос должен прийти с Authorization: Bearer <токен>;
+    без токена метрики видны только адресам из METRICS_ALLOWED_IPS, остальным - 404.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        if not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    elif request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+    return HttpResponse(core_metrics.registry.render(), content_type=core_metrics.CONTENT_TYPE)
+
+
 class BacklogViewSet(viewsets.ModelViewSet):
-    queryset = Backlog.objects.all()
     serializer_class = BacklogSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = BacklogCursorPagination
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return BacklogListSerializer
+        return BacklogSerializer
+
+    def get_queryset(self):
+        queryset = Backlog.objects.select_related('author')
+        if self.action == 'list':
+            queryset = queryset.prefetch_related('tags').annotate(
+                comments_count=Count('comments', distinct=True)
+            )
+            return self.filter_queryset_by_params(queryset)
+        return queryset.prefetch_related(
+            'tags',
+            'attachments',
+            Prefetch(
+                'comments',
+                queryset=Comment.objects.select_related('author').prefetch_related('attachments')
+            )
+        )
+
+    def filter_queryset_by_params(self, queryset):
+        """Фильтры списка: ?status=, ?group=, ?tag= (можно через запятую)"""
+        params = self.request.query_params
+        try:
+            if params.get('status'):
+                queryset = queryset.filter(status__in=params['status'].split(','))
+            if params.get('group'):
+                queryset = queryset.filter(groups_id__in=[int(pk) for pk in params['group'].split(',')])
+            if params.get('tag'):
+                queryset = queryset.filter(
+                    tags__id__in=[int(pk) for pk in params['tag'].split(',')]
+                ).distinct()
+        except ValueError:
+            raise ValidationError({'error': 'group и tag должны быть числами'})
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
@@ -114,7 +198,9 @@ class CommentViewSet(mixins.CreateModelMixin,
     parser_classes = [MultiPartParser, JSONParser]
 
     def get_queryset(self):
-        return Comment.objects.filter(backlog_id=self.kwargs['backlog_id'])
+        return Comment.objects.filter(
+            backlog_id=self.kwargs['backlog_id']
+        ).select_related('author').prefetch_related('attachments')
 
     def perform_create(self, serializer):
         backlog_id = self.kwargs.get('backlog_id')
@@ -161,6 +247,77 @@ class SSHHostDetailAPIView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticatedOrReadOnly]
 
 
+class SSHHostStatusSweepView(APIView):
+    """Статусы docker compose всех хостов потоком NDJSON, по мере ответа хостов.
+    Каждый запрос - SSH-команды на все хосты, поэтому только для авторизованных.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        async def stream():
+            async for result in sweep_hosts():
+                yield json.dumps(result, ensure_ascii=False) + '\n'
+
+        return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+
+
+class HostJobListCreateAPIView(generics.ListCreateAPIView):
+    """Последние задачи сервера; POST ставит действие в очередь"""
+    serializer_class = HostJobSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def get_queryset(self):
+        return HostJob.objects.filter(
+            host_id=self.kwargs['pk']
+        ).select_related('created_by')[:50]
+
+    def create(self, request, *args, **kwargs):
+        host = get_object_or_404(SSHHost, pk=self.kwargs['pk'])
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = enqueue_job(host.pk, serializer.validated_data['action'], request.user)
+        return Response(self.get_serializer(job).data, status=status.HTTP_201_CREATED)
+
+
+class HostJobDetailAPIView(generics.RetrieveAPIView):
+    queryset = HostJob.objects.select_related('created_by')
+    serializer_class = HostJobSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+
+class HostStatusHistoryAPIView(generics.ListAPIView):
+    """История статусов сервера: отрезки, пересекающие [start, end]"""
+    serializer_class = HostStatusSampleSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def get_queryset(self):
+        params = self.request.query_params
+        try:
+            end_time = parse_datetime(params['end']) if params.get('end') else timezone.now()
+            start_time = (
+                parse_datetime(params['start']) if params.get('start')
+                else end_time - timedelta(days=1)
+            )
+        except ValueError as e:
+            raise ValidationError({'error': f'Некорректные параметры: {str(e)}'})
+        if start_time is None or end_time is None:
+            raise ValidationError({'error': 'start и end должны быть в формате ISO 8601'})
+        # Время без смещения считаем заданным в часовом поясе сервера
+        if timezone.is_naive(start_time):
+            start_time = timezone.make_aware(start_time)
+        if timezone.is_naive(end_time):
+            end_time = timezone.make_aware(end_time)
+        if end_time - start_time > timedelta(days=settings.HOST_HISTORY_MAX_RANGE_DAYS):
+            raise ValidationError(
+                {'error': f'Диапазон не больше {settings.HOST_HISTORY_MAX_RANGE_DAYS} дней'}
+            )
+        return HostStatusSample.objects.filter(
+            host_id=self.kwargs['pk'],
+            started_at__lte=end_time,
+            ended_at__gte=start_time
+        ).order_by('started_at')
+
+
 class GitlabWebhookView(APIView):
     authentication_classes = []
     permission_classes = [AllowAny]
@@ -182,6 +339,8 @@ class GitlabWebhookView(APIView):
             last_commit=commit_time,
             commit=commit_sha
         )
+        # update() не шлёт post_save, поэтому сбрасываем кэш хостов явно
+        invalidate_host()
         return Response({'status': 'received'})
 
 
@@ -236,7 +395,7 @@ class MessagesCodeViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         logger.debug(f"Getting queryset for user: {self.request.user}")
         if self.request.user.is_authenticated:
-            return MessagesCode.objects.filter(user=self.request.user)
+            return MessagesCode.objects.filter(user=self.request.user).select_related('user')
         logger.warning("Anonymous user access attempt")
         return MessagesCode.objects.none()
 
@@ -258,54 +417,46 @@ class MessagesCodeViewSet(viewsets.ModelViewSet):
 
         return Response({'status': 'success', 'variables': code.variables})
 
-    @action(detail=True, methods=['post'], url_path='execute')
-    def execute(self, request, pk=None):
-        code_obj = self.get_object()
-
+    @staticmethod
+    def build_context(code_obj, data):
+        """Параметры запуска скрипта из кода и тела запроса"""
         # Для input-кодов
         if code_obj.name.startswith('input'):
             if 'template_message' not in code_obj.variables:
                 raise ValidationError({"variables": "Необходим ключ 'template_message' в variables"})
 
-            execution_globals = {
-                'template_message': code_obj.variables['template_message'].copy(),
+            context = {
+                'kind': KIND_INPUT,
+                'template_message': code_obj.variables['template_message'],
                 'code_name': code_obj.name,
-                '__builtins__': {
-                    'print': print, 'range': range, 'int': int, 'float': float, 'str': str,
-                    'bool': bool, 'globals': globals, 'round': round, 'IOError': IOError, 'open': open,
-                    '__import__': __import__,
-                }
+                'artifact_namespace': code_obj.user_id,
             }
         # Для output-кодов (10messages)
         elif code_obj.name.startswith('10messages'):
             try:
-                variables = request.data.get('variables', {})
+                variables = data.get('variables', {})
 
-                host_id = request.data.get('host_id')
+                host_id = data.get('host_id')
                 if not host_id:
                     raise ValidationError({"host": "Не указан хост для подключения"})
                 host_obj = SSHHost.objects.filter(id=host_id).first()
                 if not host_obj:
                     raise ValidationError({"host": "Host с таким id не найден"})
 
-                input_code = request.data.get('input_code_id')
+                input_code = data.get('input_code_id')
                 if not input_code:
                     raise ValidationError({"input": "Не указан input-файл для обработки"})
-                input_file = f"{MessagesCode.objects.get(id=input_code).name}.json"
+                input_name = MessagesCode.objects.get(id=input_code).name
 
-                execution_globals = {
+                context = {
+                    'kind': KIND_OUTPUT,
                     'rabbit_host': host_obj.host,
-                    'input_file': input_file,
+                    'input_file': f"{input_name}.json",
+                    # input-код пишет артефакт под своим именем: artifacts.writer(code_name)
+                    'input_artifact': input_name,
                     'variables': variables,
                     'code_name': code_obj.name,
-                    '__builtins__': {
-                        'print': print, 'range': range, 'int': int, 'float': float, 'str': str,
-                        'bool': bool, 'globals': globals, 'round': round, 'IOError': IOError, 'open': open,
-                        '__import__': __import__,
-                        'json': json, 'time': time, '__build_class__': builtins.__build_class__,
-                        '__name__': '__main__', 'property': property, 'ValueError': ValueError,
-                        'FileNotFoundError': FileNotFoundError,
-                    }
+                    'artifact_namespace': code_obj.user_id,
                 }
             except ValidationError as e:
                 print("ValidationError:", e.detail)
@@ -315,19 +466,169 @@ class MessagesCodeViewSet(viewsets.ModelViewSet):
                 raise ValidationError({"execution": str(e)})
         else:
             raise ValidationError({"code": "Неизвестный тип кода"})
+        return context
+
+    @action(detail=True, methods=['get', 'post'], url_path='runs')
+    def runs(self, request, pk=None):
+        """GET - история запусков кода; POST - асинхронный запуск.
 
+        POST сразу отвечает 202 с id запуска, вывод и прогресс приходят
+        в сокет ws/messagecode/runs/<id>/.
+        """
+        code_obj = self.get_object()
+        if request.method == 'GET':
+            runs = MessagesCodeRun.objects.filter(code=code_obj).select_related('user')[
+                :settings.MESSAGES_CODE_RUN_HISTORY
+            ]
+            return Response(MessagesCodeRunSerializer(runs, many=True).data)
+
+        context = self.build_context(code_obj, request.data)
+        run = start_run(code_obj, context, request.user)
+        return Response(MessagesCodeRunSerializer(run).data, status=status.HTTP_202_ACCEPTED)
+
+
+class MessagesCodeExecuteView(View):
+    """POST messagecode/<id>/execute/: ответ приходит после завершения скрипта.
+
+    Асинхронное представление: скрипт идёт в run_executor, а запрос ждёт
+    его на event loop и не занимает общий поток синхронных представлений
+    под ASGI. Аутентификация и ошибки - как у DRF, для прогресса и отмены
+    есть runs и сокет запуска.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Как у APIView: JWT из заголовка, сессия и CSRF не используются
+        view.csrf_exempt = True
+        return view
+
+    def create_run(self, request, pk):
+        authenticated = JWTAuthentication().authenticate(request)
+        if authenticated is None:
+            raise NotAuthenticated()
+        user = authenticated[0]
+        code_obj = get_object_or_404(MessagesCode, pk=pk, user=user)
         try:
-            exec(code_obj.code, execution_globals)
-            code_obj.output = "Код выполнен успешно"
-            code_obj.error = None
-        except Exception as e:
-            code_obj.error = f"Ошибка выполнения: {str(e)}"
-            code_obj.output = None
-            code_obj.save()
-            raise ValidationError({"execution": str(e)})
+            data = json.loads(request.body or b'{}')
+        except ValueError as e:
+            raise ParseError(f'JSON parse error - {e}')
+        context = MessagesCodeViewSet.build_context(code_obj, data)
+        return MessagesCodeRun.objects.create(code=code_obj, user=user, context=context).pk
+
+    async def post(self, request, pk):
+        try:
+            run_id = await sync_to_async(self.create_run)(request, pk)
+            # Скрипт выполняется в отдельном процессе пула с лимитами CPU, памяти и времени
+            try:
+                run = await aexecute_run(run_id)
+            except SandboxBusy as e:
+                return JsonResponse({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            if run.status != JOB_STATUS_SUCCEEDED:
+                raise ValidationError({"execution": run.error})
+        except Http404:
+            return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        except APIException as e:
+            detail = e.detail if isinstance(e.detail, (dict, list)) else {'detail': e.detail}
+            return JsonResponse(detail, status=e.status_code, safe=False)
+        return JsonResponse({"status": "success", "output": run.output or "Код выполнен успешно", "run_id": run.pk})
+
+
+class MessagesCodeRunDetailAPIView(generics.RetrieveAPIView):
+    """Запуск кода сообщений: статус и вывод (сохраняется по ходу выполнения)"""
+    serializer_class = MessagesCodeRunSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def get_queryset(self):
+        if not self.request.user.is_authenticated:
+            return MessagesCodeRun.objects.none()
+        return MessagesCodeRun.objects.filter(code__user=self.request.user).select_related('user')
+
+
+class MessagesCodeRunCancelAPIView(APIView):
+    """POST messagecode-runs/<id>/cancel/: отмена запуска в очереди или выполняющегося"""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, pk):
+        run = get_object_or_404(MessagesCodeRun, pk=pk, code__user=request.user)
+        if not cancel_run(run):
+            return Response(
+                {'error': 'Запуск уже завершён или выполняется в другом процессе'},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response({'status': 'cancelling', 'run_id': run.pk}, status=status.HTTP_202_ACCEPTED)
+
+
+class RabbitPublishView(APIView):
+    """Публикация пачки сообщений в RabbitMQ хоста с подтверждениями брокера.
+
+    Источник сообщений - список, артефакт пользователя (см. artifacts.py)
+    или count копий template для нагрузочной проверки. Публикации больше
+    MESSAGES_CODE_RABBIT_SYNC_MAX сообщений или дольше SYNC_SECONDS по
+    расчёту идут в фоне: ответ 202 с id, состояние - GET rabbit/publish/<id>/.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = RabbitPublishSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        host = get_object_or_404(SSHHost, pk=data['host_id'])
+
+        if 'messages' in data:
+            messages = data['messages']
+            total = len(messages)
+        elif 'artifact' in data:
+            store = ArtifactStore(
+                settings.MESSAGES_CODE_ARTIFACT_URL, request.user.pk, settings.MESSAGES_CODE_ARTIFACT_TTL
+            )
+            info = store.info(data['artifact'])
+            if info is None:
+                raise ValidationError({"artifact": "Артефакт не найден"})
+            messages = store.reader(data['artifact'], wait=False)
+            total = info['count']
+        else:
+            messages = (data['template'] for _ in range(data['count']))
+            total = data['count']
+
+        if total > settings.MESSAGES_CODE_RABBIT_REST_MAX:
+            raise ValidationError(f"Не больше {settings.MESSAGES_CODE_RABBIT_REST_MAX} сообщений за запрос")
+        rate = data.get('rate', settings.MESSAGES_CODE_RABBIT_RATE)
+        seconds = total / rate if rate else 0
+        if seconds > settings.MESSAGES_CODE_RABBIT_MAX_SECONDS:
+            raise ValidationError({"rate": (
+                f"При такой скорости публикация займёт {int(seconds)} с, "
+                f"допустимо не больше {settings.MESSAGES_CODE_RABBIT_MAX_SECONDS} с"
+            )})
+
+        options = {name: data[name] for name in ('batch_size', 'rate', 'concurrency') if name in data}
+        if (data['background'] or total > settings.MESSAGES_CODE_RABBIT_SYNC_MAX
+                or seconds > settings.MESSAGES_CODE_RABBIT_SYNC_SECONDS):
+            state = rabbit_jobs.start_publish(
+                request.user.pk, host.host, messages, total, data['routing_key'], data['exchange'], options
+            )
+            return Response(state, status=status.HTTP_202_ACCEPTED)
+        try:
+            stats = get_publisher(broker_config()).publish(
+                host.host, messages, data['routing_key'], data['exchange'], **options
+            )
+        except ArtifactError as e:
+            raise ValidationError({"artifact": str(e)})
+        except PublishError as e:
+            logger.warning("rabbit publish to %s failed: %s", host.host, e)
+            return Response({'error': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
+        return Response({'status': 'success', 'host': host.host, **stats})
 
-        code_obj.save()
-        return Response({"status": "success", "output": code_obj.output})
+
+class RabbitPublishDetailView(APIView):
+    """Состояние фоновой публикации: статус, счётчики и ошибка"""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, publish_id, *args, **kwargs):
+        state = rabbit_jobs.get_publish(publish_id, request.user.pk)
+        if state is None:
+            return Response({'error': 'Публикация не найдена'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(state)
 
 
 class CheckIdent(APIView):
@@ -335,39 +636,60 @@ class CheckIdent(APIView):
     permission_classes = [AllowAny]
 
     def post(self, request, *args, **kwargs):
+        idents = request.data.get('idents')
         ident = request.data.get('ident')
-        if not ident:
+        if not ident and not idents:
             return Response({'error': 'Ident is required'}, status=400)
+        if idents is not None:
+            if not isinstance(idents, list) or not all(isinstance(i, str) and i for i in idents):
+                return Response({'error': 'idents должен быть списком строк'}, status=400)
+            idents = list(dict.fromkeys(idents))
+            if len(idents) > settings.IDENT_BATCH_MAX:
+                return Response(
+                    {'error': f'Не больше {settings.IDENT_BATCH_MAX} idents за запрос'},
+                    status=400
+                )
+        elif not isinstance(ident, str):
+            return Response({'error': 'ident должен быть строкой'}, status=400)
         protocol = request.data.get('protocol')
         time_range = request.data.get('time_range', '1h')
-        custom_start = request.data.get('custom_start')
-        custom_end = request.data.get('custom_end')
 
         try:
-            # Определяем временной диапазон
-            if time_range == 'custom' and custom_start and custom_end:
-                start_time = datetime.fromisoformat(custom_start.replace('Z', '+00:00'))
-                end_time = datetime.fromisoformat(custom_end.replace('Z', '+00:00'))
-            else:
-                hours = self.parse_time_range(time_range)
-                end_time = datetime.now()
-                start_time = end_time - timedelta(hours=hours)
-
-            logs = self.query_loki_logs(ident, protocol, start_time, end_time)
-            mongo_data = self.query_mongodb(ident, start_time, end_time)
-            postgres_data = self.query_postgresql(ident)
-            redis_data = self.query_redis(ident)
+            start_time, end_time = self.resolve_time_range(request.data)
+            if idents is not None:
+                return self.post_batch(idents, protocol, time_range, start_time, end_time)
+
+            timeouts = settings.IDENT_CHECK_TIMEOUTS
+            results, sources = self.run_sources({
+                'logs': (
+                    partial(self.fetch_loki_logs, protocol, ident, start_time, end_time, timeouts['loki']),
+                    timeouts['loki']
+                ),
+                'consumer_data': (
+                    partial(self.fetch_loki_logs, 'consumer', ident, start_time, end_time, timeouts['loki']),
+                    timeouts['loki']
+                ),
+                'mongo_data': (
+                    partial(self.query_mongodb, ident, start_time, end_time, timeouts['mongo']),
+                    timeouts['mongo']
+                ),
+                'postgres_data': (
+                    partial(self.query_postgresql, ident, timeouts['postgres']),
+                    timeouts['postgres']
+                ),
+                'redis_data': (
+                    partial(self.query_redis, ident, timeouts['redis']),
+                    timeouts['redis']
+                ),
+            }, (ident, protocol, start_time.isoformat(), end_time.isoformat()), default=[])
 
             return Response({
                 'success': True,
                 'ident': ident,
                 'protocol': protocol,
                 'time_range': time_range,
-                'logs': logs['protocol'],
-                'consumer_data': logs['consumer'],
-                'mongo_data': mongo_data,
-                'postgres_data': postgres_data,
-                'redis_data': redis_data
+                **results,
+                'sources': sources
             })
         except Exception as e:
             return Response({
@@ -375,7 +697,87 @@ class CheckIdent(APIView):
                 'error': f'Ошибка: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    def parse_time_range(self, time_range):
+    def post_batch(self, idents, protocol, time_range, start_time, end_time):
+        """Пакетный режим: один запрос к каждому источнику на все idents"""
+        timeouts = settings.IDENT_CHECK_TIMEOUTS
+        results, sources = self.run_sources({
+            'logs': (
+                partial(self.fetch_loki_logs_batch, protocol, idents, start_time, end_time, timeouts['loki']),
+                timeouts['loki']
+            ),
+            'consumer_data': (
+                partial(self.fetch_loki_logs_batch, 'consumer', idents, start_time, end_time, timeouts['loki']),
+                timeouts['loki']
+            ),
+            'mongo_data': (
+                partial(self.query_mongodb_batch, idents, start_time, end_time, timeouts['mongo']),
+                timeouts['mongo']
+            ),
+            'postgres_data': (
+                partial(self.query_postgresql_batch, idents, timeouts['postgres']),
+                timeouts['postgres']
+            ),
+            'redis_data': (
+                partial(self.query_redis_batch, idents, timeouts['redis']),
+                timeouts['redis']
+            ),
+        }, (sorted(idents), protocol, start_time.isoformat(), end_time.isoformat()), default={})
+
+        # У Loki ident, не найденный до лимита просмотра, - не "нет записей", а None
+        truncated = {}
+        for name in ('logs', 'consumer_data'):
+            batch = results[name]
+            results[name] = batch.get('found', {})
+            truncated[name] = set(batch.get('truncated', ()))
+            if truncated[name]:
+                sources[name]['truncated_idents'] = sorted(truncated[name])
+
+        return Response({
+            'success': True,
+            'idents': idents,
+            'protocol': protocol,
+            'time_range': time_range,
+            'results': {
+                ident: {
+                    name: None if ident in truncated.get(name, ()) else found.get(ident, [])
+                    for name, found in results.items()
+                }
+                for ident in idents
+            },
+            'sources': sources
+        })
+
+    def run_sources(self, calls, key_parts, default):
+        """Опрашивает источники параллельно (общее время - самый медленный из них) через кэш"""
+        results, sources = run_with_deadlines({
+            name: (partial(cached_call, name, key_parts, func, timeout), timeout)
+            for name, (func, timeout) in calls.items()
+        })
+        for name, result in results.items():
+            if result is None:
+                results[name] = default
+                continue
+            results[name] = result.value
+            sources[name]['cached_at'] = result.cached_at
+            sources[name]['cache'] = 'hit' if result.hit else 'miss'
+        return results, sources
+
+    def resolve_time_range(self, data):
+        time_range = data.get('time_range', '1h')
+        custom_start = data.get('custom_start')
+        custom_end = data.get('custom_end')
+        if time_range == 'custom' and custom_start and custom_end:
+            start_time = datetime.fromisoformat(custom_start.replace('Z', '+00:00'))
+            end_time = datetime.fromisoformat(custom_end.replace('Z', '+00:00'))
+        else:
+            hours = self.parse_time_range(time_range)
+            # Конец окна выравниваем по бакету кэша, иначе ключи не совпадут
+            end_time = align_to_bucket(datetime.now())
+            start_time = end_time - timedelta(hours=hours)
+        return start_time, end_time
+
+    @staticmethod
+    def parse_time_range(time_range):
         """Преобразует строку времени в часы"""
         time_map = {
             '5m': 5/60,
@@ -390,120 +792,105 @@ class CheckIdent(APIView):
         }
         return time_map.get(time_range, 1)
 
-    def query_loki_logs(self, ident, protocol, start_time, end_time):
-        """Поиск в Loki - возвращает логи протокола и консьюмера отдельно"""
-
-        def fetch_logs(app_name):
-            query = f'{{app="{app_name}"}} |= "{ident}"'
-
-            params = {
-                'query': query,
-                'limit': 1,
-                'start': int(start_time.timestamp() * 1_000_000_000),
-                'end': int(end_time.timestamp() * 1_000_000_000),
-                'direction': 'backward'
-            }
-
-            response = requests.get(
-                f'{os.getenv("LOKI_URL")}/loki/api/v1/query_range',
-                params=params,
-                timeout=30
-            )
-
-            response.raise_for_status()
-            data = response.json()
-
-            logs = []
-            for result in data.get('data', {}).get('result', []):
-                stream_labels = result.get('stream', {})
-                for value in result.get('values', []):
-                    timestamp_ns = int(value[0])
-                    timestamp = datetime.fromtimestamp(timestamp_ns / 1_000_000_000)
-
-                    logs.append({
-                        'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
-                        'timestamp_iso': timestamp.isoformat(),
-                        'message': value[1],
-                        'pod': stream_labels.get('pod', ''),
-                        'app': stream_labels.get('app', ''),
-                        'namespace': stream_labels.get('namespace', '')
-                    })
-
-            return logs
-
-        # Получаем логи из двух источников
-        protocol_logs = fetch_logs(protocol)
-        consumer_logs = fetch_logs('consumer')
+    def fetch_loki_logs(self, app_name, ident, start_time, end_time, timeout=30):
+        """Поиск в Loki: последняя запись приложения с ident"""
+        return loki.query_range(
+            loki.build_query(app_name, ident),
+            loki.to_ns(start_time),
+            loki.to_ns(end_time),
+            limit=1,
+            timeout=timeout
+        )
 
+    def fetch_loki_logs_batch(self, app_name, idents, start_time, end_time, timeout=30):
+        """Поиск в Loki одним запросом на все idents: последняя запись для каждого.
+
+        Возвращает {'found': {ident: [запись]}, 'truncated': [...]}: если
+        просмотр упёрся в LOKI_SEARCH_MAX_LINES, ненайденные idents попадают
+        в truncated - их записи могут быть в непросмотренной части.
+        """
+        found = {}
+        scanned = 0
+        truncated = False
+        pages = loki.iter_log_pages(
+            loki.build_regex_query(app_name, idents),
+            loki.to_ns(start_time),
+            loki.to_ns(end_time),
+            timeout=timeout
+        )
+        for page in pages:
+            # Страницы идут от новых к старым, поэтому первое совпадение - последняя запись
+            for entry in page:
+                for ident in idents:
+                    if ident not in found and ident in entry['message']:
+                        found[ident] = [entry]
+            scanned += len(page)
+            if len(found) == len(idents):
+                break
+            if scanned >= settings.LOKI_SEARCH_MAX_LINES:
+                truncated = True
+                break
         return {
-            'protocol': protocol_logs,
-            'consumer': consumer_logs
+            'found': found,
+            'truncated': [ident for ident in idents if ident not in found] if truncated else [],
         }
 
-    def query_mongodb(self, ident, start_time, end_time):
+    def query_mongodb(self, ident, start_time, end_time, timeout=30):
         """Поиск в MongoDB"""
         try:
-            client = MongoClient(os.getenv('MONGO_URI'))
-            db = client['db']
-            collection = db['messages']
-
-            start_timestamp = int(start_time.timestamp())
-            end_timestamp = int(end_time.timestamp())
-
             print(f"Ищем ident: {ident}")
-            print(f"Период: {start_timestamp} - {end_timestamp}")
-
-            query = {
-                'ident': ident,
-                'timestamp': {
-                    '$gte': start_timestamp,
-                    '$lte': end_timestamp
-                }
-            }
+            print(f"Период: {int(start_time.timestamp())} - {int(end_time.timestamp())}")
 
-            results = list(collection.find(query).sort('timestamp', -1).limit(1))
+            with pymongo.timeout(timeout):
+                results = list(mongo.find_history(ident, start_time, end_time, limit=1))
 
-            # Преобразуем для JSON
-            processed_results = []
-            for doc in results:
-                # Создаем копию для отображения
-                display_doc = doc.copy()
+            return [self.format_mongo_doc(doc) for doc in results]
 
-                # Преобразуем _id, т.к. у Монго свой тип ObjectId для этого поля
-                if '_id' in display_doc:
-                    display_doc['_id'] = str(display_doc['_id'])
-
-                # Добавляем читаемую дату как отдельное поле только для display
-                readable_date = None
-                if 'timestamp' in doc and isinstance(doc['timestamp'], (int, float)):
-                    timestamp_dt = datetime.fromtimestamp(doc['timestamp'])
-                    readable_date = timestamp_dt.strftime('%Y-%m-%d %H:%M:%S')
-
-                # Преобразуем остальные datetime объекты, чтобы не было проблем с сериализзацией
-                for key, value in list(display_doc.items()):
-                    if isinstance(value, datetime):
-                        display_doc[key] = value.isoformat()
+        except Exception as e:
+            print(f"Ошибка MongoDB: {str(e)}")
+            raise
 
-                processed_results.append({
-                    'data': display_doc,
-                    'timestamp_readable': readable_date
-                })
+    def query_mongodb_batch(self, idents, start_time, end_time, timeout=30):
+        """Поиск в MongoDB: последний документ каждого ident одной агрегацией"""
+        try:
+            with pymongo.timeout(timeout):
+                results = list(mongo.latest_per_ident(idents, start_time, end_time))
 
-            client.close()
-            return processed_results
+            return {item['_id']: [self.format_mongo_doc(item['doc'])] for item in results}
 
         except Exception as e:
-            print(f"Ошибка MongoDB: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return []
+            logger.error("MongoDB batch lookup failed: %s", e)
+            raise
+
+    @staticmethod
+    def format_mongo_doc(doc):
+        """Преобразует документ Монго для JSON"""
+        # Создаем копию для отображения
+        display_doc = doc.copy()
+
+        # Преобразуем _id, т.к. у Монго свой тип ObjectId для этого поля
+        if '_id' in display_doc:
+            display_doc['_id'] = str(display_doc['_id'])
+
+        # Добавляем читаемую дату как отдельное поле только для display
+        readable_date = None
+        if 'timestamp' in doc and isinstance(doc['timestamp'], (int, float)):
+            timestamp_dt = datetime.fromtimestamp(doc['timestamp'])
+            readable_date = timestamp_dt.strftime('%Y-%m-%d %H:%M:%S')
+
+        # Преобразуем остальные datetime объекты, чтобы не было проблем с сериализзацией
+        for key, value in list(display_doc.items()):
+            if isinstance(value, datetime):
+                display_doc[key] = value.isoformat()
+
+        return {
+            'data': display_doc,
+            'timestamp_readable': readable_date
+        }
 
-    def query_postgresql(self, ident):
+    def query_postgresql(self, ident, timeout=30):
         """Поиск в PostgreSQL"""
         try:
-            conn = psycopg2.connect(os.getenv('POSTGRES_URI'))
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-
             query = """
                 SELECT * FROM units 
                 WHERE unique_id = %s 
@@ -512,81 +899,257 @@ class CheckIdent(APIView):
                 LIMIT 1
             """
 
-            cursor.execute(query, (ident,))
-            result = cursor.fetchone()
+            with clients.postgres() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute('SET LOCAL statement_timeout = %s', (int(timeout * 1000),))
+                    cursor.execute(query, (ident,))
+                    result = cursor.fetchone()
 
             if not result:
-                cursor.close()
-                conn.close()
                 return []
 
-            row_dict = dict(result)
+            return [self.format_postgres_row(result)]
 
-            # ЭТО НУЖНО - иначе Django не сможет вернуть Response
-            for key, value in row_dict.items():
-                if isinstance(value, datetime):
-                    row_dict[key] = value.isoformat()
+        except Exception as e:
+            print(f"Ошибка PostgreSQL: {str(e)}")
+            raise
 
-            cursor.close()
-            conn.close()
+    def query_postgresql_batch(self, idents, timeout=30):
+        """Поиск в PostgreSQL: последняя запись каждого ident одним запросом"""
+        try:
+            query = """
+                SELECT DISTINCT ON (unique_id) * FROM units
+                WHERE unique_id = ANY(%s)
+                AND deleted = false
+                ORDER BY unique_id, updated_at DESC
+            """
+
+            with clients.postgres() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute('SET LOCAL statement_timeout = %s', (int(timeout * 1000),))
+                    cursor.execute(query, (idents,))
+                    rows = cursor.fetchall()
 
-            return [{
-                'data': row_dict,
-                'unit_name': row_dict.get('name', 'Не указано')
-            }]
+            return {row['unique_id']: [self.format_postgres_row(row)] for row in rows}
 
         except Exception as e:
-            print(f"Ошибка PostgreSQL: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return []
+            logger.error("PostgreSQL batch lookup failed: %s", e)
+            raise
 
-    def query_redis(self, ident):
-        """Поиск в Redis"""
-        try:
-            # Подключение к Redis
-            redis_url = os.getenv('REDIS_URL')
-            r = redis.from_url(redis_url, decode_responses=True)
-
-            # Проверяем оба варианта ключей (приоритет у last_message)
-            keys_to_check = [
-                f'last_message_{ident}',
-                ident
-            ]
+    @staticmethod
+    def format_postgres_row(row):
+        row_dict = dict(row)
 
-            data_dict = None
-            found_key = None
+        # ЭТО НУЖНО - иначе Django не сможет вернуть Response
+        for key, value in row_dict.items():
+            if isinstance(value, datetime):
+                row_dict[key] = value.isoformat()
 
-            for key in keys_to_check:
-                data = r.get(key)
-                if data:
-                    found_key = key
-                    data_dict = json.loads(data)
-                    break
+        return {
+            'data': row_dict,
+            'unit_name': row_dict.get('name', 'Не указано')
+        }
 
-            if not data_dict:
+    def query_redis(self, ident, timeout=30):
+        """Поиск в Redis"""
+        try:
+            # Оба варианта ключей одним MGET (приоритет у last_message)
+            found = redis_lookup.lookup_last_messages([ident])
+            if ident not in found:
                 print(f"Redis: данные для {ident} не найдены")
                 return []
 
+            found_key, data_dict = found[ident]
             print(f"Redis: найдены данные по ключу {found_key}")
 
-            # Конвертируем timestamp в читаемый формат
-            readable_date = None
-            if 'timestamp' in data_dict and isinstance(data_dict['timestamp'], (int, float)):
-                timestamp_dt = datetime.fromtimestamp(data_dict['timestamp'])
-                readable_date = timestamp_dt.strftime('%Y-%m-%d %H:%M:%S')
-
-            return [{
-                'data': data_dict,
-                'timestamp_readable': readable_date or 'Нет данных о времени',
-                'redis_key': found_key
-            }]
+            return [self.format_redis_data(data_dict, found_key)]
 
         except redis.ConnectionError as e:
             print(f"Ошибка подключения к Redis: {e}")
-            return []
+            raise
         except Exception as e:
             print(f"Ошибка Redis: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return []
+            raise
+
+    def query_redis_batch(self, idents, timeout=30):
+        """Поиск в Redis: оба варианта ключей всех idents за один сетевой круг"""
+        try:
+            return {
+                ident: [self.format_redis_data(data_dict, found_key)]
+                for ident, (found_key, data_dict)
+                in redis_lookup.lookup_last_messages(idents).items()
+            }
+
+        except redis.ConnectionError as e:
+            logger.error("Redis connection failed: %s", e)
+            raise
+        except Exception as e:
+            logger.error("Redis batch lookup failed: %s", e)
+            raise
+
+    @staticmethod
+    def format_redis_data(data_dict, found_key):
+        # Конвертируем timestamp в читаемый формат
+        readable_date = None
+        if 'timestamp' in data_dict and isinstance(data_dict['timestamp'], (int, float)):
+            timestamp_dt = datetime.fromtimestamp(data_dict['timestamp'])
+            readable_date = timestamp_dt.strftime('%Y-%m-%d %H:%M:%S')
+
+        return {
+            'data': data_dict,
+            'timestamp_readable': readable_date or 'Нет данных о времени',
+            'redis_key': found_key
+        }
+
+
+class LokiLogSearchView(APIView):
+    """Потоковый поиск по логам Loki в формате NDJSON.
+
+    Записи идут от новых к старым, по строке на запись. Если выдача
+    упёрлась в limit, последней строкой приходит cursor - его передают
+    в следующем запросе, чтобы продолжить с места остановки. Курсор
+    помнит записи, уже отданные с последней меткой времени, поэтому
+    записи с той же наносекундой не теряются и не повторяются.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        ident = request.query_params.get('ident')
+        app_name = request.query_params.get('app')
+        if not ident or not app_name:
+            return Response({'error': 'ident и app обязательны'}, status=400)
+
+        try:
+            start_param = request.query_params.get('start')
+            end_param = request.query_params.get('end')
+            if start_param and end_param:
+                start_time = datetime.fromisoformat(start_param.replace('Z', '+00:00'))
+                end_time = datetime.fromisoformat(end_param.replace('Z', '+00:00'))
+            else:
+                hours = CheckIdent.parse_time_range(request.query_params.get('time_range', '1h'))
+                end_time = datetime.now()
+                start_time = end_time - timedelta(hours=hours)
+            cursor = request.query_params.get('cursor')
+            if cursor:
+                end_ns, seen = loki.decode_cursor(cursor)
+            else:
+                end_ns, seen = loki.to_ns(end_time), set()
+            limit = max(min(
+                int(request.query_params.get('limit', settings.LOKI_SEARCH_MAX_LINES)),
+                settings.LOKI_SEARCH_MAX_LINES
+            ), 1)
+        except ValueError as e:
+            return Response({'error': f'Некорректные параметры: {str(e)}'}, status=400)
+
+        lines = self.generate_lines(
+            loki.build_query(app_name, ident), loki.to_ns(start_time), end_ns, limit, seen
+        )
+
+        async def stream():
+            # Страницы тянем в потоке по одной: синхронный итератор Django
+            # под ASGI сначала вычитал бы целиком
+            done = object()
+            while True:
+                chunk = await sync_to_async(next, thread_sensitive=False)(lines, done)
+                if chunk is done:
+                    break
+                yield chunk
+
+        return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+
+    def generate_lines(self, query, start_ns, end_ns, limit, seen=None):
+        sent = 0
+        # Для курсора: время последней отданной записи и ключи записей с этим временем
+        last_ns = str(end_ns - 1) if seen else None
+        last_keys = set(seen or ())
+
+        def cursor():
+            return loki.encode_cursor(last_ns, last_keys) if last_ns is not None else None
+
+        try:
+            for page in loki.iter_log_pages(query, start_ns, end_ns, seen=seen):
+                page = page[:limit - sent]
+                sent += len(page)
+                for entry in page:
+                    if entry['timestamp_ns'] != last_ns:
+                        last_ns, last_keys = entry['timestamp_ns'], set()
+                    last_keys.add(loki.entry_key(entry))
+                yield ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in page)
+                if sent >= limit:
+                    yield json.dumps({'cursor': cursor(), 'done': False}) + '\n'
+                    return
+        except Exception as e:
+            logger.exception('Loki search failed: %s', e)
+            yield json.dumps({'error': str(e), 'cursor': cursor(), 'done': False}, ensure_ascii=False) + '\n'
+            return
+        yield json.dumps({'cursor': None, 'done': True}) + '\n'
+
+
+class MongoHistoryView(APIView):
+    """Потоковая выдача документов ident из MongoDB в формате NDJSON.
+
+    Документы читаются курсором порциями IDENT_MONGO_BATCH_SIZE и сразу
+    уходят клиенту, так что широкое окно не собирается в памяти целиком.
+    Последней строкой приходит {"done": true, "count": N}.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        ident = request.query_params.get('ident')
+        if not ident:
+            return Response({'error': 'Ident is required'}, status=400)
+
+        try:
+            start_param = request.query_params.get('start')
+            end_param = request.query_params.get('end')
+            if start_param and end_param:
+                start_time = datetime.fromisoformat(start_param.replace('Z', '+00:00'))
+                end_time = datetime.fromisoformat(end_param.replace('Z', '+00:00'))
+            else:
+                hours = CheckIdent.parse_time_range(request.query_params.get('time_range', '1h'))
+                end_time = datetime.now()
+                start_time = end_time - timedelta(hours=hours)
+            limit = max(min(
+                int(request.query_params.get('limit', settings.IDENT_MONGO_HISTORY_MAX)),
+                settings.IDENT_MONGO_HISTORY_MAX
+            ), 1)
+        except ValueError as e:
+            return Response({'error': f'Некорректные параметры: {str(e)}'}, status=400)
+
+        lines = self.generate_lines(ident, start_time, end_time, limit)
+
+        async def stream():
+            done = object()
+            while True:
+                chunk = await sync_to_async(next, thread_sensitive=False)(lines, done)
+                if chunk is done:
+                    break
+                yield chunk
+
+        return StreamingHttpResponse(stream(), content_type='application/x-ndjson')
+
+    def generate_lines(self, ident, start_time, end_time, limit):
+        count = 0
+        batch = []
+        cursor = None
+        try:
+            cursor = mongo.find_history(ident, start_time, end_time, limit=limit)
+            for doc in cursor:
+                batch.append(json.dumps(CheckIdent.format_mongo_doc(doc), ensure_ascii=False, default=str))
+                count += 1
+                # Отдаём по порции курсора, а не по документу
+                if len(batch) >= settings.IDENT_MONGO_BATCH_SIZE:
+                    yield '\n'.join(batch) + '\n'
+                    batch = []
+            if batch:
+                yield '\n'.join(batch) + '\n'
+        except Exception as e:
+            logger.exception('Mongo history failed: %s', e)
+            yield json.dumps({'error': str(e), 'count': count, 'done': False}, ensure_ascii=False) + '\n'
+            return
+        finally:
+            if cursor is not None:
+                cursor.close()
+        yield json.dumps({'count': count, 'done': True}) + '\n'
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backlog', '0006_alter_backlog_created_at_alter_backlog_status_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='backlog',
+            index=models.Index(fields=['status', 'id'], name='backlog_bac_status_6a0a3d_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backlog', '0007_backlog_status_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='backlog',
+            index=models.Index(fields=['groups', 'status'], name='backlog_bac_groups__5496f5_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['backlog', '-created_at'], name='backlog_com_backlog_455cf5_idx'),
+        ),
+    ]
@@ -54,6 +54,10 @@ class Backlog(models.Model):
 
     class Meta:
         ordering = ('id',)
+        indexes = (
+            models.Index(fields=('status', 'id')),
+            models.Index(fields=('groups', 'status')),
+        )
         verbose_name = 'бэклог'
         verbose_name_plural = 'Бэклог'
 
@@ -97,6 +101,9 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = (
+            models.Index(fields=('backlog', '-created_at')),
+        )
         verbose_name = 'комментарий'
         verbose_name_plural = 'Комментарии'
 
@@ -65,3 +65,18 @@ class BacklogSerializer(serializers.ModelSerializer):
     def get_comments(self, obj):
         comments = obj.comments.all()
         return CommentSerializer(comments, many=True).data
+
+
+class BacklogListSerializer(serializers.ModelSerializer):
+    """Задача для списка: без текста, вложений и комментариев"""
+    author = serializers.SlugRelatedField(
+        slug_field='username',
+        read_only=True
+    )
+    groups = serializers.PrimaryKeyRelatedField(read_only=True)
+    tags = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+    comments_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Backlog
+        fields = ['id', 'author', 'groups', 'tags', 'theme', 'status', 'comments_count', 'created_at']
@@ -0,0 +1,152 @@
+import logging
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+from core.streaming import stream_command
+
+logger = logging.getLogger("core.actions")
+
+HostAction = namedtuple("HostAction", ("run", "failed_action", "error_prefix"))
+
+HOST_ACTIONS = {}
+
+
+class ActionFailed(Exception):
+    """Команда на хосте завершилась с ошибкой; error уходит клиенту как есть"""
+
+    def __init__(self, error):
+        super().__init__(error)
+        self.error = error
+
+
+def host_action(name, failed_action, error_prefix):
+    def decorator(func):
+        HOST_ACTIONS[name] = HostAction(func, failed_action, error_prefix)
+        return func
+    return decorator
+
+
+def output_sender(emit, action):
+    """Колбэк для stream_command: рассылает очередную пачку строк вывода"""
+    async def send_lines(lines):
+        await emit({"action": action, "lines": lines})
+    return send_lines
+
+
+async def touch_last_update(ssh_host):
+    ssh_host.last_update = timezone.now()
+    await sync_to_async(ssh_host.save)(update_fields=["last_update"])
+
+
+@host_action("toggle_mongo", "toggle_failed", "Ошибка подключения")
+async def toggle_mongo(ssh_host, conn, emit, password):
+    await emit({"action": "toggle_started", "message": "Переключаем базу"})
+    result = await conn.run("sudo /usr/local/bin/toggle-mongo", check=False)
+    logger.debug(
+        "toggle-mongo result: exit=%s stdout=%r stderr=%r",
+        result.exit_status,
+        result.stdout,
+        result.stderr,
+    )
+    if result.exit_status != 0:
+        raise ActionFailed(result.stderr or "Toggle failed")
+
+    await emit({"action": "toggle_completed", "result": result.stdout})
+    return result.stdout
+
+
+@host_action("restore_backup", "restore_failed", "Restore backup error")
+async def restore_backup(ssh_host, conn, emit, password):
+    await emit({"action": "restore_started", "message": "Начато восстановление дампа PG"})
+    logger.debug("restore_backup: running restore-backup")
+    result = await stream_command(
+        conn,
+        "sudo /usr/local/bin/restore-backup",
+        output_sender(emit, "restore_output"),
+    )
+    logger.debug(
+        "restore-backup result: exit=%s stdout=%r stderr=%r",
+        result.exit_status,
+        result.stdout,
+        result.stderr,
+    )
+    if result.exit_status != 0:
+        raise ActionFailed(result.stderr or "Restore failed")
+
+    await emit({"action": "restore_completed", "result": result.stdout})
+    return result.stdout
+
+
+@host_action("fast_pull", "fast_pull_failed", "Fast pull error")
+async def fast_pull(ssh_host, conn, emit, password):
+    await emit({"action": "fast_pull_started", "message": "Пуллим код"})
+    logger.debug("fast_pull: running git pull")
+    result = await conn.run(
+        "cd /home/jsand/common && git pull origin main", check=False
+    )
+    logger.debug(
+        "fast_pull git pull result: exit=%s stdout=%r stderr=%r",
+        result.exit_status,
+        result.stdout,
+        result.stderr,
+    )
+    if result.exit_status != 0:
+        raise ActionFailed(result.stderr or "Fast pull failed")
+
+    await emit({"action": "fast_pull_completed", "result": result.stdout})
+    await touch_last_update(ssh_host)
+    logger.debug("fast_pull: success, last_update set to %s", ssh_host.last_update)
+    return result.stdout
+
+
+@host_action("pull_with_reload", "pull_with_reload_failed", "Pull with reload error")
+async def pull_with_reload(ssh_host, conn, emit, password):
+    await emit(
+        {"action": "pull_with_reload_started", "message": "Пуллим код и перезагружаемся"}
+    )
+
+    async def run_command_or_fail(command, step_name):
+        logger.debug("pull_with_reload: %s command=%r", step_name, command)
+        result = await stream_command(
+            conn,
+            command,
+            output_sender(emit, "pull_with_reload_output"),
+            input=password,
+        )
+        logger.debug(
+            "pull_with_reload: %s exit=%s stdout=%r stderr=%r",
+            step_name,
+            result.exit_status,
+            result.stdout,
+            result.stderr,
+        )
+        if result.exit_status != 0:
+            error_msg = result.stderr or f"{step_name} failed with unknown error"
+            logger.error("pull_with_reload: %s error: %s", step_name, error_msg)
+            raise ActionFailed(error_msg)
+        return result
+
+    await run_command_or_fail(
+        "cd /home/jsand/common && git fetch origin", "Git fetch"
+    )
+    await run_command_or_fail(
+        "cd /home/jsand/common && git checkout -B main origin/main",
+        "Git force checkout main",
+    )
+    await run_command_or_fail("sudo /usr/local/bin/deploy_remote", "Deploy remote")
+
+    docker_compose_file = ssh_host.docker_base
+    logger.debug("pull_with_reload: using docker compose file %s", docker_compose_file)
+    result = await run_command_or_fail(
+        f"cd /home/jsand/common && docker compose -f {docker_compose_file} up -d --build --force-recreate",
+        "Docker compose up",
+    )
+
+    await emit({"action": "pull_with_reload_completed", "result": result.stdout})
+    await touch_last_update(ssh_host)
+    logger.debug(
+        "pull_with_reload completed successfully, last_update=%s", ssh_host.last_update
+    )
+    return result.stdout
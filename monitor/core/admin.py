@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from core.models import SSHHost
+from core.models import HostJob, HostStatusSample, SSHHost
 
 
 @admin.register(SSHHost)
@@ -18,3 +18,40 @@ class SSHHostAdmin(admin.ModelAdmin):
         'name',
         'host'
     )
+
+
+@admin.register(HostJob)
+class HostJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'host',
+        'action',
+        'status',
+        'created_by',
+        'created_at',
+        'finished_at',
+    )
+    search_fields = (
+        'host__name',
+        'host__host'
+    )
+    list_filter = (
+        'status',
+        'action',
+        'host'
+    )
+
+
+@admin.register(HostStatusSample)
+class HostStatusSampleAdmin(admin.ModelAdmin):
+    list_display = (
+        'host',
+        'state',
+        'config_status',
+        'started_at',
+        'ended_at',
+        'samples',
+    )
+    list_filter = (
+        'state',
+        'host'
+    )
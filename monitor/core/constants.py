@@ -1 +1,48 @@
-LENGTH_STR = 20
\ No newline at end of file
+LENGTH_STR = 20
+
+SSH_CONNECT_TIMEOUT = 10
+SSH_KEEPALIVE_INTERVAL = 15
+SSH_KEEPALIVE_COUNT_MAX = 3
+SSH_POOL_IDLE_TIMEOUT = 300
+SSH_POOL_REAP_INTERVAL = 30
+SSH_POOL_BACKOFF_BASE = 1
+SSH_POOL_BACKOFF_MAX = 60
+
+OUTPUT_BATCH_LINES = 50
+OUTPUT_FLUSH_INTERVAL = 0.5
+OUTPUT_TAIL_LINES = 200
+OUTPUT_MAX_LINE_LENGTH = 2000
+
+JOB_STATUS_QUEUED = 'queued'
+JOB_STATUS_RUNNING = 'running'
+JOB_STATUS_SUCCEEDED = 'succeeded'
+JOB_STATUS_FAILED = 'failed'
+CHOICES_JOB_STATUS = (
+    (JOB_STATUS_QUEUED, 'В очереди'),
+    (JOB_STATUS_RUNNING, 'Выполняется'),
+    (JOB_STATUS_SUCCEEDED, 'Выполнена'),
+    (JOB_STATUS_FAILED, 'Ошибка'),
+)
+CHOICES_JOB_ACTION = (
+    ('toggle_mongo', 'Переключение базы'),
+    ('restore_backup', 'Восстановление дампа PG'),
+    ('fast_pull', 'Pull'),
+    ('pull_with_reload', 'Pull и перезагрузка'),
+)
+JOB_POLL_INTERVAL = 5
+JOB_LOCK_TTL = 60
+
+WS_MAX_SUBSCRIPTIONS = 200
+
+HOST_STATE_AVAILABLE = 'available'
+HOST_STATE_UNAVAILABLE = 'unavailable'
+CHOICES_HOST_STATE = (
+    (HOST_STATE_AVAILABLE, 'Доступен'),
+    (HOST_STATE_UNAVAILABLE, 'Недоступен'),
+)
+HISTORY_MAX_ERROR_LENGTH = 255
+
+CONFIG_STATUS_UNDEFINED = 'Конфигурация не определена'
+CONFIG_STATUS_TEST = 'Подключена тестовая Монго'
+CONFIG_STATUS_PROD = 'Подключена продакшн Монго'
+CONFIG_STATUS_NO_PROJECT = 'Проект common не найден'
@@ -0,0 +1,169 @@
+import json
+from urllib.parse import parse_qs
+
+from core.constants import (
+    CONFIG_STATUS_NO_PROJECT,
+    CONFIG_STATUS_PROD,
+    CONFIG_STATUS_TEST,
+    CONFIG_STATUS_UNDEFINED,
+)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMAT_JSON = "json"
+FORMAT_COMPACT = "compact"
+FORMAT_MSGPACK = "msgpack"
+
+# Подпротоколы websocket в порядке предпочтения сервера
+SUBPROTOCOLS = {
+    "monitor.msgpack": FORMAT_MSGPACK,
+    "monitor.compact": FORMAT_COMPACT,
+    "monitor.json": FORMAT_JSON,
+}
+
+# Короткие имена полей кадра
+KEYS = {
+    "type": "t",
+    "action": "a",
+    "job_id": "j",
+    "host_id": "i",
+    "config_status": "c",
+    "last_update": "u",
+    "last_commit": "m",
+    "commitHash": "h",
+    "message": "s",
+    "result": "r",
+    "error": "e",
+    "lines": "l",
+}
+
+# Значения полей, которые передаются номером в списке. Новые значения
+# добавляются только в конец, иначе старые клиенты прочитают их неверно
+VALUES = {
+    "type": ["snapshot", "delta", "heartbeat", "dictionary", "subscribed", "unsubscribed"],
+    "config_status": [
+        CONFIG_STATUS_UNDEFINED,
+        CONFIG_STATUS_TEST,
+        CONFIG_STATUS_PROD,
+        CONFIG_STATUS_NO_PROJECT,
+    ],
+    "action": [
+        "job_queued",
+        "toggle_started",
+        "toggle_completed",
+        "toggle_failed",
+        "restore_started",
+        "restore_output",
+        "restore_completed",
+        "restore_failed",
+        "fast_pull_started",
+        "fast_pull_completed",
+        "fast_pull_failed",
+        "pull_with_reload_started",
+        "pull_with_reload_output",
+        "pull_with_reload_completed",
+        "pull_with_reload_failed",
+    ],
+    "stream": ["stdout", "stderr"],
+}
+
+_CODES = {
+    field: {value: code for code, value in enumerate(values)}
+    for field, values in VALUES.items()
+}
+
+
+def available_formats():
+    formats = [FORMAT_JSON, FORMAT_COMPACT]
+    if msgpack is not None:
+        formats.append(FORMAT_MSGPACK)
+    return formats
+
+
+def negotiate(scope):
+    """Формат кадров соединения: подпротокол или ?format=, по умолчанию JSON.
+
+    Возвращает (формат, подпротокол для accept или None).
+    """
+    offered = scope.get("subprotocols") or []
+    for subprotocol, frame_format in SUBPROTOCOLS.items():
+        if subprotocol in offered and frame_format in available_formats():
+            return frame_format, subprotocol
+
+    query = parse_qs(scope.get("query_string", b"").decode())
+    frame_format = query.get("format", [FORMAT_JSON])[0]
+    if frame_format not in available_formats():
+        frame_format = FORMAT_JSON
+    return frame_format, None
+
+
+def _code(field, value):
+    if isinstance(value, str):
+        return _CODES.get(field, {}).get(value, value)
+    return value
+
+
+def compact(frame):
+    """Заменяет имена полей и известные значения на короткие коды.
+    Неизвестные поля и значения передаются как есть.
+    """
+    result = {}
+    for field, value in frame.items():
+        if field == "lines":
+            value = [[_code("stream", item["stream"]), item["line"]] for item in value]
+        else:
+            value = _code(field, value)
+        result[KEYS.get(field, field)] = value
+    return result
+
+
+def dictionary_frame(frame_format):
+    """Словарь кодов: отправляется один раз сразу после подключения"""
+    return {
+        "type": "dictionary",
+        "format": frame_format,
+        "keys": {short: field for field, short in KEYS.items()},
+        "values": VALUES,
+        "lines": ["stream", "line"],
+    }
+
+
+def encode(frame, frame_format):
+    """Кодирует кадр: возвращает именованные аргументы для send()"""
+    if frame_format == FORMAT_JSON:
+        return {"text_data": json.dumps(frame)}
+    # Словарь сам не сжимается - клиент должен прочитать его без кодов
+    payload = frame if frame.get("type") == "dictionary" else compact(frame)
+    if frame_format == FORMAT_MSGPACK:
+        return {"bytes_data": msgpack.packb(payload, use_bin_type=True)}
+    return {"text_data": json.dumps(payload, ensure_ascii=False, separators=(",", ":"))}
+
+
+def encode_text(text, frame_format, host_id=None):
+    """Кодирует кадр, уже сериализованный в JSON для группы.
+    host_id, если передан, добавляется в кадр (мультиплексное соединение).
+    """
+    if frame_format == FORMAT_JSON:
+        if host_id is not None:
+            # Дописываем поле в начало объекта, не разбирая JSON целиком
+            if text == "{}":
+                text = json.dumps({"host_id": host_id})
+            else:
+                text = f'{{"host_id": {int(host_id)}, {text[1:]}'
+        return {"text_data": text}
+    frame = json.loads(text)
+    if host_id is not None:
+        frame["host_id"] = host_id
+    return encode(frame, frame_format)
+
+
+def decode(text_data=None, bytes_data=None):
+    """Сообщение клиента: JSON текстом или msgpack двоичным кадром"""
+    if bytes_data is not None:
+        if msgpack is None:
+            raise ValueError("binary frames are not supported")
+        return msgpack.unpackb(bytes_data, raw=False)
+    return json.loads(text_data)
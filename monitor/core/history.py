@@ -0,0 +1,179 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from core.constants import (
+    HISTORY_MAX_ERROR_LENGTH,
+    HOST_STATE_AVAILABLE,
+    HOST_STATE_UNAVAILABLE,
+)
+from core.models import HostStatusSample
+
+logger = logging.getLogger("core.history")
+
+
+def sample_key(payload):
+    """Поля, смена которых начинает новый отрезок; текст ошибки сюда не входит"""
+    if "error" in payload:
+        return (HOST_STATE_UNAVAILABLE, "", "")
+    return (
+        HOST_STATE_AVAILABLE,
+        payload.get("config_status") or "",
+        payload.get("commitHash") or "",
+    )
+
+
+class _Run:
+    __slots__ = ("pk", "key", "ended_at", "samples", "flushed_at", "dirty")
+
+    def __init__(self, pk, key, ended_at, samples, flushed_at):
+        self.pk = pk
+        self.key = key
+        self.ended_at = ended_at
+        self.samples = samples
+        self.flushed_at = flushed_at
+        self.dirty = False
+
+
+class StatusHistoryRecorder:
+    """Пишет результаты опроса в HostStatusSample со сжатием повторов.
+
+    Пока статус не меняется, текущий отрезок продлевается в памяти и
+    сбрасывается в БД раз в HOST_HISTORY_FLUSH_INTERVAL; при смене статуса
+    отрезок закрывается и открывается новый. Если опрос прерывался дольше
+    допустимого, новый отрезок начинается даже при том же статусе - в
+    истории остаётся пробел, а не выдуманные данные.
+    """
+
+    def __init__(self, interval=None, flush_interval=None):
+        self.interval = interval or settings.HOST_POLL_INTERVAL
+        self.flush_interval = timedelta(
+            seconds=flush_interval or settings.HOST_HISTORY_FLUSH_INTERVAL
+        )
+        self.max_gap = timedelta(seconds=self.interval * 3) + self.flush_interval
+        self._runs = {}
+
+    async def record(self, host_id, payload):
+        try:
+            await self._record(host_id, payload)
+        except Exception as e:
+            # История не должна ломать опрос
+            self._runs.pop(host_id, None)
+            logger.warning("history: write error for host_id=%s: %s", host_id, e)
+
+    async def _record(self, host_id, payload):
+        now = timezone.now()
+        key = sample_key(payload)
+        if host_id not in self._runs:
+            self._runs[host_id] = await self._load(host_id)
+        run = self._runs[host_id]
+
+        if run is not None and run.key == key and now - run.ended_at <= self.max_gap:
+            run.ended_at = now
+            run.samples += 1
+            run.dirty = True
+            if now - run.flushed_at >= self.flush_interval:
+                await self._flush(run)
+            return
+
+        if run is not None:
+            await self._flush(run)
+        sample = await HostStatusSample.objects.acreate(
+            host_id=host_id,
+            state=key[0],
+            config_status=key[1],
+            commit=key[2],
+            error=(payload.get("error") or "")[:HISTORY_MAX_ERROR_LENGTH],
+            started_at=now,
+            ended_at=now,
+        )
+        self._runs[host_id] = _Run(sample.pk, key, now, 1, now)
+
+    async def _load(self, host_id):
+        """Последний отрезок хоста - его мог писать другой воркер"""
+        sample = await HostStatusSample.objects.filter(host_id=host_id).order_by("-started_at").afirst()
+        if sample is None:
+            return None
+        key = (sample.state, sample.config_status, sample.commit)
+        return _Run(sample.pk, key, sample.ended_at, sample.samples, timezone.now())
+
+    async def _flush(self, run):
+        if not run.dirty:
+            return
+        await HostStatusSample.objects.filter(pk=run.pk).aupdate(
+            ended_at=run.ended_at, samples=run.samples
+        )
+        run.flushed_at = timezone.now()
+        run.dirty = False
+
+    async def forget(self, host_id):
+        """Сбрасывает отрезок в БД, когда этот воркер перестаёт опрашивать хост"""
+        run = self._runs.pop(host_id, None)
+        if run is None:
+            return
+        try:
+            await self._flush(run)
+        except Exception as e:
+            logger.warning("history: flush error for host_id=%s: %s", host_id, e)
+
+
+status_history = StatusHistoryRecorder()
+
+
+def compact_history(before, min_run):
+    """Прореживает историю старше before: короткие отрезки (меньше min_run)
+    поглощаются предыдущим, одинаковые соседние отрезки склеиваются.
+    Возвращает число удалённых строк.
+    """
+    removed = 0
+    host_ids = (
+        HostStatusSample.objects.filter(ended_at__lt=before)
+        .values_list("host_id", flat=True)
+        .distinct()
+    )
+    for host_id in list(host_ids):
+        with transaction.atomic():
+            samples = list(
+                HostStatusSample.objects.select_for_update()
+                .filter(host_id=host_id, ended_at__lt=before)
+                .order_by("started_at")
+            )
+            kept = []
+            to_delete = []
+            for sample in samples:
+                previous = kept[-1] if kept else None
+                short = sample.ended_at - sample.started_at < min_run
+                same = previous is not None and (
+                    (previous.state, previous.config_status, previous.commit)
+                    == (sample.state, sample.config_status, sample.commit)
+                )
+                if previous is not None and (same or short):
+                    previous.ended_at = max(previous.ended_at, sample.ended_at)
+                    previous.samples += sample.samples
+                    to_delete.append(sample.pk)
+                else:
+                    kept.append(sample)
+            if not to_delete:
+                continue
+            HostStatusSample.objects.bulk_update(kept, ["ended_at", "samples"])
+            HostStatusSample.objects.filter(pk__in=to_delete).delete()
+            removed += len(to_delete)
+    return removed
+
+
+def prune_history(now=None):
+    """Удаляет историю старше срока хранения и прореживает старую.
+    Возвращает (удалено по сроку, удалено при прореживании).
+    """
+    now = now or timezone.now()
+    expired, _ = HostStatusSample.objects.filter(
+        ended_at__lt=now - timedelta(days=settings.HOST_HISTORY_RETENTION_DAYS)
+    ).delete()
+    compacted = compact_history(
+        now - timedelta(days=settings.HOST_HISTORY_DOWNSAMPLE_AFTER_DAYS),
+        timedelta(seconds=settings.HOST_HISTORY_MIN_RUN),
+    )
+    return expired, compacted
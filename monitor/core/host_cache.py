@@ -0,0 +1,89 @@
+import asyncio
+import copy
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from core.models import SSHHost
+
+logger = logging.getLogger("core.host_cache")
+
+INVALIDATION_GROUP = "sshhost_invalidation"
+# channels_redis забывает участников группы через group_expiry (сутки),
+# поэтому слушатель периодически переподписывается
+RESUBSCRIBE_INTERVAL = 3600
+
+
+class SSHHostCache:
+    """Кэш SSHHost в памяти воркера.
+
+    Запись сбрасывается по post_save/post_delete и вебхуку GitLab; сброс
+    рассылается через channel layer, чтобы устаревшие хосты выкинули все
+    воркеры, а не только тот, где произошло изменение.
+    """
+
+    def __init__(self):
+        self._hosts = {}
+        self._generation = 0
+        self._listener = None
+
+    async def aget(self, pk):
+        """Возвращает копию хоста; SSHHost.DoesNotExist, если его нет"""
+        self._ensure_listener()
+        host = self._hosts.get(pk)
+        if host is None:
+            generation = self._generation
+            host = await SSHHost.objects.aget(pk=pk)
+            # Пока читали из БД, могла прийти инвалидация - такой объект не кэшируем
+            if generation == self._generation:
+                self._hosts[pk] = host
+        return copy.copy(host)
+
+    def invalidate(self, pk=None):
+        """Сбрасывает один хост или, если pk не указан, весь кэш"""
+        self._generation += 1
+        if pk is None:
+            self._hosts.clear()
+        else:
+            self._hosts.pop(pk, None)
+        logger.debug("host_cache: invalidated %s", "all" if pk is None else pk)
+
+    def _ensure_listener(self):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        channel_layer = get_channel_layer()
+        channel = await channel_layer.new_channel()
+        while True:
+            await channel_layer.group_add(INVALIDATION_GROUP, channel)
+            # Пока не были подписаны, могли пропустить сброс
+            self.invalidate()
+            try:
+                while True:
+                    message = await asyncio.wait_for(
+                        channel_layer.receive(channel), RESUBSCRIBE_INTERVAL
+                    )
+                    self.invalidate(message.get("host_id"))
+            except asyncio.TimeoutError:
+                continue
+
+
+host_cache = SSHHostCache()
+
+
+def invalidate_host(pk=None):
+    """Сбрасывает хост в этом воркере и рассылает сброс остальным после коммита"""
+    host_cache.invalidate(pk)
+
+    def broadcast():
+        try:
+            async_to_sync(get_channel_layer().group_send)(
+                INVALIDATION_GROUP, {"type": "sshhost.invalidate", "host_id": pk}
+            )
+        except Exception as e:
+            logger.warning("host_cache: broadcast failed for %s: %s", pk, e)
+
+    transaction.on_commit(broadcast)
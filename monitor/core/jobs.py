@@ -0,0 +1,253 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from collections import deque
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.utils import timezone
+
+from core.actions import HOST_ACTIONS, ActionFailed
+from core.constants import (
+    JOB_LOCK_TTL,
+    JOB_POLL_INTERVAL,
+    JOB_STATUS_FAILED,
+    JOB_STATUS_QUEUED,
+    JOB_STATUS_RUNNING,
+    JOB_STATUS_SUCCEEDED,
+    OUTPUT_TAIL_LINES,
+)
+from core.host_cache import host_cache
+from core.metrics import host_action_seconds
+from core.models import HostJob
+from core.poller import host_group_name
+from core.redis_client import acquire_lock, get_redis, release_lock
+from core.ssh_pool import ssh_pool
+
+logger = logging.getLogger("core.jobs")
+
+
+def job_lock_key(host_id):
+    return f"monitor:job:{host_id}"
+
+
+def job_event(job, frame):
+    return {
+        "type": "host.job",
+        "host_id": job.host_id,
+        "text": json.dumps({**frame, "job_id": job.pk}),
+    }
+
+
+async def _announce_job(job):
+    """Оповещает группу хоста и будит JobWorker, запуская его при необходимости:
+    без lifespan (runserver, Daphne) воркер иначе ждал бы первого сокета"""
+    job_worker.ensure_started()
+    job_worker.wake()
+    await get_channel_layer().group_send(
+        host_group_name(job.host_id),
+        job_event(job, {"action": "job_queued", "job_action": job.action}),
+    )
+
+
+def enqueue_job(host_id, action, user=None):
+    """Ставит действие в очередь; выполнит его любой запущенный JobWorker.
+    Из синхронного view под ASGI корутина выполняется в цикле событий воркера.
+    """
+    job = HostJob.objects.create(host_id=host_id, action=action, created_by=user)
+    try:
+        async_to_sync(_announce_job)(job)
+    except Exception as e:
+        logger.warning("enqueue_job: notify failed for job %s: %s", job.pk, e)
+    return job
+
+
+async def aenqueue_job(host_id, action, user=None):
+    job = await HostJob.objects.acreate(host_id=host_id, action=action, created_by=user)
+    await _announce_job(job)
+    return job
+
+
+class JobWorker:
+    """Исполнитель задач HostJob внутри ASGI-воркера.
+
+    Очередь хранится в БД и переживает перезапуск; задачи одного хоста
+    выполняются строго по очереди - это гарантирует блокировка хоста в
+    Redis, общая для всех воркеров. Одновременно воркер выполняет не
+    больше HOST_JOB_CONCURRENCY задач, прогресс рассылается в группу хоста.
+    """
+
+    def __init__(self, concurrency=None):
+        self.concurrency = concurrency or settings.HOST_JOB_CONCURRENCY
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        self._running = {}
+        self._interrupted = {}
+        self._task = None
+        self._wakeup = None
+
+    def ensure_started(self):
+        # Задача из чужого (уже закрытого) цикла событий не считается запущенной
+        if (
+            self._task is None
+            or self._task.done()
+            or self._task.get_loop() is not asyncio.get_running_loop()
+        ):
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._loop())
+            logger.debug("job_worker: started")
+
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self):
+        tasks = list(self._running.values())
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._fail_orphaned()
+                await self._dispatch()
+            except Exception as e:
+                logger.exception("job_worker: dispatch error: %s", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dispatch(self):
+        if len(self._running) >= self.concurrency:
+            return
+        queued = HostJob.objects.filter(status=JOB_STATUS_QUEUED).order_by("created_at")
+        seen_hosts = set(self._running)
+        async for job in queued[:100]:
+            if len(self._running) >= self.concurrency:
+                break
+            # Берём только самую старую задачу хоста, чтобы не нарушить порядок
+            if job.host_id in seen_hosts:
+                continue
+            seen_hosts.add(job.host_id)
+
+            if not await acquire_lock(job_lock_key(job.host_id), self.token, JOB_LOCK_TTL * 1000):
+                continue
+            claimed = await HostJob.objects.filter(
+                pk=job.pk, status=JOB_STATUS_QUEUED
+            ).aupdate(status=JOB_STATUS_RUNNING, started_at=timezone.now())
+            if not claimed:
+                await release_lock(job_lock_key(job.host_id), self.token)
+                continue
+            self._running[job.host_id] = asyncio.create_task(self._execute(job))
+
+    async def _fail_orphaned(self):
+        """Закрывает задачи, чей воркер умер: статус running, а блокировки хоста нет"""
+        running = HostJob.objects.filter(status=JOB_STATUS_RUNNING).exclude(
+            host_id__in=list(self._running)
+        )
+        async for job in running:
+            if await get_redis().exists(job_lock_key(job.host_id)):
+                continue
+            logger.warning("job_worker: job %s orphaned, marking failed", job.pk)
+            await HostJob.objects.filter(pk=job.pk, status=JOB_STATUS_RUNNING).aupdate(
+                status=JOB_STATUS_FAILED,
+                error="Задача прервана: воркер остановлен",
+                finished_at=timezone.now(),
+            )
+
+    async def _keep_lock(self, job, runner):
+        """Продлевает блокировку хоста; если она потеряна, задачу прерываем -
+        иначе действия на хосте могли бы идти из двух воркеров сразу"""
+        while True:
+            await asyncio.sleep(JOB_LOCK_TTL / 3)
+            try:
+                renewed = await acquire_lock(job_lock_key(job.host_id), self.token, JOB_LOCK_TTL * 1000)
+            except Exception as e:
+                logger.error("job_worker: lock renewal failed for host_id=%s: %s", job.host_id, e)
+                renewed = False
+            if not renewed:
+                logger.error("job_worker: lost lock for host_id=%s, cancelling job %s", job.host_id, job.pk)
+                self._interrupted[job.pk] = "Задача прервана: потеряна блокировка хоста"
+                runner.cancel()
+                return
+
+    async def _execute(self, job):
+        runner = asyncio.create_task(self.run_job(job))
+        keeper = asyncio.create_task(self._keep_lock(job, runner))
+        try:
+            await runner
+        except asyncio.CancelledError:
+            # Прерывание из-за потери блокировки - не остановка воркера
+            if job.pk not in self._interrupted:
+                raise
+        finally:
+            keeper.cancel()
+            self._interrupted.pop(job.pk, None)
+            await release_lock(job_lock_key(job.host_id), self.token)
+            self._running.pop(job.host_id, None)
+            self.wake()
+
+    async def run_job(self, job):
+        channel_layer = get_channel_layer()
+        group = host_group_name(job.host_id)
+        spec = HOST_ACTIONS[job.action]
+        tail = deque(maxlen=OUTPUT_TAIL_LINES)
+
+        async def emit(frame):
+            if "lines" in frame:
+                tail.extend(item["line"] for item in frame["lines"])
+            elif "message" in frame:
+                job.message = frame["message"]
+                await job.asave(update_fields=["message"])
+            await channel_layer.group_send(group, job_event(job, frame))
+
+        logger.debug("job_worker: running job %s (%s) for host_id=%s", job.pk, job.action, job.host_id)
+        password = os.getenv("SSH_PASSWORD")
+        started = time.monotonic()
+        try:
+            ssh_host = await host_cache.aget(job.host_id)
+            async with ssh_pool.connection(
+                ssh_host, os.getenv("SSH_USERNAME"), password
+            ) as conn:
+                result = await spec.run(ssh_host, conn, emit, password)
+            job.status = JOB_STATUS_SUCCEEDED
+            job.output = result or "\n".join(tail)
+        except ActionFailed as e:
+            job.status = JOB_STATUS_FAILED
+            job.error = e.error
+        except asyncio.CancelledError:
+            job.status = JOB_STATUS_FAILED
+            job.error = self._interrupted.get(job.pk, "Задача прервана: воркер остановлен")
+            raise
+        except Exception as e:
+            logger.exception("job_worker: job %s failed: %s", job.pk, e)
+            job.status = JOB_STATUS_FAILED
+            job.error = f"{spec.error_prefix}: {str(e)}"
+        finally:
+            host_action_seconds.observe(
+                time.monotonic() - started, action=job.action, status=job.status
+            )
+            job.finished_at = timezone.now()
+            if job.status == JOB_STATUS_FAILED:
+                job.output = "\n".join(tail)
+                await asyncio.shield(
+                    channel_layer.group_send(
+                        group, job_event(job, {"action": spec.failed_action, "error": job.error})
+                    )
+                )
+            await asyncio.shield(
+                job.asave(update_fields=["status", "output", "error", "finished_at"])
+            )
+
+
+job_worker = JobWorker()
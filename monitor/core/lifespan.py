@@ -0,0 +1,33 @@
+import logging
+
+logger = logging.getLogger("core.lifespan")
+
+
+class LifespanApp:
+    """ASGI lifespan: фоновые службы воркера стартуют вместе с ним.
+
+    Daphne lifespan не присылает - там JobWorker запускается лениво
+    при первом подключении к сокету.
+    """
+
+    async def __call__(self, scope, receive, send):
+        from api import mongo
+        from api.fanout import executor
+        from core.jobs import job_worker
+        from core.ssh_pool import ssh_pool
+
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                job_worker.ensure_started()
+                # Предупреждение об отсутствии индекса - в лог, старт не ждёт Монго
+                executor.submit(mongo.check_index)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                try:
+                    await job_worker.stop()
+                    await ssh_pool.close()
+                except Exception as e:
+                    logger.exception("lifespan shutdown error: %s", e)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.history import prune_history
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет историю статусов серверов старше HOST_HISTORY_RETENTION_DAYS '
+        'и прореживает историю старше HOST_HISTORY_DOWNSAMPLE_AFTER_DAYS. '
+        'Запускать по cron, например раз в сутки.'
+    )
+
+    def handle(self, *args, **options):
+        expired, compacted = prune_history()
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено по сроку хранения: {expired}, склеено отрезков: {compacted}'
+        ))
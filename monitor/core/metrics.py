@@ -0,0 +1,197 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LONG_BUCKETS = (0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Метрика в памяти процесса в текстовом формате Prometheus.
+
+    Значения с метками хранятся по кортежу значений меток; обновления
+    идут из event loop и из потоков пула CheckIdent, поэтому под блокировкой.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        if not self.labelnames and self.kind in ("counter", "gauge"):
+            self._values[()] = 0
+        registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def remove(self, **labels):
+        with self._lock:
+            self._values.pop(self._key(labels), None)
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            items = sorted(self._values.items())
+            for key, value in items:
+                yield from self._samples(key, value)
+
+    def _samples(self, key, value):
+        yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Счётчики по бакетам (последний - +Inf), сумма
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def _samples(self, key, value):
+        counts, total = value
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = _format_labels(self.labelnames, key, (("le", _format_value(bound)),))
+            yield f"{self.name}_bucket{le} {cumulative}"
+        labels = _format_labels(self.labelnames, key)
+        yield f"{self.name}_sum{labels} {_format_value(total)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+ssh_connect_seconds = Histogram(
+    "monitor_ssh_connect_seconds",
+    "Time to establish an SSH connection.",
+    ("host",),
+)
+ssh_connect_failures = Counter(
+    "monitor_ssh_connect_failures_total",
+    "Failed SSH connection attempts.",
+    ("host",),
+)
+host_action_seconds = Histogram(
+    "monitor_host_action_seconds",
+    "Host action runtime by action and final job status.",
+    ("action", "status"),
+    buckets=LONG_BUCKETS,
+)
+poll_tick_seconds = Histogram(
+    "monitor_poll_tick_seconds",
+    "Duration of one status poll of a host by the leader worker.",
+    ("host_id",),
+)
+poll_errors = Counter(
+    "monitor_poll_errors_total",
+    "Status polls that returned an error.",
+    ("host_id",),
+)
+ws_consumers = Gauge(
+    "monitor_ws_consumers",
+    "Open monitor websockets per host.",
+    ("host_id",),
+)
+ws_pending_sends = Gauge(
+    "monitor_ws_pending_sends",
+    "Websocket frames waiting for the transport to accept them.",
+)
+ident_source_seconds = Histogram(
+    "monitor_ident_source_seconds",
+    "CheckIdent backend latency.",
+    ("source", "status"),
+)
+ident_source_requests = Counter(
+    "monitor_ident_source_requests_total",
+    "CheckIdent backend calls by outcome.",
+    ("source", "status"),
+)
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0003_alter_sshhost_options'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HostJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('toggle_mongo', 'Переключение базы'), ('restore_backup', 'Восстановление дампа PG'), ('fast_pull', 'Pull'), ('pull_with_reload', 'Pull и перезагрузка')], max_length=32, verbose_name='Действие')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('succeeded', 'Выполнена'), ('failed', 'Ошибка')], default='queued', max_length=16, verbose_name='Статус')),
+                ('message', models.CharField(blank=True, max_length=255, verbose_name='Этап')),
+                ('output', models.TextField(blank=True, verbose_name='Вывод')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начало')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Окончание')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='host_jobs', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='core.sshhost', verbose_name='Сервер')),
+            ],
+            options={
+                'verbose_name': 'задача сервера',
+                'verbose_name_plural': 'Задачи серверов',
+                'ordering': ('-created_at',),
+                'indexes': [models.Index(fields=['status', 'created_at'], name='core_hostjo_status_70aac9_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_hostjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HostStatusSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(choices=[('available', 'Доступен'), ('unavailable', 'Недоступен')], max_length=16, verbose_name='Состояние')),
+                ('config_status', models.CharField(blank=True, max_length=255, verbose_name='Конфигурация')),
+                ('commit', models.CharField(blank=True, max_length=100, verbose_name='Коммит')),
+                ('error', models.CharField(blank=True, max_length=255, verbose_name='Ошибка')),
+                ('started_at', models.DateTimeField(verbose_name='Начало')),
+                ('ended_at', models.DateTimeField(verbose_name='Окончание')),
+                ('samples', models.PositiveIntegerField(default=1, verbose_name='Опросов')),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_samples', to='core.sshhost', verbose_name='Сервер')),
+            ],
+            options={
+                'verbose_name': 'статус сервера',
+                'verbose_name_plural': 'История статусов серверов',
+                'ordering': ('-started_at',),
+                'indexes': [models.Index(fields=['host', 'started_at'], name='core_hostst_host_id_02e02a_idx'), models.Index(fields=['ended_at'], name='core_hostst_ended_a_7407de_idx')],
+            },
+        ),
+    ]
@@ -1,6 +1,14 @@
+from django.conf import settings
 from django.db import models
 
-from core.constants import LENGTH_STR
+from core.constants import (
+    CHOICES_HOST_STATE,
+    CHOICES_JOB_ACTION,
+    CHOICES_JOB_STATUS,
+    HISTORY_MAX_ERROR_LENGTH,
+    JOB_STATUS_QUEUED,
+    LENGTH_STR,
+)
 
 
 class SSHHost(models.Model):
@@ -24,3 +32,77 @@ class SSHHost(models.Model):
 
     def __str__(self):
         return self.name[:LENGTH_STR]
+
+
+class HostJob(models.Model):
+    host = models.ForeignKey(
+        SSHHost,
+        on_delete=models.CASCADE,
+        related_name='jobs',
+        verbose_name='Сервер'
+    )
+    action = models.CharField(max_length=32, choices=CHOICES_JOB_ACTION, verbose_name='Действие')
+    status = models.CharField(
+        max_length=16,
+        choices=CHOICES_JOB_STATUS,
+        default=JOB_STATUS_QUEUED,
+        verbose_name='Статус'
+    )
+    message = models.CharField(max_length=255, blank=True, verbose_name='Этап')
+    output = models.TextField(blank=True, verbose_name='Вывод')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='host_jobs',
+        verbose_name='Автор'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Начало')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Окончание')
+
+    class Meta:
+        ordering = ('-created_at',)
+        indexes = (
+            models.Index(fields=('status', 'created_at')),
+        )
+        verbose_name = 'задача сервера'
+        verbose_name_plural = 'Задачи серверов'
+
+    def __str__(self):
+        return f'{self.get_action_display()} ({self.host})'
+
+
+class HostStatusSample(models.Model):
+    """Отрезок времени, когда статус сервера не менялся.
+
+    Одинаковые подряд результаты опроса не создают новых строк, а
+    продлевают ended_at текущего отрезка; samples - сколько опросов в него вошло.
+    """
+    host = models.ForeignKey(
+        SSHHost,
+        on_delete=models.CASCADE,
+        related_name='status_samples',
+        verbose_name='Сервер'
+    )
+    state = models.CharField(max_length=16, choices=CHOICES_HOST_STATE, verbose_name='Состояние')
+    config_status = models.CharField(max_length=255, blank=True, verbose_name='Конфигурация')
+    commit = models.CharField(max_length=100, blank=True, verbose_name='Коммит')
+    error = models.CharField(max_length=HISTORY_MAX_ERROR_LENGTH, blank=True, verbose_name='Ошибка')
+    started_at = models.DateTimeField(verbose_name='Начало')
+    ended_at = models.DateTimeField(verbose_name='Окончание')
+    samples = models.PositiveIntegerField(default=1, verbose_name='Опросов')
+
+    class Meta:
+        ordering = ('-started_at',)
+        indexes = (
+            models.Index(fields=('host', 'started_at')),
+            models.Index(fields=('ended_at',)),
+        )
+        verbose_name = 'статус сервера'
+        verbose_name_plural = 'История статусов серверов'
+
+    def __str__(self):
+        return f'{self.host}: {self.get_state_display()} с {self.started_at:%Y-%m-%d %H:%M}'
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from core.history import status_history
+from core.host_cache import host_cache
+from core.metrics import poll_errors, poll_tick_seconds
+from core.models import SSHHost
+from core.redis_client import acquire_lock, get_redis, release_lock
+from core.status import diff_status, get_docker_compose_status
+
+logger = logging.getLogger("core.poller")
+
+
+def host_group_name(host_id):
+    return f"host_{host_id}"
+
+
+def poller_lock_key(host_id):
+    return f"monitor:poller:{host_id}"
+
+
+def status_snapshot_key(host_id):
+    return f"monitor:status:{host_id}"
+
+
+HEARTBEAT_FRAME = json.dumps({"type": "heartbeat"})
+
+
+async def get_status_snapshot(host_id):
+    """Последний известный статус хоста для только что подключившегося клиента"""
+    try:
+        raw = await get_redis().get(status_snapshot_key(host_id))
+    except Exception as e:
+        logger.warning("poller: snapshot read error for host_id=%s: %s", host_id, e)
+        return None
+    return json.loads(raw) if raw else None
+
+
+class HostPollerRegistry:
+    """Один опрос docker compose на хост, сколько бы вкладок его ни смотрели.
+
+    В каждом воркере, где есть подписчики хоста, крутится задача опроса,
+    но SSH-запросы выполняет только владелец блокировки в Redis; результат
+    рассылается через группу channel layer всем воркерам. Если владелец
+    теряет подписчиков, блокировка истекает и опрос подхватывает другой воркер.
+
+    В группу уходят только изменившиеся поля статуса, в остальные тики -
+    heartbeat. Полный статус хранится в Redis и отдаётся при подключении.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or settings.HOST_POLL_INTERVAL
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}"
+        self._subscribers = {}
+        self._tasks = {}
+        self._last = {}
+
+    def subscribe(self, host_id):
+        self._subscribers[host_id] = self._subscribers.get(host_id, 0) + 1
+        task = self._tasks.get(host_id)
+        if task is None or task.done():
+            logger.debug("poller: starting for host_id=%s", host_id)
+            self._tasks[host_id] = asyncio.create_task(self._run(host_id))
+
+    async def unsubscribe(self, host_id):
+        count = self._subscribers.get(host_id, 0) - 1
+        if count > 0:
+            self._subscribers[host_id] = count
+            return
+        self._subscribers.pop(host_id, None)
+        task = self._tasks.pop(host_id, None)
+        if task is not None and not task.done():
+            logger.debug("poller: stopping for host_id=%s", host_id)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self, host_id):
+        loop = asyncio.get_running_loop()
+        channel_layer = get_channel_layer()
+        lock_key = poller_lock_key(host_id)
+        ttl_ms = int(self.interval * 3 * 1000)
+        is_leader = False
+        try:
+            while True:
+                started = loop.time()
+                try:
+                    is_leader = await acquire_lock(lock_key, self.token, ttl_ms)
+                except Exception as e:
+                    logger.warning("poller: lock error for host_id=%s: %s", host_id, e)
+                    is_leader = False
+
+                if is_leader:
+                    with poll_tick_seconds.time(host_id=host_id):
+                        payload = await self.poll(host_id)
+                    if "error" in payload:
+                        poll_errors.inc(host_id=host_id)
+                    await status_history.record(host_id, payload)
+                    frame = await self.make_frame(host_id, payload)
+                    await channel_layer.group_send(
+                        host_group_name(host_id),
+                        {"type": "host.status", "host_id": host_id, "text": frame},
+                    )
+                else:
+                    self._last.pop(host_id, None)
+                    await status_history.forget(host_id)
+
+                await asyncio.sleep(max(0, self.interval - (loop.time() - started)))
+        finally:
+            self._last.pop(host_id, None)
+            await asyncio.shield(status_history.forget(host_id))
+            if is_leader:
+                await release_lock(lock_key, self.token)
+            logger.debug("poller: finished for host_id=%s", host_id)
+
+    async def make_frame(self, host_id, payload):
+        """Кодирует кадр для группы один раз на всех подписчиков"""
+        if "error" in payload:
+            # Ошибку рассылаем, когда она появилась или сменилась, а не каждый тик;
+            # после восстановления diff с ней отдаст клиентам весь статус
+            previous = self._last.get(host_id)
+            self._last[host_id] = payload
+            if previous is not None and previous.get("error") == payload["error"]:
+                return HEARTBEAT_FRAME
+            return json.dumps(payload)
+
+        if host_id not in self._last:
+            # Только что стали владельцем: сравниваем с тем, что видели клиенты
+            self._last[host_id] = await get_status_snapshot(host_id)
+        changes = diff_status(self._last[host_id], payload)
+        self._last[host_id] = payload
+        try:
+            # Перезаписываем каждый тик, чтобы снимок жил, пока жив опрос
+            await get_redis().set(
+                status_snapshot_key(host_id),
+                json.dumps(payload),
+                ex=int(self.interval * 3),
+            )
+        except Exception as e:
+            logger.warning("poller: snapshot write error for host_id=%s: %s", host_id, e)
+
+        if not changes:
+            return HEARTBEAT_FRAME
+        return json.dumps({"type": "delta", **changes})
+
+    async def poll(self, host_id):
+        try:
+            ssh_host = await host_cache.aget(host_id)
+            result = await get_docker_compose_status(
+                ssh_host,
+                username=os.getenv("SSH_USERNAME"),
+                password=os.getenv("SSH_PASSWORD"),
+            )
+            logger.debug("poller: docker status for host_id=%s: %r", host_id, result)
+            if result.get("error"):
+                # SSH или docker compose ls не ответили - хост недоступен
+                return {"error": result["error"]}
+            return {
+                "config_status": result.get("config_status"),
+                "last_update": ssh_host.last_update.isoformat()
+                if ssh_host.last_update
+                else None,
+                "last_commit": ssh_host.last_commit.isoformat()
+                if ssh_host.last_commit
+                else None,
+                "commitHash": ssh_host.commit if ssh_host.commit else None,
+            }
+        except SSHHost.DoesNotExist:
+            logger.warning("poller: SSHHost %s not found", host_id)
+            return {"error": "SSH host not found"}
+        except Exception as e:
+            logger.exception("poller: error for host_id=%s: %s", host_id, e)
+            return {"error": f"Internal error: {str(e)}"}
+
+
+host_pollers = HostPollerRegistry()
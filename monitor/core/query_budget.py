@@ -0,0 +1,89 @@
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger("core.query_budget")
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Запросов к БД больше, чем записано в бюджете"""
+
+    def __init__(self, name, budget, queries):
+        self.name = name
+        self.budget = budget
+        self.queries = queries
+        listing = "\n".join(f"  {sql}" for sql in queries)
+        super().__init__(
+            f"{name}: {len(queries)} queries, budget is {budget}\n{listing}"
+        )
+
+
+class QueryCounter:
+    """execute_wrapper, который запоминает SQL каждого запроса"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+
+@contextmanager
+def count_queries(using=DEFAULT_DB_ALIAS):
+    """Считает запросы внутри блока, в том числе при DEBUG=False"""
+    counter = QueryCounter()
+    with connections[using].execute_wrapper(counter):
+        yield counter
+
+
+@contextmanager
+def query_budget(budget, name="block"):
+    """Для тестов: падает с QueryBudgetExceeded, если блок превысил бюджет.
+
+        with query_budget(3, "backlog list"):
+            client.get("/api/backlog/")
+    """
+    with count_queries() as counter:
+        yield counter
+    if counter.count > budget:
+        raise QueryBudgetExceeded(name, budget, counter.queries)
+
+
+class QueryBudgetMiddleware:
+    """Сверяет число запросов эндпоинта с QUERY_BUDGETS.
+
+    Ключ бюджета - метод и имя маршрута, например "GET api:backlog-list".
+    Подключается в settings только при DEBUG или QUERY_BUDGET_STRICT.
+
+    При QUERY_BUDGET_STRICT превышение - исключение (тесты и локальная
+    разработка падают на N+1), иначе - предупреждение в лог. Маршруты без
+    бюджета и потоковые ответы не проверяются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with count_queries() as counter:
+            response = self.get_response(request)
+
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            return response
+        key = f"{request.method} {match.view_name}"
+        budget = settings.QUERY_BUDGETS.get(key)
+        if budget is None or response.streaming or counter.count <= budget:
+            return response
+
+        error = QueryBudgetExceeded(key, budget, counter.queries)
+        if settings.QUERY_BUDGET_STRICT:
+            raise error
+        logger.warning("%s", error)
+        return response
@@ -0,0 +1,47 @@
+import logging
+
+import redis.asyncio as aioredis
+from django.conf import settings
+
+logger = logging.getLogger("core.redis_client")
+
+_client = None
+
+# Атомарное продление блокировки только её владельцем
+_RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def get_redis():
+    """Общий клиент локального Redis (того же, что и у CHANNEL_LAYERS)"""
+    global _client
+    if _client is None:
+        _client = aioredis.from_url(settings.LOCAL_REDIS_URL)
+    return _client
+
+
+async def acquire_lock(key, token, ttl_ms):
+    """Берёт или продлевает блокировку key для владельца token"""
+    r = get_redis()
+    if await r.set(key, token, nx=True, px=ttl_ms):
+        return True
+    return bool(await r.eval(_RENEW_SCRIPT, 1, key, token, ttl_ms))
+
+
+async def release_lock(key, token):
+    r = get_redis()
+    try:
+        await r.eval(_RELEASE_SCRIPT, 1, key, token)
+    except Exception as e:
+        logger.warning("release_lock %s failed: %s", key, e)
@@ -1,8 +1,11 @@
 from django.urls import path
 
 def get_ws_urlpatterns():
-    from core.consumers import MonitorConsumer
+    from core.consumers import MonitorConsumer, MultiplexConsumer
+    from messages_code.consumers import MessagesCodeRunConsumer
     return [
+        path('ws/core/', MultiplexConsumer.as_asgi()),
         path('ws/core/<int:host_id>/', MonitorConsumer.as_asgi()),
+        path('ws/messagecode/runs/<int:run_id>/', MessagesCodeRunConsumer.as_asgi()),
         
     ]
@@ -1,8 +1,32 @@
 from rest_framework import serializers
 
-from core.models import SSHHost
+from core.models import HostJob, HostStatusSample, SSHHost
 
 class SSHHostSerializer(serializers.ModelSerializer):
     class Meta:
         model = SSHHost
         fields = ['id', 'name', 'host', 'last_update', 'last_commit', 'commit']
+
+
+class HostJobSerializer(serializers.ModelSerializer):
+    created_by = serializers.SlugRelatedField(slug_field='username', read_only=True)
+
+    class Meta:
+        model = HostJob
+        fields = [
+            'id', 'host', 'action', 'status', 'message', 'output', 'error',
+            'created_by', 'created_at', 'started_at', 'finished_at'
+        ]
+        read_only_fields = [
+            'host', 'status', 'message', 'output', 'error',
+            'created_by', 'created_at', 'started_at', 'finished_at'
+        ]
+
+
+class HostStatusSampleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = HostStatusSample
+        fields = [
+            'state', 'config_status', 'commit', 'error',
+            'started_at', 'ended_at', 'samples'
+        ]
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.host_cache import invalidate_host
+from core.models import SSHHost
+
+
+@receiver((post_save, post_delete), sender=SSHHost)
+def sshhost_changed(sender, instance, **kwargs):
+    invalidate_host(instance.pk)
@@ -0,0 +1,205 @@
+import asyncio
+import asyncssh
+import logging
+import time
+from contextlib import asynccontextmanager
+
+from core.constants import (
+    SSH_CONNECT_TIMEOUT,
+    SSH_KEEPALIVE_COUNT_MAX,
+    SSH_KEEPALIVE_INTERVAL,
+    SSH_POOL_BACKOFF_BASE,
+    SSH_POOL_BACKOFF_MAX,
+    SSH_POOL_IDLE_TIMEOUT,
+    SSH_POOL_REAP_INTERVAL,
+)
+from core.metrics import ssh_connect_failures, ssh_connect_seconds
+
+logger = logging.getLogger("core.ssh_pool")
+
+
+class SSHHostUnavailable(ConnectionError):
+    """Хост недоступен, повторное подключение отложено (backoff)"""
+
+
+class _PooledConnection:
+    def __init__(self):
+        self.conn = None
+        self.loop = None
+        self.lock = asyncio.Lock()
+        self.in_use = 0
+        self.last_used = time.monotonic()
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_error = None
+
+    def is_alive(self):
+        return self.conn is not None and not self.conn.is_closed()
+
+
+class SSHConnectionPool:
+    """Пул долгоживущих SSH-соединений, по одному на (host, port, username).
+
+    SSH мультиплексирует каналы, поэтому одно соединение одновременно
+    используется всеми, кто его взял: каждый вызов conn.run открывает
+    отдельный канал. Мёртвые соединения пересоздаются при следующем
+    запросе, неиспользуемые закрываются по таймауту простоя.
+    """
+
+    def __init__(
+        self,
+        idle_timeout=SSH_POOL_IDLE_TIMEOUT,
+        reap_interval=SSH_POOL_REAP_INTERVAL,
+        backoff_base=SSH_POOL_BACKOFF_BASE,
+        backoff_max=SSH_POOL_BACKOFF_MAX,
+    ):
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._entries = {}
+        self._reaper = None
+
+    @staticmethod
+    def make_key(ssh_host, username):
+        return (ssh_host.host, ssh_host.port, username)
+
+    @asynccontextmanager
+    async def connection(self, ssh_host, username, password):
+        """Выдаёт соединение с хостом на время блока async with"""
+        loop = asyncio.get_running_loop()
+        key = self.make_key(ssh_host, username)
+        entry = self._entries.get(key)
+        if entry is not None and entry.loop is not None and entry.loop is not loop:
+            # Соединения asyncssh привязаны к своему event loop: вызов из
+            # чужого цикла (async_to_sync в другом потоке) обслуживаем без пула
+            logger.debug("ssh_pool: foreign loop for %s, using one-off connection", key)
+            async with self._connect(ssh_host, username, password) as conn:
+                yield conn
+            return
+
+        entry = await self._acquire(key, ssh_host, username, password, loop)
+        try:
+            yield entry.conn
+        finally:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+
+    async def _acquire(self, key, ssh_host, username, password, loop):
+        entry = self._entries.setdefault(key, _PooledConnection())
+        async with entry.lock:
+            if not entry.is_alive():
+                now = time.monotonic()
+                if now < entry.retry_at:
+                    raise SSHHostUnavailable(
+                        f"{ssh_host.host}:{ssh_host.port} недоступен, "
+                        f"повтор через {entry.retry_at - now:.0f} с: {entry.last_error}"
+                    )
+                await self._open(entry, key, ssh_host, username, password, loop)
+            entry.in_use += 1
+            entry.last_used = time.monotonic()
+        self._ensure_reaper()
+        return entry
+
+    async def _open(self, entry, key, ssh_host, username, password, loop):
+        if entry.conn is not None:
+            entry.conn.close()
+            entry.conn = None
+        started = time.monotonic()
+        try:
+            entry.conn = await asyncssh.connect(
+                host=ssh_host.host,
+                port=ssh_host.port,
+                username=username,
+                password=password,
+                known_hosts=None,
+                connect_timeout=SSH_CONNECT_TIMEOUT,
+                keepalive_interval=SSH_KEEPALIVE_INTERVAL,
+                keepalive_count_max=SSH_KEEPALIVE_COUNT_MAX,
+            )
+        except Exception as e:
+            ssh_connect_failures.inc(host=ssh_host.host)
+            entry.failures += 1
+            delay = min(self.backoff_base * 2 ** (entry.failures - 1), self.backoff_max)
+            entry.retry_at = time.monotonic() + delay
+            entry.last_error = str(e)
+            logger.warning(
+                "ssh_pool: connect to %s failed (%s attempt), backoff %ss: %s",
+                key,
+                entry.failures,
+                delay,
+                e,
+            )
+            raise
+        ssh_connect_seconds.observe(time.monotonic() - started, host=ssh_host.host)
+        entry.loop = loop
+        entry.failures = 0
+        entry.retry_at = 0.0
+        entry.last_error = None
+        logger.debug(
+            "ssh_pool: connected to %s in %.3fs", key, time.monotonic() - started
+        )
+
+    @asynccontextmanager
+    async def _connect(self, ssh_host, username, password):
+        started = time.monotonic()
+        try:
+            conn = await asyncssh.connect(
+                host=ssh_host.host,
+                port=ssh_host.port,
+                username=username,
+                password=password,
+                known_hosts=None,
+                connect_timeout=SSH_CONNECT_TIMEOUT,
+            )
+        except Exception:
+            ssh_connect_failures.inc(host=ssh_host.host)
+            raise
+        ssh_connect_seconds.observe(time.monotonic() - started, host=ssh_host.host)
+        async with conn:
+            yield conn
+
+    def _ensure_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_loop())
+
+    async def _reap_loop(self):
+        while self._entries:
+            await asyncio.sleep(self.reap_interval)
+            self.evict_idle()
+        logger.debug("ssh_pool: reaper stopped, pool is empty")
+
+    def evict_idle(self):
+        """Закрывает соединения, простаивающие дольше idle_timeout"""
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if entry.in_use or entry.lock.locked():
+                continue
+            idle = now - entry.last_used
+            if entry.conn is not None and not entry.is_alive():
+                logger.debug("ssh_pool: dropping dead connection %s", key)
+                entry.conn = None
+            if idle < self.idle_timeout:
+                continue
+            if entry.conn is not None:
+                logger.debug("ssh_pool: closing idle connection %s (%.0fs)", key, idle)
+                entry.conn.close()
+            del self._entries[key]
+
+    def invalidate(self, ssh_host, username):
+        """Закрывает соединение с хостом, например после смены адреса"""
+        entry = self._entries.pop(self.make_key(ssh_host, username), None)
+        if entry is not None and entry.conn is not None:
+            entry.conn.close()
+
+    async def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+        entries, self._entries = self._entries, {}
+        for entry in entries.values():
+            if entry.conn is not None:
+                entry.conn.close()
+                await entry.conn.wait_closed()
+
+
+ssh_pool = SSHConnectionPool()
@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+
+from core.constants import (
+    CONFIG_STATUS_NO_PROJECT,
+    CONFIG_STATUS_PROD,
+    CONFIG_STATUS_TEST,
+    CONFIG_STATUS_UNDEFINED,
+)
+from core.ssh_pool import ssh_pool
+
+logger = logging.getLogger("core.status")
+
+
+def check_configuration(config_files, ssh_host):
+    logger.debug(
+        "check_configuration: config_files=%r, docker_base=%r, docker_prod=%r",
+        config_files,
+        ssh_host.docker_base,
+        ssh_host.docker_prod,
+    )
+    if not config_files:
+        return CONFIG_STATUS_UNDEFINED
+
+    for config_file in config_files.split(","):
+        filename = os.path.basename(config_file.strip())
+        if ssh_host.docker_base and ssh_host.docker_base == filename:
+            return CONFIG_STATUS_TEST
+        if ssh_host.docker_prod and ssh_host.docker_prod == filename:
+            return CONFIG_STATUS_PROD
+
+    first = os.path.basename(config_files.split(",")[0].strip())
+    return f"Используется другая конфигурация: {first}"
+
+
+async def get_docker_compose_status(ssh_host, username, password):
+    logger.debug(
+        "get_docker_compose_status: connecting to %s:%s as %s",
+        ssh_host.host,
+        ssh_host.port,
+        username,
+    )
+    try:
+        async with ssh_pool.connection(ssh_host, username, password) as conn:
+            compose_ls = await conn.run(
+                "docker compose ls --format json", check=False
+            )
+            logger.debug(
+                "docker compose ls: exit=%s stdout=%r stderr=%r",
+                compose_ls.exit_status,
+                compose_ls.stdout,
+                compose_ls.stderr,
+            )
+
+            if compose_ls.stderr:
+                return {
+                    "error": f"Ошибка при получении списка проектов: {compose_ls.stderr}",
+                    "current_config": None,
+                    "config_status": None,
+                }
+
+            try:
+                projects = json.loads(compose_ls.stdout)
+                logger.debug("Parsed projects: %r", projects)
+                common_project = next(
+                    (p for p in projects if p.get("Name") == "common"), None
+                )
+                if not common_project:
+                    logger.info("docker compose: project 'common' not found")
+                    return {
+                        "current_config": None,
+                        "config_status": CONFIG_STATUS_NO_PROJECT,
+                    }
+
+                config_files = common_project.get("ConfigFiles")
+                status = check_configuration(config_files, ssh_host)
+                logger.debug(
+                    "common project config_files=%r, config_status=%s",
+                    config_files,
+                    status,
+                )
+                return {
+                    "current_config": config_files,
+                    "config_status": status,
+                }
+            except json.JSONDecodeError as e:
+                logger.error("JSON decode error for docker compose ls: %s", e)
+                return {
+                    "error": "Не удалось разобрать вывод docker compose",
+                    "current_config": None,
+                    "config_status": None,
+                }
+    except Exception as e:
+        logger.error("SSH connection error in get_docker_compose_status: %s", e)
+        return {
+            "error": f"Ошибка подключения: {str(e)}",
+            "current_config": None,
+            "config_status": None,
+        }
+
+
+STATUS_FIELDS = ("config_status", "last_update", "last_commit", "commitHash")
+
+
+def diff_status(previous, current):
+    """Возвращает только изменившиеся поля статуса (всё, если предыдущего нет)"""
+    if previous is None:
+        return {field: current.get(field) for field in STATUS_FIELDS}
+    return {
+        field: current.get(field)
+        for field in STATUS_FIELDS
+        if previous.get(field) != current.get(field)
+    }
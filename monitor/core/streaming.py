@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from collections import deque, namedtuple
+
+from core.constants import (
+    OUTPUT_BATCH_LINES,
+    OUTPUT_FLUSH_INTERVAL,
+    OUTPUT_MAX_LINE_LENGTH,
+    OUTPUT_TAIL_LINES,
+)
+
+logger = logging.getLogger("core.streaming")
+
+StreamResult = namedtuple("StreamResult", ("exit_status", "stdout", "stderr"))
+
+
+async def stream_command(conn, command, send_lines, input=None):
+    """Выполняет команду, отправляя вывод пачками строк по мере поступления.
+
+    send_lines(lines) вызывается не реже раза в OUTPUT_FLUSH_INTERVAL секунд
+    или по накоплении OUTPUT_BATCH_LINES строк. Пока отправка не завершилась,
+    чтение из SSH-канала приостанавливается, а в памяти остаются только
+    последние OUTPUT_TAIL_LINES строк каждого потока - их и возвращаем,
+    с тем же интерфейсом, что у результата conn.run.
+    """
+    pending = []
+    send_lock = asyncio.Lock()
+    stdout_tail = deque(maxlen=OUTPUT_TAIL_LINES)
+    stderr_tail = deque(maxlen=OUTPUT_TAIL_LINES)
+
+    async def flush():
+        async with send_lock:
+            if not pending:
+                return
+            batch = pending[:]
+            pending.clear()
+            await send_lines(batch)
+
+    async def pump(reader, stream_name, tail):
+        async for line in reader:
+            line = line.rstrip("\n")[:OUTPUT_MAX_LINE_LENGTH]
+            tail.append(line)
+            pending.append({"stream": stream_name, "line": line})
+            if len(pending) >= OUTPUT_BATCH_LINES:
+                await flush()
+
+    async def ticker():
+        while True:
+            await asyncio.sleep(OUTPUT_FLUSH_INTERVAL)
+            await flush()
+
+    process = await conn.create_process(command, input=input)
+    flusher = asyncio.create_task(ticker())
+    try:
+        await asyncio.gather(
+            pump(process.stdout, "stdout", stdout_tail),
+            pump(process.stderr, "stderr", stderr_tail),
+        )
+        completed = await process.wait()
+    finally:
+        flusher.cancel()
+        process.close()
+    await flush()
+
+    logger.debug(
+        "stream_command: %r exit=%s", command, completed.exit_status
+    )
+    return StreamResult(
+        completed.exit_status,
+        "\n".join(stdout_tail),
+        "\n".join(stderr_tail),
+    )
@@ -0,0 +1,59 @@
+import asyncio
+import logging
+import os
+import time
+
+from django.conf import settings
+
+from core.models import SSHHost
+from core.status import get_docker_compose_status
+
+logger = logging.getLogger("core.sweep")
+
+
+async def sweep_hosts(hosts=None, concurrency=None, timeout=None):
+    """Опрашивает хосты параллельно и отдаёт статусы по мере готовности.
+
+    Не больше concurrency одновременных SSH-запросов; хост, не ответивший
+    за timeout секунд, возвращается с ошибкой и не задерживает остальные.
+    """
+    concurrency = concurrency or settings.HOST_SWEEP_CONCURRENCY
+    timeout = timeout or settings.HOST_SWEEP_TIMEOUT
+    if hosts is None:
+        hosts = [host async for host in SSHHost.objects.all()]
+
+    semaphore = asyncio.Semaphore(concurrency)
+    username = os.getenv("SSH_USERNAME")
+    password = os.getenv("SSH_PASSWORD")
+
+    async def check(ssh_host):
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(
+                    get_docker_compose_status(ssh_host, username, password), timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning("sweep: host %s timed out after %ss", ssh_host.host, timeout)
+                result = {
+                    "error": f"Хост не ответил за {timeout} с",
+                    "current_config": None,
+                    "config_status": None,
+                }
+            return {
+                "id": ssh_host.pk,
+                "name": ssh_host.name,
+                "config_status": result.get("config_status"),
+                "current_config": result.get("current_config"),
+                "error": result.get("error"),
+                "elapsed_ms": int((time.monotonic() - started) * 1000),
+            }
+
+    tasks = [asyncio.ensure_future(check(ssh_host)) for ssh_host in hosts]
+    try:
+        for future in asyncio.as_completed(tasks):
+            yield await future
+    finally:
+        # Клиент ушёл посреди потока - не оставляем висящие SSH-запросы
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,72 @@
+import asyncio
+import json
+from unittest import mock
+
+from django.test import TestCase
+
+from core.constants import HOST_STATE_UNAVAILABLE
+from core.history import StatusHistoryRecorder
+from core.metrics import poll_errors
+from core.models import HostStatusSample, SSHHost
+from core.poller import HEARTBEAT_FRAME, HostPollerRegistry
+from core.ssh_pool import SSHConnectionPool
+
+
+class UnreachableHostTests(TestCase):
+    """Опрос хоста, до которого не достучаться по SSH"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.host = SSHHost.objects.create(
+            name='down', host='10.0.0.1', docker_base='base', docker_prod='prod'
+        )
+
+    def setUp(self):
+        self.pollers = HostPollerRegistry(interval=5)
+        self.history = StatusHistoryRecorder(interval=5, flush_interval=60)
+        patches = [
+            mock.patch('core.poller.host_cache.aget', mock.AsyncMock(return_value=self.host)),
+            # Свой пул, чтобы backoff от прошлых тестов не подменял ошибку
+            mock.patch('core.status.ssh_pool', SSHConnectionPool()),
+            mock.patch('core.ssh_pool.asyncssh.connect', side_effect=OSError('connection refused')),
+            mock.patch('core.ssh_pool.logger'),
+            mock.patch('core.status.logger'),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    async def test_ssh_failure_is_recorded_as_unavailable(self):
+        payload = await self.pollers.poll(self.host.pk)
+        self.assertIn('connection refused', payload['error'])
+
+        await self.history.record(self.host.pk, payload)
+
+        sample = await HostStatusSample.objects.aget(host=self.host)
+        self.assertEqual(sample.state, HOST_STATE_UNAVAILABLE)
+        self.assertIn('connection refused', sample.error)
+
+    async def test_same_error_is_sent_once(self):
+        payload = await self.pollers.poll(self.host.pk)
+
+        first = await self.pollers.make_frame(self.host.pk, payload)
+        second = await self.pollers.make_frame(self.host.pk, payload)
+
+        self.assertEqual(json.loads(first), payload)
+        self.assertEqual(second, HEARTBEAT_FRAME)
+
+    async def test_ssh_failure_counts_as_poll_error(self):
+        sent = asyncio.Event()
+        channel_layer = mock.Mock(group_send=mock.AsyncMock(side_effect=lambda *args: sent.set()))
+        before = poll_errors._values.get((str(self.host.pk),), 0)
+
+        with mock.patch('core.poller.acquire_lock', mock.AsyncMock(return_value=True)), \
+                mock.patch('core.poller.release_lock', mock.AsyncMock()), \
+                mock.patch('core.poller.get_channel_layer', return_value=channel_layer), \
+                mock.patch('core.poller.status_history', self.history):
+            task = asyncio.create_task(self.pollers._run(self.host.pk))
+            await asyncio.wait_for(sent.wait(), 5)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        self.assertEqual(poll_errors._values[(str(self.host.pk),)], before + 1)
@@ -0,0 +1,36 @@
+"""JWT-аутентификация веб-сокетов.
+
+Браузер не передаёт заголовок Authorization при открытии сокета, поэтому
+access-токен simplejwt принимается в строке запроса: /ws/...?token=<jwt>.
+Без токена остаётся пользователь сессии из AuthMiddlewareStack, с
+неверным или просроченным токеном - анонимный пользователь.
+"""
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+TOKEN_PARAM = "token"
+
+
+@database_sync_to_async
+def get_jwt_user(raw_token):
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(authentication.get_validated_token(raw_token))
+    except AuthenticationFailed:
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Ставит scope["user"] по токену из строки запроса"""
+
+    async def __call__(self, scope, receive, send):
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        token = query.get(TOKEN_PARAM)
+        if token:
+            scope = dict(scope, user=await get_jwt_user(token[0]))
+        return await super().__call__(scope, receive, send)
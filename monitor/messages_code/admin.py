@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from messages_code.models import MessagesCode
+from messages_code.models import MessagesCode, MessagesCodeRun
 
 
 @admin.register(MessagesCode)
@@ -21,3 +21,21 @@ class MessagesCodeAdmin(admin.ModelAdmin):
         'name',
         'user'
     )
+
+
+@admin.register(MessagesCodeRun)
+class MessagesCodeRunAdmin(admin.ModelAdmin):
+    list_display = (
+        'code',
+        'user',
+        'status',
+        'elapsed',
+        'created_at',
+        'finished_at'
+    )
+    list_filter = (
+        'status',
+    )
+    raw_id_fields = (
+        'code',
+    )
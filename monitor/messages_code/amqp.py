@@ -0,0 +1,208 @@
+"""Минимальный клиент AMQP 0-9-1 только для публикации с подтверждениями.
+
+Поддерживает ровно то, что нужно публикатору: вход PLAIN, один канал,
+confirm.select, basic.publish и разбор basic.ack / basic.nack. Пачка
+сообщений уходит одним sendall, затем ждём подтверждений всей пачки -
+вместо ожидания брокера после каждого сообщения.
+"""
+import socket
+import struct
+
+FRAME_METHOD = 1
+FRAME_HEADER = 2
+FRAME_BODY = 3
+FRAME_HEARTBEAT = 8
+FRAME_END = b'\xce'
+
+PROTOCOL_HEADER = b'AMQP\x00\x00\x09\x01'
+
+CONNECTION_START = (10, 10)
+CONNECTION_START_OK = (10, 11)
+CONNECTION_TUNE = (10, 30)
+CONNECTION_TUNE_OK = (10, 31)
+CONNECTION_OPEN = (10, 40)
+CONNECTION_OPEN_OK = (10, 41)
+CONNECTION_CLOSE = (10, 50)
+CONNECTION_CLOSE_OK = (10, 51)
+CHANNEL_OPEN = (20, 10)
+CHANNEL_OPEN_OK = (20, 11)
+CHANNEL_CLOSE = (20, 40)
+CONFIRM_SELECT = (85, 10)
+CONFIRM_SELECT_OK = (85, 11)
+BASIC_PUBLISH = (60, 40)
+BASIC_ACK = (60, 80)
+BASIC_NACK = (60, 120)
+
+BASIC_CLASS = 60
+FLAG_CONTENT_TYPE = 0x8000
+FLAG_DELIVERY_MODE = 0x1000
+DELIVERY_PERSISTENT = 2
+
+CHANNEL = 1
+
+
+class AMQPError(Exception):
+    """Брокер закрыл соединение или канал, либо ответил не по протоколу"""
+
+
+def _shortstr(value):
+    data = value.encode('utf-8')
+    return struct.pack('B', len(data)) + data
+
+
+def _longstr(value):
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return struct.pack('>I', len(value)) + value
+
+
+def _table(values):
+    payload = b''.join(_shortstr(key) + b'S' + _longstr(value) for key, value in values.items())
+    return struct.pack('>I', len(payload)) + payload
+
+
+def _frame(frame_type, channel, payload):
+    return struct.pack('>BHI', frame_type, channel, len(payload)) + payload + FRAME_END
+
+
+def _method(channel, method, args=b''):
+    return _frame(FRAME_METHOD, channel, struct.pack('>HH', *method) + args)
+
+
+class Connection:
+    """Соединение с брокером с открытым каналом в режиме подтверждений"""
+
+    def __init__(self, host, port=5672, user='guest', password='guest', vhost='/', timeout=10):
+        self.host = host
+        self.frame_max = 131072
+        self.delivery_tag = 0
+        # Сколько подтверждений (ack и nack) пришло за время жизни соединения
+        self.settled = 0
+        self._buffer = bytearray()
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            self._handshake(user, password, vhost)
+        except Exception:
+            self.sock.close()
+            raise
+
+    def _handshake(self, user, password, vhost):
+        self.sock.sendall(PROTOCOL_HEADER)
+        self._expect(CONNECTION_START)
+        self.sock.sendall(_method(0, CONNECTION_START_OK, (
+            _table({'product': 'monitor', 'platform': 'python'})
+            + _shortstr('PLAIN')
+            + _longstr(f'\0{user}\0{password}')
+            + _shortstr('en_US')
+        )))
+        _, args = self._expect(CONNECTION_TUNE)
+        channel_max, frame_max, _ = struct.unpack('>HIH', args[:8])
+        if frame_max:
+            self.frame_max = min(self.frame_max, frame_max)
+        # Heartbeat выключен: простаивающие соединения пул закрывает сам
+        self.sock.sendall(
+            _method(0, CONNECTION_TUNE_OK, struct.pack('>HIH', channel_max, self.frame_max, 0))
+            + _method(0, CONNECTION_OPEN, _shortstr(vhost) + _shortstr('') + b'\x00')
+        )
+        self._expect(CONNECTION_OPEN_OK)
+        self.sock.sendall(
+            _method(CHANNEL, CHANNEL_OPEN, _shortstr(''))
+            + _method(CHANNEL, CONFIRM_SELECT, b'\x00')
+        )
+        self._expect(CHANNEL_OPEN_OK)
+        self._expect(CONFIRM_SELECT_OK)
+
+    def _recv_exact(self, size):
+        while len(self._buffer) < size:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise AMQPError(f'{self.host}: соединение закрыто брокером')
+            self._buffer.extend(chunk)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def _read_frame(self):
+        frame_type, channel, size = struct.unpack('>BHI', self._recv_exact(7))
+        payload = self._recv_exact(size + 1)[:-1]
+        return frame_type, channel, payload
+
+    def _read_method(self):
+        """Следующий метод от брокера; heartbeat пропускаем, close - ошибка"""
+        while True:
+            frame_type, _, payload = self._read_frame()
+            if frame_type != FRAME_METHOD:
+                continue
+            method = struct.unpack('>HH', payload[:4])
+            args = payload[4:]
+            if method in (CONNECTION_CLOSE, CHANNEL_CLOSE):
+                code = struct.unpack('>H', args[:2])[0]
+                text = args[3:3 + args[2]].decode('utf-8', 'replace')
+                if method == CONNECTION_CLOSE:
+                    self.sock.sendall(_method(0, CONNECTION_CLOSE_OK))
+                raise AMQPError(f'{self.host}: {code} {text}')
+            return method, args
+
+    def _expect(self, expected):
+        method, args = self._read_method()
+        if method != expected:
+            raise AMQPError(f'{self.host}: ожидался метод {expected}, получен {method}')
+        return method, args
+
+    def publish_batch(self, exchange, routing_key, bodies, content_type=None, persistent=True):
+        """Публикует пачку и ждёт подтверждений: возвращает (подтверждено, отклонено)"""
+        flags = FLAG_DELIVERY_MODE if persistent else 0
+        properties = b''
+        if content_type:
+            flags |= FLAG_CONTENT_TYPE
+            properties += _shortstr(content_type)
+        if persistent:
+            properties += struct.pack('B', DELIVERY_PERSISTENT)
+        publish = _method(
+            CHANNEL, BASIC_PUBLISH,
+            struct.pack('>H', 0) + _shortstr(exchange) + _shortstr(routing_key) + b'\x00'
+        )
+        chunk_size = self.frame_max - 8
+
+        frames = []
+        for body in bodies:
+            frames.append(publish)
+            frames.append(_frame(
+                FRAME_HEADER, CHANNEL,
+                struct.pack('>HHQH', BASIC_CLASS, 0, len(body), flags) + properties
+            ))
+            for start in range(0, len(body), chunk_size):
+                frames.append(_frame(FRAME_BODY, CHANNEL, body[start:start + chunk_size]))
+        first_tag = self.delivery_tag + 1
+        self.delivery_tag += len(bodies)
+        self.sock.sendall(b''.join(frames))
+
+        # Брокер подтверждает по тегам, multiple - все теги до указанного
+        outstanding = set(range(first_tag, self.delivery_tag + 1))
+        confirmed = nacked = 0
+        while outstanding:
+            method, args = self._read_method()
+            if method not in (BASIC_ACK, BASIC_NACK):
+                continue
+            tag, bits = struct.unpack('>QB', args[:9])
+            if bits & 1:
+                settled = {t for t in outstanding if t <= tag}
+            else:
+                settled = {tag} & outstanding
+            outstanding -= settled
+            self.settled += len(settled)
+            if method == BASIC_ACK:
+                confirmed += len(settled)
+            else:
+                nacked += len(settled)
+        return confirmed, nacked
+
+    def close(self):
+        try:
+            self.sock.sendall(_method(
+                0, CONNECTION_CLOSE, struct.pack('>H', 200) + _shortstr('') + struct.pack('>HH', 0, 0)
+            ))
+        except OSError:
+            pass
+        self.sock.close()
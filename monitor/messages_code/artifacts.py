@@ -0,0 +1,158 @@
+"""Хранилище артефактов для скриптов MessagesCode.
+
+Артефакт - именованная последовательность записей (пачка сообщений) в
+Redis: список с записями в JSON и хеш со состоянием. input-код пишет
+записи по мере генерации, 10messages-код читает их потоком, не дожидаясь
+конца записи. Ключи разделены по пользователю, поэтому одноимённые коды
+разных пользователей не мешают друг другу.
+
+Модуль без Django: используется в процессах пула исполнителей.
+"""
+import json
+import time
+
+import redis
+
+STATE_OPEN = 'open'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+WRITE_BATCH = 500
+READ_BATCH = 500
+POLL_INTERVAL = 0.1
+MAX_NAME_LENGTH = 200
+
+_clients = {}
+
+
+class ArtifactError(Exception):
+    """Артефакт не найден или его запись завершилась ошибкой"""
+
+
+def _get_client(url):
+    client = _clients.get(url)
+    if client is None:
+        client = _clients[url] = redis.Redis.from_url(url)
+    return client
+
+
+class ArtifactWriter:
+    """Запись артефакта пачками по WRITE_BATCH записей.
+
+    Используется как контекстный менеджер: при выходе без ошибки артефакт
+    помечается завершённым, с ошибкой - сломанным, и читатели узнают об этом.
+    """
+
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.count = 0
+        self._pending = []
+        items, meta = store.keys(name)
+        pipe = store.client.pipeline()
+        pipe.delete(items)
+        pipe.hset(meta, mapping={'state': STATE_OPEN, 'count': 0})
+        pipe.expire(meta, store.ttl)
+        pipe.execute()
+
+    def write(self, record):
+        self._pending.append(json.dumps(record, ensure_ascii=False))
+        if len(self._pending) >= WRITE_BATCH:
+            self.flush()
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        if not self._pending:
+            return
+        items, meta = self.store.keys(self.name)
+        pipe = self.store.client.pipeline()
+        pipe.rpush(items, *self._pending)
+        pipe.hincrby(meta, 'count', len(self._pending))
+        pipe.expire(items, self.store.ttl)
+        pipe.expire(meta, self.store.ttl)
+        pipe.execute()
+        self.count += len(self._pending)
+        self._pending = []
+
+    def close(self, state=STATE_DONE):
+        if state == STATE_DONE:
+            self.flush()
+        self.store.client.hset(self.store.keys(self.name)[1], 'state', state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(STATE_DONE if exc_type is None else STATE_FAILED)
+        return False
+
+
+class ArtifactStore:
+    """API артефактов, доступное скрипту как artifacts"""
+
+    def __init__(self, url, namespace, ttl):
+        self.client = _get_client(url)
+        self.namespace = namespace
+        self.ttl = ttl
+
+    @classmethod
+    def from_config(cls, config, namespace):
+        if not config or namespace is None:
+            return None
+        return cls(config['url'], namespace, config['ttl'])
+
+    def keys(self, name):
+        if not isinstance(name, str) or not name or len(name) > MAX_NAME_LENGTH:
+            raise ArtifactError(f'Некорректное имя артефакта: {name!r}')
+        prefix = f'messages_code:artifact:{self.namespace}:{name}'
+        return f'{prefix}:items', f'{prefix}:meta'
+
+    def writer(self, name):
+        """Новый артефакт name (старый с тем же именем удаляется)"""
+        return ArtifactWriter(self, name)
+
+    def reader(self, name, wait=True):
+        """Записи артефакта по порядку.
+
+        Пока артефакт пишется, с wait=True ждём новых записей - так
+        10messages-код начинает отправку, не дожидаясь конца генерации.
+        """
+        items, meta = self.keys(name)
+        position = 0
+        while True:
+            state = self.client.hget(meta, 'state')
+            batch = self.client.lrange(items, position, position + READ_BATCH - 1)
+            if batch:
+                position += len(batch)
+                for raw in batch:
+                    yield json.loads(raw)
+                continue
+            if state is None:
+                raise ArtifactError(f'Артефакт {name} не найден')
+            state = state.decode()
+            if state == STATE_DONE:
+                return
+            if state == STATE_FAILED:
+                raise ArtifactError(f'Запись артефакта {name} завершилась ошибкой')
+            if not wait:
+                return
+            time.sleep(POLL_INTERVAL)
+
+    def read_all(self, name):
+        return list(self.reader(name))
+
+    def info(self, name):
+        """Состояние и число записей, None - если артефакта нет"""
+        meta = self.client.hgetall(self.keys(name)[1])
+        if not meta:
+            return None
+        return {'state': meta[b'state'].decode(), 'count': int(meta[b'count'])}
+
+    def exists(self, name):
+        return bool(self.client.exists(self.keys(name)[1]))
+
+    def delete(self, name):
+        self.client.delete(*self.keys(name))
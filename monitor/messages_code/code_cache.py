@@ -0,0 +1,63 @@
+"""LRU-кэш скомпилированных скриптов MessagesCode.
+
+Ключ - sha256 исходника и имя файла. Процесс API компилирует скрипт один
+раз (при сохранении или первом запуске) и отправляет воркеру пула
+marshal-представление кода с тем же ключом: воркер не компилирует, а
+только загружает его.
+
+Модуль без зависимостей от Django: он работает и в процессе API, и в
+каждом процессе пула исполнителей.
+"""
+import hashlib
+import marshal
+import threading
+from collections import OrderedDict
+
+DEFAULT_FILENAME = '<messages_code>'
+
+
+def source_hash(source):
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+class CodeCache:
+    """code-объекты по хешу исходника; при переполнении выбрасывается
+    давно не использованный"""
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._codes = OrderedDict()
+
+    def get(self, source, filename=DEFAULT_FILENAME, digest=None, compiled=None):
+        """Скомпилированный код; SyntaxError, если исходник некорректен.
+
+        compiled - marshal.dumps того же кода из другого процесса: при
+        промахе он загружается вместо компиляции.
+        """
+        key = (digest or source_hash(source), filename)
+        with self._lock:
+            code = self._codes.get(key)
+            if code is not None:
+                self._codes.move_to_end(key)
+                self.hits += 1
+                return code
+        if compiled is not None:
+            code = marshal.loads(compiled)
+        else:
+            code = compile(source, filename, 'exec')
+        with self._lock:
+            self.misses += 1
+            self._codes[key] = code
+            self._codes.move_to_end(key)
+            while len(self._codes) > self.maxsize:
+                self._codes.popitem(last=False)
+        return code
+
+    def __len__(self):
+        return len(self._codes)
+
+
+code_cache = CodeCache()
@@ -0,0 +1,52 @@
+import json
+import logging
+
+from channels.generic.websocket import AsyncWebsocketConsumer
+
+from messages_code.models import MessagesCodeRun
+from messages_code.runs import run_group_name, run_snapshot
+
+logger = logging.getLogger("messages_code.consumers")
+
+
+class MessagesCodeRunConsumer(AsyncWebsocketConsumer):
+    """Вывод и прогресс одного запуска кода сообщений.
+
+    Сначала подписываемся на группу, потом отправляем снимок из БД: кадры
+    вывода несут offset, и клиент отбрасывает то, что уже есть в снимке.
+    Клиенты API подключаются с JWT: ws/messagecode/runs/<id>/?token=<access>.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.run_id = None
+        self.group_name = None
+
+    async def connect(self):
+        self.run_id = self.scope["url_route"]["kwargs"]["run_id"]
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            await self.close()
+            return
+        await self.accept()
+
+        self.group_name = run_group_name(self.run_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        run = await self.get_run(user)
+        if run is None:
+            logger.warning("MessagesCodeRun %s not found on connect", self.run_id)
+            await self.send(text_data=json.dumps({"error": "Run not found"}))
+            await self.close()
+            return
+        await self.send(text_data=json.dumps(run_snapshot(run), ensure_ascii=False))
+
+    async def disconnect(self, close_code):
+        if self.group_name is not None:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+            self.group_name = None
+
+    async def code_run(self, event):
+        await self.send(text_data=event["text"])
+
+    async def get_run(self, user):
+        return await MessagesCodeRun.objects.filter(pk=self.run_id, code__user=user).afirst()
@@ -0,0 +1,225 @@
+import atexit
+import logging
+import marshal
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+
+from messages_code.code_cache import code_cache, source_hash
+from messages_code.sandbox import EVENT_OUTPUT, worker_main
+
+logger = logging.getLogger(__name__)
+
+ExecutionResult = namedtuple('ExecutionResult', ('ok', 'output', 'error', 'truncated', 'elapsed'))
+
+
+def broker_config():
+    """Настройки публикатора RabbitMQ: передаются в воркеры вместе с задачей"""
+    return {
+        'backend': settings.MESSAGES_CODE_RABBIT_BACKEND,
+        'port': settings.MESSAGES_CODE_RABBIT_PORT,
+        'user': settings.MESSAGES_CODE_RABBIT_USER,
+        'password': settings.MESSAGES_CODE_RABBIT_PASSWORD,
+        'vhost': settings.MESSAGES_CODE_RABBIT_VHOST,
+        'timeout': settings.MESSAGES_CODE_RABBIT_TIMEOUT,
+        'batch_size': settings.MESSAGES_CODE_RABBIT_BATCH_SIZE,
+        'rate': settings.MESSAGES_CODE_RABBIT_RATE,
+        'concurrency': settings.MESSAGES_CODE_RABBIT_CONCURRENCY,
+        'max_connections': settings.MESSAGES_CODE_RABBIT_MAX_CONNECTIONS,
+        'idle_timeout': settings.MESSAGES_CODE_RABBIT_IDLE_TIMEOUT,
+    }
+
+
+class SandboxBusy(Exception):
+    """Все воркеры заняты дольше MESSAGES_CODE_ACQUIRE_TIMEOUT"""
+
+
+class _Worker:
+    def __init__(self, ctx, memory_mb):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=worker_main,
+            args=(child_conn, memory_mb),
+            name='messages-code-sandbox',
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.run_id = None
+        self.cancelled = False
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+    def retire(self):
+        """Завершает воркер после чистого запуска, не дожидаясь выхода:
+        процесс закроет соединения с брокером и выйдет сам
+        """
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            self.process.kill()
+        self.conn.close()
+
+
+class SandboxPool:
+    """Пул заранее запущенных процессов для скриптов MessagesCode.
+
+    Скрипт выполняется не в воркере API, а в отдельном процессе с лимитами
+    процессорного времени (RLIMIT_CPU), памяти (RLIMIT_AS) и времени по
+    часам: зависший или отменённый скрипт убивается вместе с процессом.
+    stdout скрипта возвращается как вывод. Процессы стартуют через spawn,
+    чтобы не наследовать потоки и соединения воркера.
+
+    Каждый процесс выполняет один скрипт: после запуска он завершается, а
+    на его место сразу запускается новый. Так модули, файлы и потоки,
+    оставленные скриптом, не достаются следующему пользователю; пока
+    скрипт выполняется, замена предыдущего уже успевает загрузиться.
+    """
+
+    def __init__(self, size=None, memory_mb=None, cpu_seconds=None, wall_seconds=None):
+        self.size = size or settings.MESSAGES_CODE_WORKERS
+        self.memory_mb = memory_mb if memory_mb is not None else settings.MESSAGES_CODE_MEMORY_MB
+        self.cpu_seconds = cpu_seconds or settings.MESSAGES_CODE_CPU_SECONDS
+        self.wall_seconds = wall_seconds or settings.MESSAGES_CODE_WALL_SECONDS
+        self._ctx = multiprocessing.get_context('spawn')
+        # Кэш скомпилированных скриптов процесса API
+        code_cache.maxsize = settings.MESSAGES_CODE_CACHE_SIZE
+        self._lock = threading.Lock()
+        self._pid = None
+        self._idle = None
+        self._busy = {}
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # После fork пул родителя не наш - запускаем свой
+                self._idle = queue.Queue()
+                self._busy = {}
+                for _ in range(self.size):
+                    self._idle.put(_Worker(self._ctx, self.memory_mb))
+                self._pid = os.getpid()
+                logger.info('messages_code: started %s sandbox workers', self.size)
+
+    def _acquire(self, timeout):
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise SandboxBusy('Все исполнители заняты, попробуйте позже')
+        if not worker.process.is_alive():
+            worker.kill()
+            worker = _Worker(self._ctx, self.memory_mb)
+        return worker
+
+    def _release(self, worker, broken):
+        """Воркер после запуска не переиспользуется - в пул встаёт новый"""
+        with self._lock:
+            self._busy.pop(worker.run_id, None)
+        if broken:
+            worker.kill()
+        else:
+            worker.retire()
+        self._idle.put(_Worker(self._ctx, self.memory_mb))
+
+    def run(self, code, context, run_id=None, timeout=None, on_output=None):
+        """Выполняет скрипт и ждёт результата (блокирует вызывающий поток).
+
+        on_output(text), если передан, получает вывод скрипта по ходу
+        выполнения, в том же потоке; полный вывод всё равно будет в результате.
+
+        Скрипт компилируется здесь, через кэш процесса API, и уходит в
+        воркер marshal-представлением с ключом - хешем исходника.
+        """
+        self._ensure_started()
+        run_id = run_id or uuid.uuid4().hex
+        code_hash = source_hash(code)
+        try:
+            compiled = marshal.dumps(code_cache.get(code, context['code_name'], code_hash))
+        except (SyntaxError, ValueError):
+            # Ошибку покажет воркер, как и любую другую ошибку скрипта
+            compiled = None
+        worker = self._acquire(settings.MESSAGES_CODE_ACQUIRE_TIMEOUT)
+        worker.run_id = run_id
+        with self._lock:
+            self._busy[run_id] = worker
+
+        broken = True
+        try:
+            worker.conn.send({
+                'code': code,
+                'code_hash': code_hash,
+                'compiled': compiled,
+                'context': context,
+                'cpu_seconds': self.cpu_seconds,
+                'max_output': settings.MESSAGES_CODE_MAX_OUTPUT,
+                'stream': on_output is not None,
+                'artifacts': {
+                    'url': settings.MESSAGES_CODE_ARTIFACT_URL,
+                    'ttl': settings.MESSAGES_CODE_ARTIFACT_TTL,
+                },
+                'rabbit': broker_config(),
+            })
+            wall_seconds = timeout or self.wall_seconds
+            deadline = time.monotonic() + wall_seconds
+            while True:
+                left = deadline - time.monotonic()
+                if left <= 0 or not worker.conn.poll(left):
+                    logger.warning('messages_code: run %s exceeded %ss, killing worker', run_id, wall_seconds)
+                    return ExecutionResult(False, '', 'Превышен лимит времени выполнения', False, wall_seconds)
+                try:
+                    result = worker.conn.recv()
+                except (EOFError, OSError):
+                    if worker.cancelled:
+                        return ExecutionResult(False, '', 'Выполнение отменено', False, None)
+                    logger.error('messages_code: worker died during run %s', run_id)
+                    return ExecutionResult(False, '', 'Процесс исполнителя аварийно завершился', False, None)
+                if result.get('event') != EVENT_OUTPUT:
+                    break
+                if on_output is not None:
+                    on_output(result['text'])
+            broken = False
+            return ExecutionResult(
+                result['ok'], result['output'], result['error'], result['truncated'], result['elapsed']
+            )
+        finally:
+            self._release(worker, broken)
+
+    def cancel(self, run_id):
+        """Прерывает выполнение: процесс убивается, run() вернёт 'отменено'"""
+        with self._lock:
+            worker = self._busy.get(run_id)
+        if worker is None:
+            return False
+        worker.cancelled = True
+        worker.process.kill()
+        return True
+
+    def close(self):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            workers = list(self._busy.values())
+            while not self._idle.empty():
+                workers.append(self._idle.get_nowait())
+            for worker in workers:
+                try:
+                    worker.conn.send(None)
+                except (OSError, ValueError):
+                    pass
+                worker.kill()
+            self._pid = None
+
+
+sandbox_pool = SandboxPool()
+atexit.register(sandbox_pool.close)
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messages_code', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='messagescode',
+            index=models.Index(fields=['user', 'id'], name='messages_co_user_id_d341b0_idx'),
+        ),
+    ]
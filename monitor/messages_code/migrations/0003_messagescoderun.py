@@ -0,0 +1,39 @@
+# Generated by Django 4.2.23 on 2026-10-18 17:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('messages_code', '0002_messagescode_user_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessagesCodeRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('running', 'Выполняется'), ('succeeded', 'Выполнена'), ('failed', 'Ошибка')], default='queued', max_length=16, verbose_name='Статус')),
+                ('context', models.JSONField(blank=True, default=dict, verbose_name='Параметры запуска')),
+                ('output', models.TextField(blank=True, verbose_name='Вывод')),
+                ('truncated', models.BooleanField(default=False, verbose_name='Вывод обрезан')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('elapsed', models.FloatField(blank=True, null=True, verbose_name='Время выполнения, с')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Начало')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Окончание')),
+                ('code', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='messages_code.messagescode', verbose_name='Код')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='messages_code_runs', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'запуск кода сообщений',
+                'verbose_name_plural': 'Запуски кода сообщений',
+                'ordering': ('-created_at',),
+                'indexes': [models.Index(fields=['code', '-created_at'], name='messages_co_code_id_597347_idx')],
+            },
+        ),
+    ]
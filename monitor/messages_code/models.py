@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from core.constants import CHOICES_JOB_STATUS, JOB_STATUS_QUEUED
+
 User = get_user_model()
 
 
@@ -20,8 +22,54 @@ class MessagesCode(models.Model):
 
     class Meta:
         ordering = ('id',)
+        indexes = (
+            models.Index(fields=('user', 'id')),
+        )
         verbose_name = 'код сообщений'
         verbose_name_plural = 'Код сообщений'
 
     def __str__(self):
         return f"Code by {self.user.username} ({self.created_at})"
+
+
+class MessagesCodeRun(models.Model):
+    """Один запуск кода сообщений: статус, вывод и параметры запуска"""
+    code = models.ForeignKey(
+        MessagesCode,
+        on_delete=models.CASCADE,
+        related_name='runs',
+        verbose_name='Код'
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='messages_code_runs',
+        verbose_name='Пользователь'
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=CHOICES_JOB_STATUS,
+        default=JOB_STATUS_QUEUED,
+        verbose_name='Статус'
+    )
+    context = models.JSONField(default=dict, blank=True, verbose_name='Параметры запуска')
+    output = models.TextField(blank=True, verbose_name='Вывод')
+    truncated = models.BooleanField(default=False, verbose_name='Вывод обрезан')
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    elapsed = models.FloatField(null=True, blank=True, verbose_name='Время выполнения, с')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Начало')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Окончание')
+
+    class Meta:
+        ordering = ('-created_at',)
+        indexes = (
+            models.Index(fields=('code', '-created_at')),
+        )
+        verbose_name = 'запуск кода сообщений'
+        verbose_name_plural = 'Запуски кода сообщений'
+
+    def __str__(self):
+        return f'{self.code.name} #{self.pk} ({self.get_status_display()})'
@@ -0,0 +1,294 @@
+"""Публикация пачек сообщений в RabbitMQ для 10messages-кодов и API.
+
+Соединения с брокером хранятся в пуле по хосту и переиспользуются: в
+процессе API - между публикациями, в процессе пула исполнителей - в
+пределах одного запуска (процесс после него заменяется); сообщения уходят пачками с подтверждениями брокера, скорость
+(сообщений в секунду) и число параллельных соединений ограничиваются.
+Бэкенд local - заглушка брокера без сети для разработки и проверки.
+
+Модуль без Django: используется и в процессах пула исполнителей, и в API.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from messages_code.amqp import AMQPError, Connection
+
+logger = logging.getLogger(__name__)
+
+BACKEND_AMQP = 'amqp'
+BACKEND_LOCAL = 'local'
+
+CONTENT_TYPE_JSON = 'application/json'
+LOCAL_KEEP_MESSAGES = 1000
+
+_publishers = {}
+_publishers_lock = threading.Lock()
+
+
+class PublishError(Exception):
+    """Не удалось подключиться к брокеру или опубликовать пачку"""
+
+
+class LocalConnection:
+    """Заглушка брокера: подтверждает всё и помнит последние сообщения"""
+
+    messages = deque(maxlen=LOCAL_KEEP_MESSAGES)
+    counts = {}
+    _lock = threading.Lock()
+
+    def __init__(self, host, **kwargs):
+        self.host = host
+
+    def publish_batch(self, exchange, routing_key, bodies, content_type=None, persistent=True):
+        key = (self.host, exchange, routing_key)
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + len(bodies)
+            self.messages.extend((key, body) for body in bodies)
+        return len(bodies), 0
+
+    def close(self):
+        pass
+
+
+class RateLimiter:
+    """Ведро токенов на rate сообщений в секунду, общее для всех потоков"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def acquire(self, count):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + count / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+class ConnectionPool:
+    """Соединения с одним брокером: не больше max_size одновременно"""
+
+    def __init__(self, connect, max_size, idle_timeout):
+        self.connect = connect
+        self.idle_timeout = idle_timeout
+        self._idle = deque()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+
+    def acquire(self, fresh=False):
+        """(соединение, взято ли оно из простаивающих); fresh - только новое"""
+        self._slots.acquire()
+        with self._lock:
+            while self._idle and not fresh:
+                conn, released_at = self._idle.pop()
+                if time.monotonic() - released_at < self.idle_timeout:
+                    return conn, True
+                conn.close()
+        try:
+            return self.connect(), False
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        if broken:
+            conn.close()
+        else:
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+        self._slots.release()
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop()[0].close()
+
+
+def encode_message(message):
+    """bytes и str отправляются как есть, остальное - JSON"""
+    if isinstance(message, bytes):
+        return message, None
+    if isinstance(message, str):
+        return message.encode('utf-8'), None
+    return json.dumps(message, ensure_ascii=False).encode('utf-8'), CONTENT_TYPE_JSON
+
+
+def _batches(messages, size):
+    """Пачки (тип содержимого, тела) из итератора сообщений"""
+    batch = []
+    batch_type = None
+    for message in messages:
+        body, content_type = encode_message(message)
+        if batch and (content_type != batch_type or len(batch) >= size):
+            yield batch_type, batch
+            batch = []
+        batch_type = content_type
+        batch.append(body)
+    if batch:
+        yield batch_type, batch
+
+
+class Publisher:
+    """Пулы соединений по хосту и публикация пачками.
+
+    config - словарь из настроек MESSAGES_CODE_RABBIT_* (см. executor.broker_config).
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, host):
+        with self._lock:
+            pool = self._pools.get(host)
+            if pool is None:
+                if self.config['backend'] == BACKEND_LOCAL:
+                    connect = lambda: LocalConnection(host)  # noqa: E731
+                else:
+                    connect = lambda: Connection(  # noqa: E731
+                        host,
+                        port=self.config['port'],
+                        user=self.config['user'],
+                        password=self.config['password'],
+                        vhost=self.config['vhost'],
+                        timeout=self.config['timeout'],
+                    )
+                pool = self._pools[host] = ConnectionPool(
+                    connect, self.config['max_connections'], self.config['idle_timeout']
+                )
+            return pool
+
+    def publish(self, host, messages, routing_key, exchange='', batch_size=None, rate=None,
+                concurrency=None, persistent=True):
+        """Публикует сообщения (любой итератор) и ждёт подтверждений брокера.
+
+        concurrency > 1 публикует пачки через несколько соединений
+        параллельно - порядок сообщений между пачками тогда не сохраняется.
+        Возвращает словарь со счётчиками и временем.
+        """
+        batch_size = batch_size or self.config['batch_size']
+        rate = self.config['rate'] if rate is None else rate
+        concurrency = min(concurrency or self.config['concurrency'], self.config['max_connections'])
+        pool = self._pool(host)
+        limiter = RateLimiter(rate)
+        stats = {'published': 0, 'confirmed': 0, 'nacked': 0}
+        stats_lock = threading.Lock()
+        started = time.monotonic()
+
+        def send(content_type, bodies):
+            limiter.acquire(len(bodies))
+            fresh = False
+            while True:
+                try:
+                    conn, reused = pool.acquire(fresh)
+                except (AMQPError, OSError) as e:
+                    raise PublishError(f'{host}: {e}') from e
+                settled = getattr(conn, 'settled', 0)
+                broken = True
+                try:
+                    confirmed, nacked = conn.publish_batch(
+                        exchange, routing_key, bodies, content_type=content_type, persistent=persistent
+                    )
+                    broken = False
+                    break
+                except (AMQPError, OSError) as e:
+                    # Простаивавшее соединение мог закрыть брокер: если на пачку не пришло
+                    # ни одного подтверждения, один раз повторяем её на новом соединении
+                    if reused and not fresh and getattr(conn, 'settled', 0) == settled:
+                        logger.info('publisher: pooled connection to %s failed (%s), retrying', host, e)
+                        fresh = True
+                        continue
+                    raise PublishError(f'{host}: {e}') from e
+                finally:
+                    pool.release(conn, broken)
+            with stats_lock:
+                stats['published'] += len(bodies)
+                stats['confirmed'] += confirmed
+                stats['nacked'] += nacked
+
+        batches = _batches(messages, batch_size)
+        if concurrency <= 1:
+            for content_type, bodies in batches:
+                send(content_type, bodies)
+        else:
+            # Очередь ограничена, чтобы не читать весь итератор в память
+            work = queue.Queue(maxsize=concurrency * 2)
+            errors = []
+
+            def worker():
+                while True:
+                    item = work.get()
+                    if item is None:
+                        return
+                    if not errors:
+                        try:
+                            send(*item)
+                        except Exception as e:
+                            errors.append(e)
+
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for _ in range(concurrency):
+                    executor.submit(worker)
+                try:
+                    for item in batches:
+                        if errors:
+                            break
+                        work.put(item)
+                finally:
+                    for _ in range(concurrency):
+                        work.put(None)
+            if errors:
+                raise errors[0]
+
+        stats['elapsed'] = round(time.monotonic() - started, 3)
+        logger.info(
+            'publisher: %s messages to %s/%s on %s in %.2fs (%s nacked)',
+            stats['published'], exchange or '(default)', routing_key, host, stats['elapsed'], stats['nacked']
+        )
+        return stats
+
+    def close(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools = {}
+
+
+class ScriptPublisher:
+    """API публикации, доступное скрипту как rabbit: хост берётся из rabbit_host"""
+
+    def __init__(self, publisher, host):
+        self._publisher = publisher
+        self.host = host
+
+    def publish(self, messages, routing_key, exchange='', **kwargs):
+        return self._publisher.publish(kwargs.pop('host', self.host), messages, routing_key, exchange, **kwargs)
+
+
+def get_publisher(config):
+    """Publisher процесса для данной конфигурации - пулы живут, пока жив процесс"""
+    key = tuple(sorted(config.items()))
+    with _publishers_lock:
+        publisher = _publishers.get(key)
+        if publisher is None:
+            publisher = _publishers[key] = Publisher(config)
+        return publisher
+
+
+def close_publishers():
+    """Закрывает соединения всех Publisher процесса - перед его завершением"""
+    with _publishers_lock:
+        publishers = list(_publishers.values())
+        _publishers.clear()
+    for publisher in publishers:
+        publisher.close()
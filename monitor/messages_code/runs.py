@@ -0,0 +1,197 @@
+import asyncio
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core.constants import (
+    JOB_STATUS_FAILED,
+    JOB_STATUS_QUEUED,
+    JOB_STATUS_RUNNING,
+    JOB_STATUS_SUCCEEDED,
+)
+from messages_code.executor import SandboxBusy, sandbox_pool
+from messages_code.models import MessagesCode, MessagesCodeRun
+
+logger = logging.getLogger(__name__)
+
+# Вывод в БД сохраняется не чаще, чем раз в столько секунд: по нему
+# догоняют подписчики, подключившиеся посреди запуска
+RUN_SAVE_INTERVAL = 2
+RUN_CANCELLED = 'Выполнение отменено'
+
+run_executor = ThreadPoolExecutor(
+    max_workers=settings.MESSAGES_CODE_WORKERS,
+    thread_name_prefix='messages-code-run'
+)
+
+
+def run_group_name(run_id):
+    return f'messages_code_run_{run_id}'
+
+
+def run_event(run_id, frame):
+    return {
+        'type': 'code.run',
+        'text': json.dumps({**frame, 'run_id': run_id}, ensure_ascii=False),
+    }
+
+
+def run_snapshot(run):
+    return {
+        'type': 'snapshot',
+        'run_id': run.pk,
+        'status': run.status,
+        'output': run.output,
+        'offset': len(run.output),
+        'error': run.error,
+        'elapsed': run.elapsed,
+    }
+
+
+def _notify(run_id, frame):
+    try:
+        async_to_sync(get_channel_layer().group_send)(run_group_name(run_id), run_event(run_id, frame))
+    except Exception as e:
+        logger.warning('messages_code: notify failed for run %s: %s', run_id, e)
+
+
+class _RunOutput:
+    """Принимает вывод скрипта из пула (он уже собран в пачки) и рассылает
+    подписчикам; в БД дописывает не чаще RUN_SAVE_INTERVAL секунд"""
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.chunks = []
+        self.offset = 0
+        self.last_save = time.monotonic()
+
+    def __call__(self, text):
+        self.chunks.append(text)
+        _notify(self.run_id, {'action': 'run_output', 'offset': self.offset, 'text': text})
+        self.offset += len(text)
+        now = time.monotonic()
+        if now - self.last_save >= RUN_SAVE_INTERVAL:
+            MessagesCodeRun.objects.filter(pk=self.run_id).update(output=''.join(self.chunks))
+            self.last_save = now
+
+
+def execute_run(run_id, raise_busy=False):
+    """Выполняет запуск в пуле песочницы и сохраняет результат (блокирует поток).
+
+    Вывод по ходу выполнения уходит в группу запуска; итог пишется и в
+    MessagesCodeRun, и, как раньше, в output/error самого кода. С raise_busy
+    SandboxBusy пробрасывается после того, как запуск помечен ошибкой.
+    Запуск, отменённый в очереди, не выполняется.
+    """
+    try:
+        run = MessagesCodeRun.objects.select_related('code').get(pk=run_id)
+        started = MessagesCodeRun.objects.filter(pk=run_id, status=JOB_STATUS_QUEUED).update(
+            status=JOB_STATUS_RUNNING, started_at=timezone.now()
+        )
+        if not started:
+            return run
+        _notify(run_id, {'action': 'run_started', 'status': JOB_STATUS_RUNNING})
+
+        output = _RunOutput(run_id)
+        try:
+            result = sandbox_pool.run(run.code.code, run.context, run_id=str(run_id), on_output=output)
+            ok, error, truncated, elapsed = result.ok, result.error, result.truncated, result.elapsed
+            text = result.output or ''.join(output.chunks)
+        except SandboxBusy as e:
+            if raise_busy:
+                MessagesCodeRun.objects.filter(pk=run_id).update(
+                    status=JOB_STATUS_FAILED, error=str(e), finished_at=timezone.now()
+                )
+                raise
+            ok, error, truncated, elapsed, text = False, str(e), False, None, ''
+
+        status = JOB_STATUS_SUCCEEDED if ok else JOB_STATUS_FAILED
+        MessagesCodeRun.objects.filter(pk=run_id).update(
+            status=status,
+            output=text,
+            truncated=truncated,
+            error=error or '',
+            elapsed=elapsed,
+            finished_at=timezone.now(),
+        )
+        if ok:
+            code_output, code_error = text or 'Код выполнен успешно', None
+        else:
+            code_output, code_error = text or None, f'Ошибка выполнения: {error}'
+        MessagesCode.objects.filter(pk=run.code_id).update(
+            output=code_output, error=code_error, updated_at=timezone.now()
+        )
+        _notify(run_id, {
+            'action': 'run_completed' if ok else 'run_failed',
+            'status': status,
+            'error': error,
+            'truncated': truncated,
+            'elapsed': elapsed,
+        })
+        prune_runs(run.code_id)
+        return MessagesCodeRun.objects.get(pk=run_id)
+    except SandboxBusy:
+        raise
+    except Exception as e:
+        logger.exception('messages_code: run %s crashed: %s', run_id, e)
+        MessagesCodeRun.objects.filter(pk=run_id).update(
+            status=JOB_STATUS_FAILED, error=str(e), finished_at=timezone.now()
+        )
+        _notify(run_id, {'action': 'run_failed', 'status': JOB_STATUS_FAILED, 'error': str(e)})
+        raise
+
+
+def _execute_in_thread(run_id, raise_busy=False):
+    # Соединения с БД в потоках пула Django сам не закрывает
+    close_old_connections()
+    try:
+        return execute_run(run_id, raise_busy)
+    finally:
+        close_old_connections()
+
+
+async def aexecute_run(run_id):
+    """execute_run в run_executor: ожидание не занимает поток, SandboxBusy пробрасывается"""
+    return await asyncio.wrap_future(run_executor.submit(_execute_in_thread, run_id, True))
+
+
+def start_run(code_obj, context, user=None):
+    """Создаёт запуск и ставит его в пул потоков; возвращается сразу"""
+    run = MessagesCodeRun.objects.create(
+        code=code_obj,
+        user=user if user is not None and user.is_authenticated else None,
+        context=context,
+    )
+    # Результат future никто не ждёт: ошибка уже записана в запуск и в лог
+    run_executor.submit(_execute_in_thread, run.pk)
+    return run
+
+
+def cancel_run(run):
+    """Отменяет запуск; False, если он уже завершён или выполняется в другом процессе.
+
+    Запуск в очереди помечается отменённым и execute_run его пропустит,
+    у выполняющегося убивается процесс песочницы - run() вернёт ошибку.
+    """
+    cancelled = MessagesCodeRun.objects.filter(pk=run.pk, status=JOB_STATUS_QUEUED).update(
+        status=JOB_STATUS_FAILED, error=RUN_CANCELLED, finished_at=timezone.now()
+    )
+    if cancelled:
+        _notify(run.pk, {'action': 'run_failed', 'status': JOB_STATUS_FAILED, 'error': RUN_CANCELLED})
+        return True
+    return sandbox_pool.cancel(str(run.pk))
+
+
+def prune_runs(code_id):
+    """Оставляет в истории последние MESSAGES_CODE_RUN_HISTORY запусков кода"""
+    keep = MessagesCodeRun.objects.filter(code_id=code_id).values_list('pk', flat=True)[
+        :settings.MESSAGES_CODE_RUN_HISTORY
+    ]
+    MessagesCodeRun.objects.filter(code_id=code_id).exclude(pk__in=list(keep)).delete()
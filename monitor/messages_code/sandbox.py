@@ -0,0 +1,221 @@
+"""Дочерний процесс пула MessagesCode.
+
+Модуль импортируется в свежем процессе (spawn) и не трогает Django:
+globals скрипта собираются здесь, потому что модули (json, time) нельзя
+передать через pickle.
+
+У скрипта есть open и __import__, поэтому изолировать запуски внутри
+одного процесса нельзя: импортированные модули, их состояние и потоки
+остались бы следующему скрипту. Гарантия другая - процесс выполняет
+ровно один скрипт, затем пул (executor.SandboxPool) заменяет его свежим.
+"""
+import builtins
+import io
+import json
+import resource
+import signal
+import threading
+import time
+import traceback
+from contextlib import redirect_stdout
+
+from messages_code.artifacts import ArtifactError, ArtifactStore
+from messages_code.code_cache import code_cache
+from messages_code.publisher import PublishError, ScriptPublisher, close_publishers, get_publisher
+
+KIND_INPUT = 'input'
+KIND_OUTPUT = '10messages'
+
+EVENT_OUTPUT = 'output'
+EVENT_RESULT = 'result'
+
+# Вывод уходит родителю раз в STREAM_INTERVAL секунд кусками до STREAM_CHUNK символов
+STREAM_INTERVAL = 0.5
+STREAM_CHUNK = 65536
+
+
+class CPUTimeExceeded(Exception):
+    """Скрипт израсходовал лимит процессорного времени"""
+
+
+def _on_sigxcpu(signum, frame):
+    raise CPUTimeExceeded('Превышен лимит процессорного времени')
+
+
+class _LimitedOutput(io.StringIO):
+    """stdout скрипта: хранит не больше limit символов"""
+
+    def __init__(self, limit):
+        super().__init__()
+        self.limit = limit
+        self.truncated = False
+
+    def write(self, text):
+        left = self.limit - self.tell()
+        if left <= 0:
+            self.truncated = True
+            return len(text)
+        if len(text) > left:
+            self.truncated = True
+        return super().write(text[:left])
+
+    def finish(self):
+        pass
+
+
+class _StreamingOutput(_LimitedOutput):
+    """stdout скрипта, который по ходу выполнения отправляется родителю.
+
+    В pipe пишет отдельный поток: обработчик SIGXCPU выполняется только в
+    главном потоке и не прервёт отправку на середине сообщения.
+    """
+
+    def __init__(self, limit, conn):
+        super().__init__(limit)
+        self.conn = conn
+        self.sent = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._pump, daemon=True)
+        self._thread.start()
+
+    def write(self, text):
+        with self._lock:
+            return super().write(text)
+
+    def _pump(self):
+        while not self._stop.wait(STREAM_INTERVAL):
+            self._send()
+
+    def _send(self):
+        with self._lock:
+            value = self.getvalue()[self.sent:]
+            self.sent += len(value)
+        for start in range(0, len(value), STREAM_CHUNK):
+            self.conn.send({'event': EVENT_OUTPUT, 'text': value[start:start + STREAM_CHUNK]})
+
+    def finish(self):
+        """Останавливает поток и отправляет остаток - до итогового сообщения"""
+        self._stop.set()
+        self._thread.join()
+        self._send()
+
+
+def build_globals(context, artifacts=None, rabbit=None):
+    """Globals скрипта по типу кода - те же, что раньше собирал execute.
+    Если хранилище настроено, добавляется artifacts (см. artifacts.py),
+    10messages-кодам - rabbit для публикации пачками (см. publisher.py).
+    """
+    if context['kind'] == KIND_INPUT:
+        execution_globals = {
+            'template_message': context['template_message'],
+            'code_name': context['code_name'],
+            '__builtins__': {
+                'print': print, 'range': range, 'int': int, 'float': float, 'str': str,
+                'bool': bool, 'globals': globals, 'round': round, 'IOError': IOError, 'open': open,
+                '__import__': __import__,
+            }
+        }
+    else:
+        execution_globals = {
+            'rabbit_host': context['rabbit_host'],
+            'input_file': context['input_file'],
+            'input_artifact': context.get('input_artifact'),
+            'variables': context['variables'],
+            'code_name': context['code_name'],
+            '__builtins__': {
+                'print': print, 'range': range, 'int': int, 'float': float, 'str': str,
+                'bool': bool, 'globals': globals, 'round': round, 'IOError': IOError, 'open': open,
+                '__import__': __import__,
+                'json': json, 'time': time, '__build_class__': builtins.__build_class__,
+                '__name__': '__main__', 'property': property, 'ValueError': ValueError,
+                'FileNotFoundError': FileNotFoundError,
+            }
+        }
+        if rabbit is not None:
+            execution_globals['rabbit'] = ScriptPublisher(get_publisher(rabbit), context['rabbit_host'])
+            execution_globals['__builtins__']['PublishError'] = PublishError
+    if artifacts is not None:
+        execution_globals['artifacts'] = artifacts
+        execution_globals['__builtins__']['ArtifactError'] = ArtifactError
+    return execution_globals
+
+
+def _set_cpu_limit(seconds):
+    """RLIMIT_CPU считает время процесса с запуска, поэтому лимит - от текущего.
+    Меняем только мягкий лимит: жёсткий обратно не поднять.
+    """
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if seconds is None:
+        soft = hard
+    else:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime) + int(seconds) + 1
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def run_task(task, conn=None):
+    """Выполняет один скрипт; возвращает словарь, который можно передать через pipe.
+    Если в задаче stream и передан conn, вывод отправляется по ходу выполнения.
+    """
+    if task.get('stream') and conn is not None:
+        stdout = _StreamingOutput(task['max_output'], conn)
+    else:
+        stdout = _LimitedOutput(task['max_output'])
+    started = time.monotonic()
+    try:
+        artifacts = ArtifactStore.from_config(task.get('artifacts'), task['context'].get('artifact_namespace'))
+        execution_globals = build_globals(task['context'], artifacts, task.get('rabbit'))
+        # Код уже скомпилирован процессом API - воркер только загружает его
+        code = code_cache.get(
+            task['code'], task['context']['code_name'], task.get('code_hash'), task.get('compiled')
+        )
+        _set_cpu_limit(task['cpu_seconds'])
+        try:
+            with redirect_stdout(stdout):
+                exec(code, execution_globals)
+        finally:
+            _set_cpu_limit(None)
+        ok, error = True, None
+    except MemoryError:
+        ok, error = False, 'Превышен лимит памяти'
+    except CPUTimeExceeded as e:
+        ok, error = False, str(e)
+    except BaseException as e:
+        # SystemExit и KeyboardInterrupt из скрипта не должны убить воркер
+        ok, error = False, str(e) or type(e).__name__
+        traceback.print_exc(file=stdout)
+    stdout.finish()
+    return {
+        'event': EVENT_RESULT,
+        'ok': ok,
+        'output': stdout.getvalue(),
+        'truncated': stdout.truncated,
+        'error': error,
+        'elapsed': time.monotonic() - started,
+    }
+
+
+def worker_main(conn, memory_mb):
+    """Цикл воркера: задачи приходят по pipe, None - сигнал завершиться"""
+    # Воркер не должен ловить Ctrl+C вместе с родителем
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGXCPU, _on_sigxcpu)
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    try:
+        while True:
+            try:
+                task = conn.recv()
+            except EOFError:
+                return
+            if task is None:
+                return
+            conn.send(run_task(task, conn))
+    finally:
+        # Брокер должен видеть закрытие соединений, а не обрыв
+        close_publishers()
@@ -1,7 +1,9 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
-from messages_code.models import MessagesCode
+from messages_code.code_cache import code_cache
+from messages_code.models import MessagesCode, MessagesCodeRun
 from users.serializers import UserSerializer
 
 
@@ -15,6 +17,24 @@ class MessagesCodeSerializer(serializers.ModelSerializer):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
     
+    def validate(self, attrs):
+        """Компилируем при сохранении: синтаксическая ошибка видна сразу, а не при запуске.
+
+        Имя файла - имя кода, как при запуске, поэтому скомпилированный здесь
+        код берётся из кэша и отправляется воркерам без повторной компиляции.
+        """
+        code = attrs.get('code')
+        if code is not None:
+            name = attrs.get('name') or self.instance.name
+            try:
+                code_cache.get(code, name)
+            except (SyntaxError, ValueError) as e:
+                line = f" (строка {e.lineno})" if getattr(e, 'lineno', None) else ''
+                raise serializers.ValidationError(
+                    {'code': f"Синтаксическая ошибка{line}: {getattr(e, 'msg', None) or e}"}
+                )
+        return attrs
+
     def validate_variables(self, value):
         """Проверяем, что variables - это словарь"""
         if not isinstance(value, dict):
@@ -29,3 +49,56 @@ class MessagesCodeListSerializer(serializers.ModelSerializer):
         model = MessagesCode
         fields = ['id', 'name', 'user', 'created_at', 'updated_at']
 
+
+class MessagesCodeRunSerializer(serializers.ModelSerializer):
+    user = serializers.SlugRelatedField(slug_field='username', read_only=True)
+    stream = serializers.SerializerMethodField()
+
+    class Meta:
+        model = MessagesCodeRun
+        fields = [
+            'id', 'code', 'user', 'status', 'context', 'output', 'truncated', 'error',
+            'elapsed', 'created_at', 'started_at', 'finished_at', 'stream'
+        ]
+        read_only_fields = fields
+
+    def get_stream(self, obj):
+        return f'/ws/messagecode/runs/{obj.pk}/'
+
+
+class RabbitPublishSerializer(serializers.Serializer):
+    """Публикация через API: список messages, артефакт или count копий template.
+
+    background - публиковать в фоне даже небольшую пачку; rate 0 - без ограничения.
+    """
+    host_id = serializers.IntegerField()
+    routing_key = serializers.CharField(max_length=255)
+    exchange = serializers.CharField(max_length=255, required=False, default='', allow_blank=True)
+    messages = serializers.ListField(child=serializers.JSONField(), required=False)
+    artifact = serializers.CharField(max_length=200, required=False)
+    template = serializers.JSONField(required=False)
+    count = serializers.IntegerField(
+        min_value=1, max_value=settings.MESSAGES_CODE_RABBIT_REST_MAX, required=False
+    )
+    batch_size = serializers.IntegerField(min_value=1, max_value=10000, required=False)
+    rate = serializers.FloatField(min_value=0, required=False)
+    concurrency = serializers.IntegerField(min_value=1, required=False)
+    background = serializers.BooleanField(required=False, default=False)
+
+    def validate_rate(self, value):
+        if 0 < value < settings.MESSAGES_CODE_RABBIT_MIN_RATE:
+            raise serializers.ValidationError(
+                f"Не меньше {settings.MESSAGES_CODE_RABBIT_MIN_RATE} сообщений в секунду (0 - без ограничения)"
+            )
+        return value
+
+    def validate(self, data):
+        sources = [name for name in ('messages', 'artifact', 'template') if name in data]
+        if len(sources) != 1:
+            raise serializers.ValidationError("Нужно ровно одно из: messages, artifact, template")
+        if 'template' in data and 'count' not in data:
+            raise serializers.ValidationError({"count": "Для template нужен count"})
+        limit = settings.MESSAGES_CODE_RABBIT_REST_MAX
+        if len(data.get('messages', ())) > limit or data.get('count', 0) > limit:
+            raise serializers.ValidationError(f"Не больше {limit} сообщений за запрос")
+        return data
@@ -0,0 +1,274 @@
+import struct
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from messages_code import amqp
+from messages_code.amqp import AMQPError, Connection
+from messages_code.executor import SandboxPool
+from messages_code.publisher import Publisher, PublishError
+
+BROKER_FRAME_MAX = 4096
+
+
+def method_frame(channel, method, args=b''):
+    return amqp._method(channel, method, args)
+
+
+def close_args(code, text):
+    return struct.pack('>H', code) + amqp._shortstr(text) + struct.pack('>HH', 60, 40)
+
+
+class FakeBrokerSocket:
+    """Сокет, за которым брокер AMQP: разбирает кадры клиента и копит ответы.
+
+    on_publish(tag) возвращает кадры ответа на полностью принятое сообщение -
+    так тесты задают ack, nack и закрытие канала.
+    """
+
+    def __init__(self, on_publish=None):
+        self.on_publish = on_publish or (lambda tag: method_frame(1, amqp.BASIC_ACK, struct.pack('>QB', tag, 0)))
+        self.sent = bytearray()
+        self.methods = []
+        self.headers = []
+        self.bodies = []
+        self.closed = False
+        self._incoming = bytearray()
+        self._replies = bytearray()
+        self._body_left = 0
+        self._body = b''
+        self._tag = 0
+
+    def setsockopt(self, *args):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def recv(self, size):
+        data = bytes(self._replies[:size])
+        del self._replies[:size]
+        return data
+
+    def sendall(self, data):
+        self.sent.extend(data)
+        if not self.methods and data.startswith(amqp.PROTOCOL_HEADER):
+            self.methods.append('header')
+            data = data[len(amqp.PROTOCOL_HEADER):]
+            self._replies.extend(method_frame(0, amqp.CONNECTION_START, (
+                b'\x00\x09' + amqp._table({}) + amqp._longstr('PLAIN') + amqp._longstr('en_US')
+            )))
+        self._incoming.extend(data)
+        while len(self._incoming) >= 7:
+            frame_type, channel, size = struct.unpack('>BHI', self._incoming[:7])
+            if len(self._incoming) < size + 8:
+                break
+            payload = bytes(self._incoming[7:7 + size])
+            assert self._incoming[7 + size:8 + size] == amqp.FRAME_END
+            del self._incoming[:size + 8]
+            self._handle(frame_type, channel, payload)
+
+    def _handle(self, frame_type, channel, payload):
+        if frame_type == amqp.FRAME_METHOD:
+            method = struct.unpack('>HH', payload[:4])
+            self.methods.append((method, payload[4:]))
+            reply = {
+                amqp.CONNECTION_START_OK: method_frame(
+                    0, amqp.CONNECTION_TUNE, struct.pack('>HIH', 2047, BROKER_FRAME_MAX, 60)
+                ),
+                amqp.CONNECTION_OPEN: method_frame(0, amqp.CONNECTION_OPEN_OK, b'\x00'),
+                amqp.CHANNEL_OPEN: method_frame(channel, amqp.CHANNEL_OPEN_OK, struct.pack('>I', 0)),
+                amqp.CONFIRM_SELECT: method_frame(channel, amqp.CONFIRM_SELECT_OK),
+            }.get(method)
+            if reply:
+                self._replies.extend(reply)
+        elif frame_type == amqp.FRAME_HEADER:
+            self._body_left = struct.unpack('>Q', payload[4:12])[0]
+            self.headers.append(payload)
+            self._body = b''
+        elif frame_type == amqp.FRAME_BODY:
+            assert len(payload) <= BROKER_FRAME_MAX - 8
+            self._body += payload
+            self._body_left -= len(payload)
+            if self._body_left == 0:
+                self._tag += 1
+                self.bodies.append(self._body)
+                self._replies.extend(self.on_publish(self._tag))
+
+    def sent_methods(self):
+        return [entry[0] for entry in self.methods if entry != 'header']
+
+
+def connect(sock):
+    with mock.patch.object(amqp.socket, 'create_connection', return_value=sock):
+        return Connection('broker', user='monitor', password='secret', vhost='/test')
+
+
+class AMQPConnectionTests(SimpleTestCase):
+    def test_handshake(self):
+        sock = FakeBrokerSocket()
+        conn = connect(sock)
+
+        self.assertTrue(sock.sent.startswith(amqp.PROTOCOL_HEADER))
+        self.assertEqual(sock.sent_methods(), [
+            amqp.CONNECTION_START_OK,
+            amqp.CONNECTION_TUNE_OK,
+            amqp.CONNECTION_OPEN,
+            amqp.CHANNEL_OPEN,
+            amqp.CONFIRM_SELECT,
+        ])
+        start_ok = sock.methods[1][1]
+        self.assertIn(b'PLAIN', start_ok)
+        self.assertIn(b'\x00monitor\x00secret', start_ok)
+        # frame_max - меньшее из предложенного брокером и своего, heartbeat выключен
+        self.assertEqual(conn.frame_max, BROKER_FRAME_MAX)
+        self.assertEqual(struct.unpack('>HIH', sock.methods[2][1]), (2047, BROKER_FRAME_MAX, 0))
+        self.assertEqual(sock.methods[3][1][:6], amqp._shortstr('/test'))
+
+    def test_publish_batch_acks(self):
+        sock = FakeBrokerSocket()
+        conn = connect(sock)
+        big = b'x' * (BROKER_FRAME_MAX * 2)
+
+        result = conn.publish_batch('events', 'q', [b'a', big, b'{}'], content_type='application/json')
+
+        self.assertEqual(result, (3, 0))
+        self.assertEqual(sock.bodies, [b'a', big, b'{}'])
+        self.assertEqual(conn.settled, 3)
+        flags = struct.unpack('>H', sock.headers[0][12:14])[0]
+        self.assertEqual(flags, amqp.FLAG_CONTENT_TYPE | amqp.FLAG_DELIVERY_MODE)
+        self.assertEqual(sock.headers[0][14:], amqp._shortstr('application/json') + b'\x02')
+
+    def test_publish_batch_multiple_ack(self):
+        def on_publish(tag):
+            if tag % 2:
+                return b''
+            return method_frame(1, amqp.BASIC_ACK, struct.pack('>QB', tag, 1))
+
+        conn = connect(FakeBrokerSocket(on_publish))
+        self.assertEqual(conn.publish_batch('', 'q', [b'1', b'2', b'3', b'4']), (4, 0))
+
+    def test_publish_batch_nacks(self):
+        def on_publish(tag):
+            method = amqp.BASIC_NACK if tag == 2 else amqp.BASIC_ACK
+            return method_frame(1, method, struct.pack('>QB', tag, 0))
+
+        conn = connect(FakeBrokerSocket(on_publish))
+        self.assertEqual(conn.publish_batch('', 'q', [b'1', b'2', b'3']), (2, 1))
+        # Теги продолжаются со следующей пачкой
+        self.assertEqual(conn.publish_batch('', 'q', [b'4']), (1, 0))
+        self.assertEqual(conn.delivery_tag, 4)
+
+    def test_channel_close_from_broker(self):
+        def on_publish(tag):
+            return method_frame(1, amqp.CHANNEL_CLOSE, close_args(404, "NOT_FOUND - no exchange 'missing'"))
+
+        conn = connect(FakeBrokerSocket(on_publish))
+        with self.assertRaisesRegex(AMQPError, "404 NOT_FOUND - no exchange 'missing'"):
+            conn.publish_batch('missing', 'q', [b'1'])
+
+    def test_connection_close_from_broker(self):
+        def on_publish(tag):
+            return method_frame(0, amqp.CONNECTION_CLOSE, close_args(320, 'CONNECTION_FORCED'))
+
+        sock = FakeBrokerSocket(on_publish)
+        conn = connect(sock)
+        with self.assertRaisesRegex(AMQPError, '320 CONNECTION_FORCED'):
+            conn.publish_batch('', 'q', [b'1'])
+        self.assertTrue(sock.sent.endswith(method_frame(0, amqp.CONNECTION_CLOSE_OK)))
+
+    def test_socket_closed_by_broker(self):
+        conn = connect(FakeBrokerSocket(lambda tag: b''))
+        with self.assertRaisesRegex(AMQPError, 'соединение закрыто'):
+            conn.publish_batch('', 'q', [b'1'])
+
+    def test_failed_handshake_closes_socket(self):
+        sock = FakeBrokerSocket()
+        sock._handle = lambda *args: sock._replies.extend(
+            method_frame(0, amqp.CONNECTION_CLOSE, close_args(403, 'ACCESS_REFUSED'))
+        )
+        with self.assertRaisesRegex(AMQPError, '403 ACCESS_REFUSED'):
+            connect(sock)
+        self.assertTrue(sock.closed)
+
+
+class FakeConnection:
+    def __init__(self, fail=None, settle_before_failure=0):
+        self.fail = fail
+        self.settle_before_failure = settle_before_failure
+        self.settled = 0
+        self.closed = False
+        self.batches = []
+
+    def publish_batch(self, exchange, routing_key, bodies, content_type=None, persistent=True):
+        if self.fail:
+            self.settled += self.settle_before_failure
+            raise self.fail
+        self.batches.append(list(bodies))
+        self.settled += len(bodies)
+        return len(bodies), 0
+
+    def close(self):
+        self.closed = True
+
+
+CONFIG = dict(
+    backend='amqp', port=5672, user='guest', password='guest', vhost='/', timeout=5,
+    batch_size=10, rate=0, concurrency=1, max_connections=2, idle_timeout=300,
+)
+
+
+class PublisherPoolTests(SimpleTestCase):
+    def publish_with(self, connections, messages):
+        publisher = Publisher(CONFIG)
+        with mock.patch('messages_code.publisher.Connection', side_effect=connections):
+            return publisher, publisher.publish('broker', messages, 'q')
+
+    def test_dead_pooled_connection_is_replaced(self):
+        first, fresh = FakeConnection(), FakeConnection()
+        publisher, _ = self.publish_with([first], [b'1'])
+        first.fail = AMQPError('broker: соединение закрыто брокером')
+
+        with mock.patch('messages_code.publisher.Connection', side_effect=[fresh]):
+            stats = publisher.publish('broker', [b'2'], 'q')
+
+        self.assertEqual(stats['confirmed'], 1)
+        self.assertTrue(first.closed)
+        self.assertEqual(fresh.batches, [[b'2']])
+
+    def test_no_retry_after_acks(self):
+        first = FakeConnection()
+        publisher, _ = self.publish_with([first], [b'1'])
+        first.fail = AMQPError('broker: 320 CONNECTION_FORCED')
+        first.settle_before_failure = 1
+
+        with mock.patch('messages_code.publisher.Connection') as connection:
+            with self.assertRaises(PublishError):
+                publisher.publish('broker', [b'2', b'3'], 'q')
+        connection.assert_not_called()
+
+    def test_fresh_connection_failure_is_not_retried(self):
+        broken = FakeConnection(fail=OSError('reset'))
+        with self.assertRaises(PublishError):
+            self.publish_with([broken, FakeConnection()], [b'1'])
+        self.assertTrue(broken.closed)
+
+    def test_connect_error_is_publish_error(self):
+        with self.assertRaisesRegex(PublishError, 'refused'):
+            self.publish_with([ConnectionRefusedError('refused')], [b'1'])
+
+
+class SandboxIsolationTests(SimpleTestCase):
+    CONTEXT = {'kind': '10messages', 'rabbit_host': 'h', 'input_file': 'f', 'variables': {}, 'code_name': 'x'}
+
+    def test_module_state_does_not_leak_between_runs(self):
+        pool = SandboxPool(size=1)
+        self.addCleanup(pool.close)
+
+        first = pool.run('import os\nos.leaked = 1\nprint(os.getpid())', self.CONTEXT)
+        second = pool.run('import os\nprint(os.__dict__.get("leaked"), os.getpid())', self.CONTEXT)
+
+        self.assertTrue(first.ok and second.ok, (first, second))
+        leaked, pid = second.output.split()
+        self.assertEqual(leaked, 'None')
+        self.assertNotEqual(pid, first.output.strip())
@@ -5,9 +5,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'monitor.settings')
 
-from core.routing import get_ws_urlpatterns
+# Приложение Django создаётся до импорта модулей, которым нужны модели
+django_asgi_app = get_asgi_application()
+
+from core.lifespan import LifespanApp  # noqa: E402
+from core.routing import get_ws_urlpatterns  # noqa: E402
+from core.ws_auth import JWTAuthMiddleware  # noqa: E402
 
 application = ProtocolTypeRouter({
-    'http': get_asgi_application(),
-    'websocket': AuthMiddlewareStack(URLRouter(get_ws_urlpatterns()))
+    'http': django_asgi_app,
+    'websocket': AuthMiddlewareStack(JWTAuthMiddleware(URLRouter(get_ws_urlpatterns()))),
+    'lifespan': LifespanApp(),
 })
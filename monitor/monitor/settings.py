@@ -11,7 +11,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.getenv('SECRET_KEY')
 
-DEBUG = os.getenv('DEBUG', False)
+DEBUG = os.getenv('DEBUG', 'False') == 'True'
 
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS').split()
 
@@ -48,6 +48,23 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Сколько запросов к БД может сделать эндпоинт (с учётом аутентификации);
+# превышение - N+1, см. core.query_budget
+QUERY_BUDGETS = {
+    'GET api:backlog-list': 3,
+    'GET api:backlog-detail': 6,
+    'GET api:comments-list': 3,
+    'GET api:messagecode-list': 2,
+    'GET api:messagecode-detail': 2,
+    'GET api:host-list-api': 1,
+    'GET api:host-job-list': 2,
+    'GET api:host-status-history': 2,
+}
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'False') == 'True'
+# Подсчёт запросов на каждом ответе нужен при разработке и в CI, не в проде
+if DEBUG or QUERY_BUDGET_STRICT:
+    MIDDLEWARE.append('core.query_budget.QueryBudgetMiddleware')
+
 ROOT_URLCONF = 'monitor.urls'
 
 TEMPLATES = [
@@ -77,6 +94,85 @@ CHANNEL_LAYERS = {
     },
 }
 
+LOCAL_REDIS_URL = f"redis://{os.getenv('REDIS_LOCAL', '127.0.0.1')}:6379/0"
+
+HOST_POLL_INTERVAL = int(os.getenv('HOST_POLL_INTERVAL', 5))
+HOST_SWEEP_CONCURRENCY = int(os.getenv('HOST_SWEEP_CONCURRENCY', 20))
+HOST_SWEEP_TIMEOUT = int(os.getenv('HOST_SWEEP_TIMEOUT', 15))
+HOST_JOB_CONCURRENCY = int(os.getenv('HOST_JOB_CONCURRENCY', 4))
+HOST_HISTORY_FLUSH_INTERVAL = int(os.getenv('HOST_HISTORY_FLUSH_INTERVAL', 60))
+HOST_HISTORY_RETENTION_DAYS = int(os.getenv('HOST_HISTORY_RETENTION_DAYS', 180))
+HOST_HISTORY_DOWNSAMPLE_AFTER_DAYS = int(os.getenv('HOST_HISTORY_DOWNSAMPLE_AFTER_DAYS', 7))
+HOST_HISTORY_MIN_RUN = int(os.getenv('HOST_HISTORY_MIN_RUN', 300))
+HOST_HISTORY_MAX_RANGE_DAYS = int(os.getenv('HOST_HISTORY_MAX_RANGE_DAYS', 93))
+
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+# Без токена /metrics отдаётся только этим адресам (Prometheus на том же хосте)
+METRICS_ALLOWED_IPS = [
+    ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()
+]
+
+MESSAGES_CODE_WORKERS = int(os.getenv('MESSAGES_CODE_WORKERS', os.cpu_count() or 2))
+MESSAGES_CODE_CPU_SECONDS = int(os.getenv('MESSAGES_CODE_CPU_SECONDS', 60))
+MESSAGES_CODE_WALL_SECONDS = int(os.getenv('MESSAGES_CODE_WALL_SECONDS', 300))
+MESSAGES_CODE_MEMORY_MB = int(os.getenv('MESSAGES_CODE_MEMORY_MB', 512))
+MESSAGES_CODE_MAX_OUTPUT = int(os.getenv('MESSAGES_CODE_MAX_OUTPUT', 1_000_000))
+MESSAGES_CODE_ACQUIRE_TIMEOUT = int(os.getenv('MESSAGES_CODE_ACQUIRE_TIMEOUT', 30))
+MESSAGES_CODE_CACHE_SIZE = int(os.getenv('MESSAGES_CODE_CACHE_SIZE', 256))
+# Сколько последних запусков каждого кода хранить в истории
+MESSAGES_CODE_RUN_HISTORY = int(os.getenv('MESSAGES_CODE_RUN_HISTORY', 50))
+# Хранилище артефактов (пачек сообщений) между input- и 10messages-кодами
+MESSAGES_CODE_ARTIFACT_URL = os.getenv('MESSAGES_CODE_ARTIFACT_URL', LOCAL_REDIS_URL)
+MESSAGES_CODE_ARTIFACT_TTL = int(os.getenv('MESSAGES_CODE_ARTIFACT_TTL', 24 * 60 * 60))
+# Публикация в RabbitMQ; backend local - заглушка брокера без сети
+MESSAGES_CODE_RABBIT_BACKEND = os.getenv('MESSAGES_CODE_RABBIT_BACKEND', 'amqp')
+MESSAGES_CODE_RABBIT_PORT = int(os.getenv('MESSAGES_CODE_RABBIT_PORT', 5672))
+MESSAGES_CODE_RABBIT_USER = os.getenv('MESSAGES_CODE_RABBIT_USER', 'guest')
+MESSAGES_CODE_RABBIT_PASSWORD = os.getenv('MESSAGES_CODE_RABBIT_PASSWORD', 'guest')
+MESSAGES_CODE_RABBIT_VHOST = os.getenv('MESSAGES_CODE_RABBIT_VHOST', '/')
+MESSAGES_CODE_RABBIT_TIMEOUT = float(os.getenv('MESSAGES_CODE_RABBIT_TIMEOUT', 10))
+MESSAGES_CODE_RABBIT_BATCH_SIZE = int(os.getenv('MESSAGES_CODE_RABBIT_BATCH_SIZE', 1000))
+# Сообщений в секунду, 0 - без ограничения
+MESSAGES_CODE_RABBIT_RATE = float(os.getenv('MESSAGES_CODE_RABBIT_RATE', 0))
+MESSAGES_CODE_RABBIT_CONCURRENCY = int(os.getenv('MESSAGES_CODE_RABBIT_CONCURRENCY', 1))
+MESSAGES_CODE_RABBIT_MAX_CONNECTIONS = int(os.getenv('MESSAGES_CODE_RABBIT_MAX_CONNECTIONS', 4))
+MESSAGES_CODE_RABBIT_IDLE_TIMEOUT = int(os.getenv('MESSAGES_CODE_RABBIT_IDLE_TIMEOUT', 300))
+MESSAGES_CODE_RABBIT_REST_MAX = int(os.getenv('MESSAGES_CODE_RABBIT_REST_MAX', 100_000))
+# Ограничения публикации через API: минимальная скорость (если она задана)
+# и расчётное время count / rate; больше SYNC_MAX сообщений или дольше
+# SYNC_SECONDS - в фоне, состояние хранится JOB_TTL секунд
+MESSAGES_CODE_RABBIT_MIN_RATE = float(os.getenv('MESSAGES_CODE_RABBIT_MIN_RATE', 1))
+MESSAGES_CODE_RABBIT_MAX_SECONDS = int(os.getenv('MESSAGES_CODE_RABBIT_MAX_SECONDS', 600))
+MESSAGES_CODE_RABBIT_SYNC_MAX = int(os.getenv('MESSAGES_CODE_RABBIT_SYNC_MAX', 10_000))
+MESSAGES_CODE_RABBIT_SYNC_SECONDS = int(os.getenv('MESSAGES_CODE_RABBIT_SYNC_SECONDS', 10))
+MESSAGES_CODE_RABBIT_JOB_TTL = int(os.getenv('MESSAGES_CODE_RABBIT_JOB_TTL', 24 * 60 * 60))
+
+IDENT_CHECK_WORKERS = int(os.getenv('IDENT_CHECK_WORKERS', 16))
+IDENT_BATCH_MAX = int(os.getenv('IDENT_BATCH_MAX', 100))
+IDENT_CHECK_TIMEOUTS = {
+    'loki': float(os.getenv('IDENT_CHECK_TIMEOUT_LOKI', 15)),
+    'mongo': float(os.getenv('IDENT_CHECK_TIMEOUT_MONGO', 10)),
+    'postgres': float(os.getenv('IDENT_CHECK_TIMEOUT_POSTGRES', 5)),
+    'redis': float(os.getenv('IDENT_CHECK_TIMEOUT_REDIS', 3)),
+}
+LOKI_PAGE_SIZE = int(os.getenv('LOKI_PAGE_SIZE', 500))
+LOKI_WINDOW_HOURS = int(os.getenv('LOKI_WINDOW_HOURS', 6))
+LOKI_SEARCH_MAX_LINES = int(os.getenv('LOKI_SEARCH_MAX_LINES', 5000))
+# Поля документа Mongo в ответе CheckIdent; пусто - документ целиком
+IDENT_MONGO_PROJECTION = [
+    field.strip() for field in os.getenv('IDENT_MONGO_PROJECTION', '').split(',') if field.strip()
+]
+IDENT_MONGO_BATCH_SIZE = int(os.getenv('IDENT_MONGO_BATCH_SIZE', 200))
+IDENT_MONGO_HISTORY_MAX = int(os.getenv('IDENT_MONGO_HISTORY_MAX', 5000))
+IDENT_CACHE_BUCKET = int(os.getenv('IDENT_CACHE_BUCKET', 60))
+IDENT_CACHE_TTLS = {
+    'logs': int(os.getenv('IDENT_CACHE_TTL_LOKI', 30)),
+    'consumer_data': int(os.getenv('IDENT_CACHE_TTL_LOKI', 30)),
+    'mongo_data': int(os.getenv('IDENT_CACHE_TTL_MONGO', 30)),
+    'postgres_data': int(os.getenv('IDENT_CACHE_TTL_POSTGRES', 60)),
+    'redis_data': int(os.getenv('IDENT_CACHE_TTL_REDIS', 5)),
+}
+
 SQLITE_DB = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
@@ -4,9 +4,12 @@ from django.contrib import admin
 from django.views.generic import TemplateView
 from django.urls import include, path, re_path
 
+from api.views import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('api.urls', namespace='api')),
+    path('metrics', metrics, name='metrics'),
     
     # Статика должна обрабатываться ДО catch-all маршрута
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT) \